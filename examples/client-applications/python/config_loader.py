@@ -64,6 +64,16 @@ class VaultConfig:
             'role_id': self._get_with_env_override('database_static', 'role_id')
         }
     
+    def get_cache_config(self) -> Dict[str, Any]:
+        """Return secret cache configuration"""
+        return {
+            'max_entries': self._get_int('cache', 'max_entries', 1024),
+            'max_bytes': self._get_int('cache', 'max_bytes', 1048576),
+            'shards': self._get_int('cache', 'shards', 16),
+            'kv_ttl': self._get_int('cache', 'kv_ttl', 300),
+            'kv_refresh': self.config.get('cache', 'kv_refresh', fallback='version')
+        }
+    
     def get_http_config(self) -> Dict[str, Any]:
         """Return HTTP configuration"""
         return {
@@ -97,8 +107,10 @@ class VaultConfig:
         """Return boolean value"""
         return self.config.getboolean(section, key)
     
-    def _get_int(self, section: str, key: str) -> int:
-        """Return integer value"""
+    def _get_int(self, section: str, key: str, fallback: Optional[int] = None) -> int:
+        """Return integer value (fallback, if given, when the section or key is missing)"""
+        if fallback is not None:
+            return self.config.getint(section, key, fallback=fallback)
         return self.config.getint(section, key)
     
     def get_all_config(self) -> Dict[str, Any]:
@@ -108,6 +120,7 @@ class VaultConfig:
             'kv_secret': self.get_kv_config(),
             'database_dynamic': self.get_database_dynamic_config(),
             'database_static': self.get_database_static_config(),
+            'cache': self.get_cache_config(),
             'http': self.get_http_config()
         }
     
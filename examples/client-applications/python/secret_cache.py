@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Vault Python Client Secret Cache
+Bounded, thread-safe LRU cache with per-entry TTL for secrets read from Vault
+"""
+
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class CacheEntry:
+    """Cached secret with its metadata and expiry"""
+    
+    __slots__ = ('value', 'metadata', 'ttl', 'stored_at', 'expires_at', 'size')
+    
+    def __init__(self, value: Any, metadata: Optional[Dict[str, Any]], ttl: float, size: int):
+        self.value = value
+        self.metadata = metadata
+        self.ttl = ttl
+        self.stored_at = time.monotonic()
+        self.expires_at = self.stored_at + ttl
+        self.size = size
+    
+    def remaining_ttl(self) -> float:
+        """Seconds until the entry expires"""
+        return self.expires_at - time.monotonic()
+
+
+class _Shard:
+    """One stripe of the cache: an LRU ordered dict and the lock guarding it"""
+    
+    def __init__(self, max_entries: int):
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[Hashable, CacheEntry]" = OrderedDict()
+        self.max_entries = max_entries
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+
+class SecretCache:
+    """Secret cache bounded by entry count and bytes, with LRU eviction and per-entry TTL
+    
+    Keys are spread over independently locked shards, so threads reading different
+    secrets do not contend on a single lock. The entry limit is divided evenly between
+    shards (small caches use fewer shards, at least 32 entries each); the byte limit
+    applies to the cache as a whole.
+    """
+    
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 1048576, shards: int = 16):
+        """
+        Initialize secret cache
+        
+        Args:
+            max_entries: Maximum number of cached secrets (0 disables caching)
+            max_bytes: Maximum total size of cached secrets (JSON-encoded), 0 for no limit
+            shards: Number of lock stripes
+        """
+        # Keep enough entries per shard that uneven hashing does not evict hot secrets early
+        shards = max(1, min(shards, max_entries // 32))
+        self._shards = [
+            _Shard(max(1, max_entries // shards) if max_entries > 0 else 0)
+            for _ in range(shards)
+        ]
+        self.max_bytes = max(0, max_bytes)
+        # Total size of all shards; updated with a shard lock held, then this lock
+        self._bytes = 0
+        self._bytes_lock = threading.Lock()
+    
+    def _shard(self, key: Hashable) -> _Shard:
+        return self._shards[hash(key) % len(self._shards)]
+    
+    def get(self, key: Hashable, min_ttl: float = 0, keep_expired: bool = False) -> Optional[CacheEntry]:
+        """
+        Return cached entry
+        
+        Args:
+            key: Cache key, e.g. ('kv', path)
+            min_ttl: Treat entries expiring within this many seconds as missing
+            keep_expired: Leave an expired entry in place (until evicted) so it can be revalidated
+        
+        Returns:
+            Cache entry or None
+        """
+        shard = self._shard(key)
+        with shard.lock:
+            entry = shard.entries.get(key)
+            if entry is None:
+                shard.misses += 1
+                return None
+            remaining = entry.remaining_ttl()
+            if remaining <= 0:
+                if not keep_expired:
+                    self._remove(shard, key)
+                shard.expirations += 1
+                shard.misses += 1
+                return None
+            if remaining <= min_ttl:
+                shard.misses += 1
+                return None
+            shard.entries.move_to_end(key)
+            shard.hits += 1
+            return entry
+    
+    def peek(self, key: Hashable, min_ttl: float = 0, include_expired: bool = False) -> Optional[CacheEntry]:
+        """Return a live entry (or any entry, with include_expired) without counting a hit or miss
+        or refreshing its LRU position"""
+        shard = self._shard(key)
+        with shard.lock:
+            entry = shard.entries.get(key)
+            if entry is None or (not include_expired and entry.remaining_ttl() <= min_ttl):
+                return None
+            return entry
+    
+    def revalidate(self, key: Hashable, ttl: float) -> Optional[CacheEntry]:
+        """
+        Restart the TTL of an entry (expired or not) whose value is known to be current
+        
+        Args:
+            key: Cache key
+            ttl: Seconds the entry stays valid from now
+        
+        Returns:
+            Revalidated entry, or None when it has been evicted
+        """
+        shard = self._shard(key)
+        with shard.lock:
+            entry = shard.entries.get(key)
+            if entry is None:
+                return None
+            entry.ttl = ttl
+            entry.stored_at = time.monotonic()
+            entry.expires_at = entry.stored_at + ttl
+            shard.entries.move_to_end(key)
+            return entry
+    
+    def put(self, key: Hashable, value: Any, ttl: float,
+            metadata: Optional[Dict[str, Any]] = None) -> Optional[CacheEntry]:
+        """
+        Store a secret, evicting least recently used entries beyond the limits
+        
+        Args:
+            key: Cache key
+            value: Secret data
+            ttl: Seconds the entry stays valid (from the Vault response)
+            metadata: Optional metadata kept with the secret (e.g. KV version)
+        
+        Returns:
+            Stored entry, or None when the secret is not cacheable (any entry already
+            cached for the key is removed, so a stale value is never served in its place)
+        """
+        shard = self._shard(key)
+        size = len(json.dumps(value, default=str))
+        if shard.max_entries <= 0 or ttl <= 0 or (self.max_bytes and size > self.max_bytes):
+            self.invalidate(key)
+            return None
+        
+        entry = CacheEntry(value, metadata, ttl, size)
+        with shard.lock:
+            if key in shard.entries:
+                self._remove(shard, key)
+            shard.entries[key] = entry
+            shard.bytes += size
+            self._add_bytes(size)
+            while len(shard.entries) > shard.max_entries:
+                self._remove(shard, next(iter(shard.entries)))
+                shard.evictions += 1
+        if self.max_bytes and self._bytes > self.max_bytes:
+            self._evict_bytes(shard, key)
+        return entry
+    
+    def _evict_bytes(self, first: _Shard, keep: Hashable) -> None:
+        """Evict least recently used entries until the cache fits max_bytes again
+        
+        Starts with the shard just written to, then moves on to the others; one shard
+        lock is held at a time, and the entry just stored is kept.
+        """
+        for shard in [first] + [other for other in self._shards if other is not first]:
+            with shard.lock:
+                while shard.entries and self._bytes > self.max_bytes:
+                    oldest = next(iter(shard.entries))
+                    if oldest == keep:
+                        break
+                    self._remove(shard, oldest)
+                    shard.evictions += 1
+            if self._bytes <= self.max_bytes:
+                return
+    
+    def invalidate(self, key: Hashable) -> None:
+        """Remove a cached secret"""
+        shard = self._shard(key)
+        with shard.lock:
+            if key in shard.entries:
+                self._remove(shard, key)
+    
+    def clear(self) -> None:
+        """Remove all cached secrets"""
+        for shard in self._shards:
+            with shard.lock:
+                shard.entries.clear()
+                self._add_bytes(-shard.bytes)
+                shard.bytes = 0
+    
+    def _add_bytes(self, size: int) -> None:
+        with self._bytes_lock:
+            self._bytes += size
+    
+    def _remove(self, shard: _Shard, key: Hashable) -> None:
+        size = shard.entries.pop(key).size
+        shard.bytes -= size
+        self._add_bytes(-size)
+    
+    def stats(self) -> Dict[str, int]:
+        """Return entry count, size and hit/miss/eviction counters"""
+        stats = {'entries': 0, 'bytes': 0, 'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0}
+        for shard in self._shards:
+            with shard.lock:
+                stats['entries'] += len(shard.entries)
+                stats['bytes'] += shard.bytes
+                stats['hits'] += shard.hits
+                stats['misses'] += shard.misses
+                stats['evictions'] += shard.evictions
+                stats['expirations'] += shard.expirations
+        return stats
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Vault Python Client Single-Flight
+Per-key deduplication of concurrent Vault reads: callers that miss the cache for the
+same key while a read is in flight wait for it and share its result
+"""
+
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class _Call:
+    """In-flight call and its outcome"""
+    
+    __slots__ = ('done', 'result', 'error')
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key (for threads)"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.shared = 0
+    
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """
+        Run fn once for all concurrent callers with the same key
+        
+        Args:
+            key: Deduplication key, e.g. ('kv', path)
+            fn: Function performing the read
+        
+        Returns:
+            Result of fn (exceptions are raised in every waiting caller)
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.shared += 1
+        
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+    
+    def in_flight(self) -> int:
+        """Return the number of keys with a call in flight"""
+        with self._lock:
+            return len(self._calls)
+
+
+class AsyncSingleFlight:
+    """Coalesces concurrent calls for the same key (for asyncio clients)"""
+    
+    def __init__(self):
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+        self.shared = 0
+    
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Await fn once for all concurrent callers with the same key
+        
+        Args:
+            key: Deduplication key
+            fn: Coroutine function performing the read
+        
+        Returns:
+            Result of fn
+        """
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda t: self._clear(key, t))
+        else:
+            self.shared += 1
+        # Shield the shared read so one cancelled caller does not cancel it for the others
+        return await asyncio.shield(task)
+    
+    def _clear(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+    
+    def in_flight(self) -> int:
+        """Return the number of keys with a call in flight"""
+        return len(self._tasks)
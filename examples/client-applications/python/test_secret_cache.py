@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Vault Python Client Secret Cache Tests
+Eviction, size limits and revalidation of SecretCache (run with: python -m pytest)
+"""
+
+import json
+
+from secret_cache import SecretCache
+
+
+def expire(cache: SecretCache, key) -> None:
+    """Move an entry's expiry into the past"""
+    entry = cache.peek(key, include_expired=True)
+    entry.expires_at -= entry.ttl + 1
+
+
+def test_lru_eviction_under_max_entries():
+    # 32 entries fit one shard, so eviction order is a single LRU
+    cache = SecretCache(max_entries=32, max_bytes=0)
+    for i in range(32):
+        cache.put(i, {'v': i}, 60)
+    assert cache.get(0) is not None  # 0 becomes most recently used
+    
+    cache.put(32, {'v': 32}, 60)
+    
+    assert cache.peek(1) is None
+    assert cache.peek(0) is not None
+    assert cache.peek(32) is not None
+    stats = cache.stats()
+    assert stats['entries'] == 32
+    assert stats['evictions'] == 1
+
+
+def test_max_bytes_is_global_across_shards():
+    value = {'v': 'x' * 100}
+    size = len(json.dumps(value))
+    cache = SecretCache(max_entries=1024, max_bytes=size * 10, shards=16)
+    assert len(cache._shards) == 16
+    
+    for i in range(100):
+        cache.put(('kv', i), value, 60)
+        assert cache.stats()['bytes'] <= cache.max_bytes
+    
+    stats = cache.stats()
+    assert stats['entries'] == 10
+    assert stats['bytes'] == size * 10
+    assert stats['evictions'] == 90
+    assert cache.peek(('kv', 99)) is not None
+
+
+def test_put_with_ttl_zero_evicts_existing_entry():
+    cache = SecretCache()
+    cache.put('db', {'username': 'old'}, 60)
+    
+    assert cache.put('db', {'username': 'new'}, 0) is None
+    
+    assert cache.get('db') is None
+    assert cache.stats()['bytes'] == 0
+
+
+def test_put_oversized_value_evicts_existing_entry():
+    cache = SecretCache(max_bytes=100)
+    cache.put('kv', {'password': 'old'}, 60)
+    
+    assert cache.put('kv', {'password': 'x' * 200}, 60) is None
+    
+    assert cache.peek('kv', include_expired=True) is None
+    assert cache.stats()['bytes'] == 0
+
+
+def test_revalidate_restores_expired_entry():
+    cache = SecretCache()
+    cache.put('kv', {'password': 'secret'}, 60, metadata={'version': 3})
+    expire(cache, 'kv')
+    assert cache.get('kv', keep_expired=True) is None
+    
+    entry = cache.revalidate('kv', 120)
+    
+    assert entry is not None
+    assert entry.remaining_ttl() > 60
+    hit = cache.get('kv')
+    assert hit.value == {'password': 'secret'}
+    assert hit.metadata == {'version': 3}
+
+
+def test_revalidate_missing_entry_returns_none():
+    cache = SecretCache()
+    cache.put('kv', {'password': 'secret'}, 60)
+    expire(cache, 'kv')
+    assert cache.get('kv') is None  # without keep_expired the entry is dropped
+    
+    assert cache.revalidate('kv', 120) is None
@@ -28,7 +28,8 @@ class VaultApplication:
         """
         self.config_loader = VaultConfig(config_file)
         self.config = self.config_loader.get_all_config()
-        self.vault_client = VaultClient(self.config['vault'])
+        self.vault_client = VaultClient(self.config['vault'], self.config['cache'])
+        self.vault_client.add_rotation_listener(self._on_credential_rotation)
         
         # Scheduler state
         self.running = False
@@ -67,6 +68,9 @@ class VaultApplication:
             self.logger.error("Vault login failed")
             return False
         
+        # Renew the token in the background so secret reads never wait on it
+        self.vault_client.start_token_manager()
+        
         # Print configuration information
         self._print_startup_info()
         
@@ -89,12 +93,14 @@ class VaultApplication:
         """Stop application"""
         self.logger.info("Stopping application...")
         self.running = False
+        self.vault_client.stop_token_manager()
         
         # Wait for all threads to terminate
         for thread in self.threads:
             if thread.is_alive():
                 thread.join(timeout=5)
         
+        self.logger.info(f"Secret cache stats: {self.vault_client.get_cache_stats()}")
         self.logger.info("Application shutdown complete")
     
     def _print_startup_info(self):
@@ -204,6 +210,13 @@ class VaultApplication:
                 self.logger.error(f"Error refreshing Database Dynamic secret: {e}")
                 time.sleep(5)
     
+    def _on_credential_rotation(self, role_id: str, old_data: Dict[str, Any], new_data: Dict[str, Any]):
+        """Database Dynamic credentials are about to change (old lease stays valid until it expires)"""
+        self.logger.info(
+            f"Database Dynamic credentials for {role_id} rotating: "
+            f"{old_data.get('username')} -> {new_data.get('username')}"
+        )
+    
     def _database_static_scheduler(self):
         """Database Static secret renewal scheduler"""
         while self.running:
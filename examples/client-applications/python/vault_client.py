@@ -7,32 +7,73 @@ Vault client implementation using hvac library
 """
 
 import time
+import random
 import logging
-from typing import Dict, Any, Optional, Tuple
+import threading
+from typing import Dict, Any, Optional, Tuple, List, Callable
 import hvac
 from hvac.exceptions import VaultError
+from secret_cache import SecretCache
+from single_flight import SingleFlight
 
 
 class VaultClient:
     """Vault client class"""
     
-    def __init__(self, config: Dict[str, Any]):
+    # Renew at the 4/5 point of the token TTL, up to 10% of the TTL earlier (jitter)
+    TOKEN_RENEW_FRACTION = 0.8
+    TOKEN_RENEW_JITTER = 0.1
+    # Seconds before expiry at which a token is no longer used
+    TOKEN_EXPIRY_MARGIN = 5
+    # Backoff between failed refresh attempts (seconds)
+    TOKEN_RETRY_MIN = 1
+    TOKEN_RETRY_MAX = 60
+    
+    # Database Dynamic credentials: renew the lease at the 4/5 point of its TTL; mint new
+    # credentials only when the lease cannot be renewed any more and has this many seconds left
+    LEASE_RENEW_FRACTION = 0.8
+    DB_DYNAMIC_MIN_TTL = 10
+    
+    def __init__(self, config: Dict[str, Any], cache_config: Optional[Dict[str, Any]] = None):
         """
         Initialize Vault client
         
         Args:
             config: Vault configuration information
+            cache_config: Secret cache limits (see the [cache] section of config.ini)
         """
         self.config = config
         self.client = None
         self.token = None
         self.token_issued_time = 0
         self.token_ttl = 0
+        self.token_initial_ttl = 0
+        self.token_renewable = False
+        self.token_max_ttl_reached = False
+        
+        # Token lifecycle: logins and renewals are serialized; a background thread renews ahead of expiry
+        self._token_lock = threading.RLock()
+        self._token_stop = threading.Event()
+        self._token_thread = None
+        
+        # Secret cache shared by the scheduler threads, keyed by (secret type, path or role)
+        cache_config = cache_config or {}
+        self.cache = SecretCache(
+            max_entries=cache_config.get('max_entries', 1024),
+            max_bytes=cache_config.get('max_bytes', 1048576),
+            shards=cache_config.get('shards', 16)
+        )
+        self.kv_ttl = cache_config.get('kv_ttl', 300)
+        # 'version': expired KV secrets are revalidated against the metadata's current_version
+        self.kv_refresh = cache_config.get('kv_refresh', 'version')
+        self.kv_revalidations = 0
+        # Cache misses in flight, so concurrent readers of one secret share a single Vault call
+        self.inflight = SingleFlight()
         
-        # Cache storage
-        self.kv_cache = {}
-        self.db_dynamic_cache = {}
-        self.db_static_cache = {}
+        # Called with (role_id, old credentials, new credentials) before rotated credentials are served
+        self.rotation_listeners: List[Callable[[str, Dict[str, Any], Dict[str, Any]], None]] = []
+        self.lease_renewals = 0
+        self.credential_rotations = 0
         
         # Logging configuration
         self.logger = logging.getLogger(__name__)
@@ -54,33 +95,37 @@ class VaultClient:
     
     def login(self) -> bool:
         """
-        Vault login using AppRole
+        Vault login using AppRole (serialized, so concurrent callers never log in twice)
         
         Returns:
             Login success status
         """
-        try:
-            response = self.client.auth.approle.login(
-                role_id=self.config['role_id'],
-                secret_id=self.config['secret_id']
-            )
-            
-            self.token = response['auth']['client_token']
-            self.token_issued_time = time.time()
-            self.token_ttl = response['auth']['lease_duration']
-            
-            # Set token to client
-            self.client.token = self.token
-            
-            self.logger.info(f"Vault login successful (TTL: {self.token_ttl}s)")
-            return True
-            
-        except VaultError as e:
-            self.logger.error(f"Vault login failed: {e}")
-            return False
-        except Exception as e:
-            self.logger.error(f"Error during login: {e}")
-            return False
+        with self._token_lock:
+            try:
+                response = self.client.auth.approle.login(
+                    role_id=self.config['role_id'],
+                    secret_id=self.config['secret_id']
+                )
+                
+                self.token = response['auth']['client_token']
+                self.token_issued_time = time.time()
+                self.token_ttl = response['auth']['lease_duration']
+                self.token_renewable = response['auth'].get('renewable', False)
+                self.token_initial_ttl = self.token_ttl
+                self.token_max_ttl_reached = False
+                
+                # Set token to client
+                self.client.token = self.token
+                
+                self.logger.info(f"Vault login successful (TTL: {self.token_ttl}s)")
+                return True
+                
+            except VaultError as e:
+                self.logger.error(f"Vault login failed: {e}")
+                return False
+            except Exception as e:
+                self.logger.error(f"Error during login: {e}")
+                return False
     
     def renew_token(self) -> bool:
         """
@@ -89,21 +134,25 @@ class VaultClient:
         Returns:
             Renewal success status
         """
-        try:
-            response = self.client.auth.token.renew_self()
-            
-            self.token_issued_time = time.time()
-            self.token_ttl = response['auth']['lease_duration']
-            
-            self.logger.info(f"Token renewal successful (TTL: {self.token_ttl}s)")
-            return True
-            
-        except VaultError as e:
-            self.logger.error(f"Token renewal failed: {e}")
-            return False
-        except Exception as e:
-            self.logger.error(f"Error during token renewal: {e}")
-            return False
+        with self._token_lock:
+            try:
+                response = self.client.auth.token.renew_self()
+                
+                self.token_issued_time = time.time()
+                self.token_ttl = response['auth']['lease_duration']
+                # Vault caps renewals at the token's max TTL; once capped, the next refresh logs in again
+                if self.token_ttl < self.token_initial_ttl:
+                    self.token_max_ttl_reached = True
+                
+                self.logger.info(f"Token renewal successful (TTL: {self.token_ttl}s)")
+                return True
+                
+            except VaultError as e:
+                self.logger.error(f"Token renewal failed: {e}")
+                return False
+            except Exception as e:
+                self.logger.error(f"Error during token renewal: {e}")
+                return False
     
     def is_token_expired(self) -> bool:
         """
@@ -116,23 +165,84 @@ class VaultClient:
             return True
         
         elapsed_time = time.time() - self.token_issued_time
-        # Renew at 4/5 point of TTL
-        return elapsed_time >= (self.token_ttl * 0.8)
+        # Short-lived tokens get a proportionally smaller margin
+        margin = min(self.TOKEN_EXPIRY_MARGIN, self.token_ttl * 0.05)
+        return elapsed_time >= self.token_ttl - margin
     
     def ensure_valid_token(self) -> bool:
         """
         Ensure valid token
         
+        Renewal is left to the token manager thread; reads only log in when the token
+        has actually expired (e.g. the manager is not running or Vault was unreachable).
+        
         Returns:
             Token validity assurance success status
         """
-        if not self.token or self.is_token_expired():
-            return self.login()
+        if not self.is_token_expired():
+            return True
         
-        if self.is_token_expired():
-            return self.renew_token()
+        with self._token_lock:
+            # Another thread may have logged in while this one waited for the lock
+            if not self.is_token_expired():
+                return True
+            return self.login()
+    
+    def refresh_token(self) -> bool:
+        """
+        Renew the token, or log in again when it cannot be renewed
         
-        return True
+        Returns:
+            Whether a valid token is held afterwards
+        """
+        with self._token_lock:
+            if self.token and self.token_renewable and not self.token_max_ttl_reached and not self.is_token_expired():
+                if self.renew_token():
+                    return True
+                self.logger.warning("Token renewal failed, logging in again")
+            return self.login()
+    
+    def _next_refresh_delay(self) -> float:
+        """Seconds until the token should be refreshed: the 4/5 point of its TTL, minus jitter"""
+        if not self.token or self.token_ttl <= 0:
+            return 0
+        # Jitter spreads the renewals of many clients started at the same time
+        jitter = random.uniform(0, self.TOKEN_RENEW_JITTER * self.token_ttl)
+        refresh_at = self.token_issued_time + self.token_ttl * self.TOKEN_RENEW_FRACTION - jitter
+        return max(0, refresh_at - time.time())
+    
+    def start_token_manager(self):
+        """Start the background thread that renews the token ahead of expiry"""
+        if self._token_thread is not None and self._token_thread.is_alive():
+            return
+        self._token_stop.clear()
+        self._token_thread = threading.Thread(
+            target=self._token_manager_loop,
+            name="Token-Manager"
+        )
+        self._token_thread.daemon = True
+        self._token_thread.start()
+        self.logger.info("✅ Token manager started")
+    
+    def stop_token_manager(self):
+        """Stop the token manager thread"""
+        self._token_stop.set()
+        if self._token_thread is not None and self._token_thread.is_alive():
+            self._token_thread.join(timeout=5)
+        self._token_thread = None
+    
+    def _token_manager_loop(self):
+        """Token manager: refresh at the renewal point, retrying with backoff on failure"""
+        retry_delay = self.TOKEN_RETRY_MIN
+        delay = self._next_refresh_delay()
+        while not self._token_stop.wait(delay):
+            if self.refresh_token():
+                retry_delay = self.TOKEN_RETRY_MIN
+                delay = self._next_refresh_delay()
+            else:
+                delay = retry_delay
+                retry_delay = min(retry_delay * 2, self.TOKEN_RETRY_MAX)
+                self.logger.error(f"Token refresh failed, retrying in {delay}s")
     
     def get_kv_secret(self, path: str) -> Optional[Dict[str, Any]]:
         """
@@ -147,16 +257,33 @@ class VaultClient:
         if not self.ensure_valid_token():
             return None
         
+        # Check cache (expired entries are kept for version revalidation)
+        cached = self.cache.get(('kv', path), keep_expired=self.kv_refresh == 'version')
+        if cached is not None:
+            self.logger.debug(f"Using cached KV secret: {path}")
+            return cached.value
+        
+        # Concurrent misses for the same path share one read
+        return self.inflight.do(('kv', path), lambda: self._fetch_kv_secret(path))
+    
+    def _fetch_kv_secret(self, path: str) -> Optional[Dict[str, Any]]:
+        """Read KV v2 secret from Vault and cache it"""
         try:
-            # Check cache
-            if path in self.kv_cache:
-                cached_data = self.kv_cache[path]
-                current_time = time.time()
-                
-                # Check if cache is valid (5 minutes)
-                if current_time - cached_data['timestamp'] < 300:
-                    self.logger.debug(f"Using cached KV secret: {path}")
-                    return cached_data['data']
+            # A read that finished just before this one started may have filled the cache
+            cached = self.cache.peek(('kv', path))
+            if cached is not None:
+                return cached.value
+            
+            # Download the secret again only if a newer version was written
+            if self.kv_refresh == 'version':
+                stale = self.cache.peek(('kv', path), include_expired=True)
+                if stale is not None and stale.metadata:
+                    current_version = self._get_kv_current_version(path)
+                    if current_version is not None and current_version == stale.metadata.get('version'):
+                        self.cache.revalidate(('kv', path), self.kv_ttl)
+                        self.kv_revalidations += 1
+                        self.logger.debug(f"KV secret unchanged (version: {current_version})")
+                        return stale.value
             
             # Get secret from Vault
             response = self.client.secrets.kv.v2.read_secret_version(
@@ -167,12 +294,9 @@ class VaultClient:
             secret_data = response['data']['data']
             metadata = response['data']['metadata']
             
-            # Store in cache
-            self.kv_cache[path] = {
-                'data': secret_data,
-                'metadata': metadata,
-                'timestamp': time.time()
-            }
+            # Store in cache (KV v2 reads have no lease, so the configured TTL applies)
+            ttl = response.get('lease_duration') or self.kv_ttl
+            self.cache.put(('kv', path), secret_data, ttl, metadata)
             
             self.logger.info(f"KV secret fetch successful (version: {metadata['version']})")
             return secret_data
@@ -184,6 +308,26 @@ class VaultClient:
             self.logger.error(f"Error fetching KV secret: {e}")
             return None
     
+    def _get_kv_current_version(self, path: str) -> Optional[int]:
+        """
+        Read the current version of a KV v2 secret from its metadata
+        
+        Args:
+            path: Secret path
+            
+        Returns:
+            Current version, or None when the metadata cannot be read
+        """
+        try:
+            response = self.client.secrets.kv.v2.read_secret_metadata(
+                path=path,
+                mount_point=f"{self.config['entity']}-kv"
+            )
+            return response['data']['current_version']
+        except VaultError as e:
+            self.logger.warning(f"KV metadata read failed, re-reading secret: {e}")
+            return None
+    
     def get_database_dynamic_secret(self, role_id: str) -> Optional[Dict[str, Any]]:
         """
         Get Database Dynamic secret
@@ -197,21 +341,95 @@ class VaultClient:
         if not self.ensure_valid_token():
             return None
         
+        # Check cache (TTL-based, 10 second threshold); leases due for renewal go to Vault
+        cached = self.cache.get(('db_dynamic', role_id), min_ttl=self.DB_DYNAMIC_MIN_TTL)
+        if cached is not None and not self._lease_needs_renewal(cached):
+            remaining_ttl = cached.remaining_ttl()
+            self.logger.debug(f"Using cached Database Dynamic secret (TTL: {int(remaining_ttl)}s)")
+            return {
+                'data': cached.value,
+                'ttl': int(remaining_ttl)
+            }
+        
+        # Concurrent misses for the same role share one credential instead of minting one each
+        return self.inflight.do(('db_dynamic', role_id), lambda: self._fetch_database_dynamic_secret(role_id))
+    
+    def add_rotation_listener(self, listener: Callable[[str, Dict[str, Any], Dict[str, Any]], None]):
+        """
+        Register a callback notified before new Database Dynamic credentials replace the current ones
+        
+        Args:
+            listener: Called with (role_id, old credentials, new credentials); the old lease
+                stays valid until it expires, so consumers can drain connections
+        """
+        self.rotation_listeners.append(listener)
+    
+    @staticmethod
+    def _lease_renewable(entry) -> bool:
+        """Whether a cached lease can still be extended (renewable and not capped by its max TTL)"""
+        metadata = entry.metadata or {}
+        return bool(metadata.get('renewable')) and not metadata.get('max_ttl_reached')
+    
+    def _lease_needs_renewal(self, entry) -> bool:
+        """Whether a cached lease is renewable and past the renewal point of its TTL"""
+        return self._lease_renewable(entry) and entry.remaining_ttl() <= entry.ttl * (1 - self.LEASE_RENEW_FRACTION)
+    
+    def _renew_database_lease(self, role_id: str, entry) -> Optional[Dict[str, Any]]:
+        """
+        Renew the lease of cached Database Dynamic credentials
+        
+        Args:
+            role_id: Database role ID
+            entry: Cache entry holding the credentials and their lease
+        
+        Returns:
+            Renewed secret, or None when new credentials must be generated
+        """
+        metadata = entry.metadata
+        increment = metadata['lease_duration']
+        try:
+            response = self.client.sys.renew_lease(
+                lease_id=metadata['lease_id'],
+                increment=increment
+            )
+        except VaultError as e:
+            self.logger.warning(f"Database lease renewal failed: {e}")
+            return None
+        
+        ttl = response['lease_duration']
+        # Vault caps renewals at the lease's max TTL; a shorter grant means this is the last one
+        metadata = {
+            **metadata,
+            'renewable': response.get('renewable', False),
+            'max_ttl_reached': ttl < increment
+        }
+        if ttl <= self.DB_DYNAMIC_MIN_TTL:
+            return None
+        
+        self.cache.put(('db_dynamic', role_id), entry.value, ttl, metadata)
+        self.lease_renewals += 1
+        
+        self.logger.info(f"Database lease renewal successful (TTL: {ttl}s)")
+        return {
+            'data': entry.value,
+            'ttl': ttl
+        }
+    
+    def _fetch_database_dynamic_secret(self, role_id: str) -> Optional[Dict[str, Any]]:
+        """Renew the lease of the cached Database Dynamic credentials, or generate new ones"""
         try:
-            # Check cache
-            cache_key = f"{role_id}"
-            if cache_key in self.db_dynamic_cache:
-                cached_data = self.db_dynamic_cache[cache_key]
-                current_time = time.time()
-                
-                # TTL-based cache check (10 second threshold)
-                remaining_ttl = cached_data['ttl'] - (current_time - cached_data['timestamp'])
-                if remaining_ttl > 10:
-                    self.logger.debug(f"Using cached Database Dynamic secret (TTL: {int(remaining_ttl)}s)")
+            cached = self.cache.peek(('db_dynamic', role_id))
+            if cached is not None:
+                # Another thread may have renewed the lease already
+                if cached.remaining_ttl() > self.DB_DYNAMIC_MIN_TTL and not self._lease_needs_renewal(cached):
                     return {
-                        'data': cached_data['data'],
-                        'ttl': int(remaining_ttl)
+                        'data': cached.value,
+                        'ttl': int(cached.remaining_ttl())
                     }
+                if self._lease_renewable(cached):
+                    renewed = self._renew_database_lease(role_id, cached)
+                    if renewed is not None:
+                        return renewed
             
             # Get secret from Vault
             response = self.client.secrets.database.generate_credentials(
@@ -222,12 +440,16 @@ class VaultClient:
             secret_data = response['data']
             ttl = response['lease_duration']
             
-            # Store in cache
-            self.db_dynamic_cache[cache_key] = {
-                'data': secret_data,
-                'ttl': ttl,
-                'timestamp': time.time()
-            }
+            if cached is not None:
+                self._notify_rotation(role_id, cached.value, secret_data)
+            
+            # Store in cache for the lease duration, with the lease for later renewals
+            self.cache.put(('db_dynamic', role_id), secret_data, ttl, {
+                'lease_id': response.get('lease_id'),
+                'lease_duration': ttl,
+                'renewable': bool(response.get('renewable') and response.get('lease_id')),
+                'max_ttl_reached': False
+            })
             
             self.logger.info(f"Database Dynamic secret fetch successful (TTL: {ttl}s)")
             return {
@@ -242,6 +464,15 @@ class VaultClient:
             self.logger.error(f"Error fetching Database Dynamic secret: {e}")
             return None
     
+    def _notify_rotation(self, role_id: str, old_data: Dict[str, Any], new_data: Dict[str, Any]):
+        """Tell the rotation listeners that new credentials are about to be served"""
+        self.credential_rotations += 1
+        for listener in self.rotation_listeners:
+            try:
+                listener(role_id, old_data, new_data)
+            except Exception as e:
+                self.logger.error(f"Error in credential rotation listener: {e}")
+    
     def get_database_static_secret(self, role_id: str) -> Optional[Dict[str, Any]]:
         """
         Get Database Static secret
@@ -255,17 +486,28 @@ class VaultClient:
         if not self.ensure_valid_token():
             return None
         
+        # Check cache
+        cached = self.cache.get(('db_static', role_id))
+        if cached is not None:
+            remaining_ttl = cached.remaining_ttl()
+            self.logger.debug(f"Using cached Database Static secret (TTL: {int(remaining_ttl)}s)")
+            return {
+                'data': cached.value,
+                'ttl': int(remaining_ttl)
+            }
+        
+        # Concurrent misses for the same role share one read
+        return self.inflight.do(('db_static', role_id), lambda: self._fetch_database_static_secret(role_id))
+    
+    def _fetch_database_static_secret(self, role_id: str) -> Optional[Dict[str, Any]]:
+        """Read Database Static credentials and cache them"""
         try:
-            # Check cache
-            cache_key = f"{role_id}"
-            if cache_key in self.db_static_cache:
-                cached_data = self.db_static_cache[cache_key]
-                current_time = time.time()
-                
-                # Time-based cache check (5 minutes)
-                if current_time - cached_data['timestamp'] < 300:
-                    self.logger.debug(f"Using cached Database Static secret")
-                    return cached_data['data']
+            cached = self.cache.peek(('db_static', role_id))
+            if cached is not None:
+                return {
+                    'data': cached.value,
+                    'ttl': int(cached.remaining_ttl())
+                }
             
             # Get secret from Vault
             response = self.client.secrets.database.get_static_credentials(
@@ -274,14 +516,11 @@ class VaultClient:
             )
             
             secret_data = response['data']
-            ttl = response.get('ttl', 3600)  # Default TTL 1 hour
+            # Seconds until Vault rotates the password (default 1 hour)
+            ttl = secret_data.get('ttl') or response.get('lease_duration') or 3600
             
-            # Store in cache
-            self.db_static_cache[cache_key] = {
-                'data': secret_data,
-                'ttl': ttl,
-                'timestamp': time.time()
-            }
+            # Store in cache until the next rotation
+            self.cache.put(('db_static', role_id), secret_data, ttl)
             
             self.logger.info(f"Database Static secret fetch successful (TTL: {ttl}s)")
             return {
@@ -296,6 +535,22 @@ class VaultClient:
             self.logger.error(f"Error fetching Database Static secret: {e}")
             return None
     
+    def get_cache_stats(self) -> Dict[str, int]:
+        """
+        Get secret cache statistics
+        
+        Returns:
+            Entry count, size, hit/miss/eviction counters, misses coalesced into another read,
+            unchanged KV secrets revalidated by version, and Database lease renewals / credential rotations
+        """
+        return {
+            **self.cache.stats(),
+            'coalesced': self.inflight.shared,
+            'kv_revalidations': self.kv_revalidations,
+            'lease_renewals': self.lease_renewals,
+            'credential_rotations': self.credential_rotations
+        }
+    
     def get_token_info(self) -> Optional[Dict[str, Any]]:
         """
         Get token information
@@ -108,6 +108,11 @@ path "{{identity.entity.name}}-kv/data/*" {
   capabilities = ["read", "list"]
 }
 
+# KV metadata (current version check before re-reading a secret)
+path "{{identity.entity.name}}-kv/metadata/*" {
+  capabilities = ["read"]
+}
+
 path "{{identity.entity.name}}-database/creds/*" {
   capabilities = ["read", "list", "create", "update"]
 }
@@ -105,6 +105,15 @@ path "database/creds/{{identity.entity.name}}" {
 path "database/roles/{{identity.entity.name}}" {
   capabilities = ["read"]
 }
+
+# Allow users to renew and revoke leases of their own dynamic database credentials
+path "sys/leases/renew/database/creds/{{identity.entity.name}}/*" {
+  capabilities = ["update"]
+}
+
+path "sys/leases/revoke/database/creds/{{identity.entity.name}}/*" {
+  capabilities = ["update"]
+}
 POLICY_EOF
 
 # Copy policy file to vault container and apply
@@ -458,12 +467,16 @@ fi
 echo "Creating JWT role..."
 # user_claim="sub" sets the Entity alias name to JWT's 'sub' claim value
 # Vault will automatically find existing entities with matching alias name and use them
+# VAULT_USER_TOKEN_TYPE=batch issues batch tokens: logins write nothing to Vault's storage and
+# the tokens simply expire (the MCP servers revoke service tokens they no longer need)
+VAULT_USER_TOKEN_TYPE="${VAULT_USER_TOKEN_TYPE:-service}"
 docker exec -e VAULT_TOKEN=root-token vault vault write auth/jwt/role/user \
   role_type="jwt" \
   bound_audiences="mcp-client,account" \
   user_claim="sub" \
   groups_claim="groups" \
   policies="user-secrets" \
+  token_type="$VAULT_USER_TOKEN_TYPE" \
   ttl=1h \
   max_ttl=24h
 
@@ -3,16 +3,45 @@ Github MCP Server using FastMCP
 Handles MCP requests and retrieves credentials from Vault
 """
 import os
+import sys
 import json
+import time
 import base64
+import asyncio
+import gzip
+import hashlib
 import httpx
-from typing import Optional, Tuple
+from typing import Annotated, Any, Dict, Literal, Optional, Tuple
 import logging
+from contextlib import asynccontextmanager
 from contextvars import ContextVar
 from fastmcp import FastMCP
 from fastapi import Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
+
+# Optional fast JSON serializer and brotli compression; both fall back gracefully
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+from pydantic import Field
+
+# Modules shared by the MCP servers: copied next to main.py in the image, ../shared in a checkout
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared"))
+from tool_registry import InvalidParams, ToolRegistry
+from admission import AdmissionController, LimitedTransport, Overloaded
+from metrics import ServerMetrics
+from tracing import inject_trace_headers, server_span, set_status_code, setup_tracing, tracer
+from response_cache import ResponseCache, credential_key
+from entity_cache import MISSING, EntityCache, entity_record
+from token_revoker import TokenRevoker
+from jwt_verifier import JWKSUnavailableError, JWTVerifier
+from jwt import InvalidTokenError
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -24,81 +53,497 @@ user_jwt_context: ContextVar[Optional[str]] = ContextVar("user_jwt", default=Non
 VAULT_ADDR = os.getenv("VAULT_ADDR", "http://localhost:8200")
 MOCK_GITHUB_URL = os.getenv("MOCK_GITHUB_URL", "http://localhost:8002")
 
+# Shared HTTP client settings (one pooled, keep-alive client per upstream)
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "10"))
+HTTP_POOL_TIMEOUT = float(os.getenv("HTTP_POOL_TIMEOUT", "5"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "false").lower() == "true"
+# Concurrent requests per upstream (vault, keycloak, ...); UPSTREAM_MAX_CONCURRENCY_<NAME> overrides it
+UPSTREAM_MAX_CONCURRENCY = int(os.getenv("UPSTREAM_MAX_CONCURRENCY", "32"))
+
+# Admission control: requests in flight overall and per user (JWT sub). Excess requests wait up to
+# ADMISSION_QUEUE_TIMEOUT seconds; they are shed with 429 + Retry-After when that runs out, when
+# ADMISSION_MAX_QUEUE requests are already waiting, or while event loop lag exceeds ADMISSION_MAX_LOOP_LAG
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "64"))
+ADMISSION_MAX_PER_USER = int(os.getenv("ADMISSION_MAX_PER_USER", "8"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "128"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "5"))
+ADMISSION_MAX_LOOP_LAG = float(os.getenv("ADMISSION_MAX_LOOP_LAG", "0.5"))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "1"))
+# Seconds before expiry at which a cached Vault session is considered stale
+VAULT_SESSION_EXPIRY_MARGIN = int(os.getenv("VAULT_SESSION_EXPIRY_MARGIN", "10"))
+# Vault tokens of evicted or replaced sessions are revoked (auth/token/revoke-self) in batches every
+# VAULT_TOKEN_REVOKE_INTERVAL seconds, at least VAULT_TOKEN_REVOKE_GRACE seconds after eviction, and
+# the rest on shutdown. Batch tokens (VAULT_USER_TOKEN_TYPE=batch in init-vault.sh) are skipped.
+VAULT_TOKEN_REVOKE = os.getenv("VAULT_TOKEN_REVOKE", "true").lower() == "true"
+VAULT_TOKEN_REVOKE_INTERVAL = float(os.getenv("VAULT_TOKEN_REVOKE_INTERVAL", "5"))
+VAULT_TOKEN_REVOKE_GRACE = float(os.getenv("VAULT_TOKEN_REVOKE_GRACE", "5"))
+VAULT_TOKEN_REVOKE_CONCURRENCY = int(os.getenv("VAULT_TOKEN_REVOKE_CONCURRENCY", "8"))
+# Identity entity records, shared across users and keyed by name and entity id;
+# names Vault does not know are remembered for ENTITY_CACHE_NEGATIVE_TTL seconds
+ENTITY_CACHE_MAX_SIZE = int(os.getenv("ENTITY_CACHE_MAX_SIZE", "1024"))
+ENTITY_CACHE_TTL = int(os.getenv("ENTITY_CACHE_TTL", "300"))
+ENTITY_CACHE_NEGATIVE_TTL = int(os.getenv("ENTITY_CACHE_NEGATIVE_TTL", "30"))
+# Per-user cache of read-only downstream responses: served as-is for DOWNSTREAM_CACHE_TTL
+# seconds, then revalidated with If-None-Match. 0 entries disables it.
+DOWNSTREAM_CACHE_TTL = float(os.getenv("DOWNSTREAM_CACHE_TTL", "15"))
+DOWNSTREAM_CACHE_MAX_ENTRIES = int(os.getenv("DOWNSTREAM_CACHE_MAX_ENTRIES", "1024"))
+
+# Tool output encoding: "compact" JSON, "pretty" (indented) or "columnar" ({columns, rows} for
+# lists of records). A tools/call can override it with "format" in its params.
+OUTPUT_FORMATS = ("compact", "pretty", "columnar")
+MCP_OUTPUT_FORMAT = os.getenv("MCP_OUTPUT_FORMAT", "compact")
+# /sse responses at least this large are compressed when the client accepts br or gzip
+RESPONSE_COMPRESSION_MIN_SIZE = int(os.getenv("RESPONSE_COMPRESSION_MIN_SIZE", "1024"))
+RESPONSE_GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", "6"))
+RESPONSE_BROTLI_QUALITY = int(os.getenv("RESPONSE_BROTLI_QUALITY", "4"))
+
+# Local JWT verification against the Keycloak realm's JWKS (mirrors Vault's JWT auth config)
+KEYCLOAK_URL = os.getenv("KEYCLOAK_URL", "http://localhost:8080")
+KEYCLOAK_REALM = os.getenv("KEYCLOAK_REALM", "mcp-demo")
+JWT_JWKS_URL = os.getenv("JWT_JWKS_URL", f"{KEYCLOAK_URL}/realms/{KEYCLOAK_REALM}/protocol/openid-connect/certs")
+JWT_AUDIENCES = [a.strip() for a in os.getenv("JWT_AUDIENCES", "mcp-client,account").split(",") if a.strip()]
+# Must match the `iss` claim of tokens issued to the client; empty disables the issuer check
+JWT_ISSUER = os.getenv("JWT_ISSUER", "http://localhost:8080/realms/mcp-demo")
+JWT_LEEWAY = int(os.getenv("JWT_LEEWAY", "30"))
+JWKS_CACHE_TTL = int(os.getenv("JWKS_CACHE_TTL", "3600"))
+JWKS_MIN_REFRESH_INTERVAL = int(os.getenv("JWKS_MIN_REFRESH_INTERVAL", "30"))
+
+# JSON-RPC batches on /sse: maximum entries per batch and how many run at once
+RPC_MAX_BATCH_SIZE = int(os.getenv("RPC_MAX_BATCH_SIZE", "50"))
+RPC_BATCH_CONCURRENCY = int(os.getenv("RPC_BATCH_CONCURRENCY", "8"))
+
+# Context variable holding (JWT, verified claims) for the current request
+jwt_claims_context: ContextVar[Optional[Tuple[str, dict]]] = ContextVar("jwt_claims", default=None)
+# Context variable holding credentials resolved once for a whole JSON-RPC batch
+request_credentials_context: ContextVar[Optional[Any]] = ContextVar("request_credentials", default=None)
+# Context variable holding the output format for the current tool call
+output_format_context: ContextVar[str] = ContextVar("output_format", default=MCP_OUTPUT_FORMAT)
+
 # Initialize FastMCP server
 mcp = FastMCP("Github MCP Server")
 
 
+admission = AdmissionController(
+    max_in_flight=ADMISSION_MAX_IN_FLIGHT,
+    max_per_user=ADMISSION_MAX_PER_USER,
+    max_queue=ADMISSION_MAX_QUEUE,
+    queue_timeout=ADMISSION_QUEUE_TIMEOUT,
+    max_loop_lag=ADMISSION_MAX_LOOP_LAG,
+    retry_after=ADMISSION_RETRY_AFTER,
+    upstream_limit=UPSTREAM_MAX_CONCURRENCY
+)
+# Prometheus metrics served on /metrics
+metrics = ServerMetrics()
+metrics.add_stats_source("admission", admission.stats)
+# OpenTelemetry traces continuing the caller's W3C trace context (exporters: see shared/tracing.py)
+tracer_provider = setup_tracing("github-mcp-server")
+
+# Shared HTTP clients keyed by upstream name, opened and closed with the app lifespan
+_http_clients: Dict[str, httpx.AsyncClient] = {}
+
+
+def create_http_client(upstream: str) -> httpx.AsyncClient:
+    """Create a pooled HTTP client with explicit limits, keep-alive and timeouts
+    
+    Requests hold one of the upstream's admission slots until their response body is closed,
+    and carry the current trace context.
+    """
+    http2 = HTTP2_ENABLED
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("HTTP2_ENABLED is set but the 'h2' package is not installed, using HTTP/1.1")
+            http2 = False
+    limit = os.getenv(f"UPSTREAM_MAX_CONCURRENCY_{upstream.upper()}")
+    if limit:
+        admission.set_upstream_limit(upstream, int(limit))
+    transport = httpx.AsyncHTTPTransport(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+        )
+    )
+    return httpx.AsyncClient(
+        transport=LimitedTransport(transport, admission, upstream),
+        event_hooks={"request": [inject_trace_headers]},
+        timeout=httpx.Timeout(
+            HTTP_READ_TIMEOUT,
+            connect=HTTP_CONNECT_TIMEOUT,
+            pool=HTTP_POOL_TIMEOUT
+        )
+    )
+
+
+def get_http_client(upstream: str) -> httpx.AsyncClient:
+    """Return the shared HTTP client for an upstream, creating it on first use"""
+    client = _http_clients.get(upstream)
+    if client is None or client.is_closed:
+        client = create_http_client(upstream)
+        _http_clients[upstream] = client
+    return client
+
+
+async def close_http_clients() -> None:
+    """Close all shared HTTP clients"""
+    clients = list(_http_clients.values())
+    _http_clients.clear()
+    for client in clients:
+        await client.aclose()
+
+
+def dump_json(obj, pretty: bool = False) -> str:
+    """Serialize to JSON with orjson when it is installed, otherwise the json module"""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if pretty else 0)
+        try:
+            return orjson.dumps(obj, default=str, option=option).decode()
+        except TypeError:
+            # e.g. integers wider than 64 bits; the json module handles those
+            pass
+    if pretty:
+        return json.dumps(obj, indent=2, default=str)
+    return json.dumps(obj, separators=(",", ":"), default=str)
+
+
+def to_columnar(obj):
+    """Turn a list of records with the same keys into {"columns": [...], "rows": [[...], ...]}
+    
+    A dict with a "rows" list (e.g. a page or truncated result) keeps its other fields.
+    Anything else is returned unchanged.
+    """
+    if isinstance(obj, dict) and isinstance(obj.get("rows"), list):
+        columnar = to_columnar(obj["rows"])
+        if isinstance(columnar, dict):
+            return {**columnar, **{key: value for key, value in obj.items() if key != "rows"}}
+        return obj
+    if isinstance(obj, list) and obj and all(isinstance(row, dict) for row in obj):
+        columns = list(obj[0])
+        if all(list(row) == columns for row in obj):
+            return {"columns": columns, "rows": [list(row.values()) for row in obj]}
+    return obj
+
+
+def format_result(result) -> str:
+    """Encode a tool result in the output format selected for the current call"""
+    output_format = output_format_context.get()
+    with metrics.phase("serialization"):
+        if output_format == "columnar":
+            result = to_columnar(result)
+        return dump_json(result, pretty=output_format == "pretty")
+
+
+def encode_response(request: Request, content, status_code: int = 200) -> Response:
+    """JSON response, compressed with br or gzip when the client accepts it and the body is large enough"""
+    return compress_response(request, dump_json(content).encode(), status_code)
+
+
+def compress_response(request: Request, body: bytes, status_code: int = 200,
+                      headers: Optional[Dict[str, str]] = None) -> Response:
+    """Response for an already serialized JSON body, compressed as in encode_response"""
+    headers = {**(headers or {}), "Vary": "Accept-Encoding"}
+    if len(body) >= RESPONSE_COMPRESSION_MIN_SIZE:
+        accepted = {
+            encoding.split(";")[0].strip().lower()
+            for encoding in request.headers.get("Accept-Encoding", "").split(",")
+        }
+        with metrics.phase("compression"):
+            if brotli is not None and "br" in accepted:
+                body = brotli.compress(body, quality=RESPONSE_BROTLI_QUALITY)
+                headers["Content-Encoding"] = "br"
+            elif "gzip" in accepted:
+                body = gzip.compress(body, compresslevel=RESPONSE_GZIP_LEVEL)
+                headers["Content-Encoding"] = "gzip"
+    return Response(content=body, status_code=status_code, media_type="application/json", headers=headers)
+
+
+async def timed(timings: Dict[str, float], step: str, awaitable):
+    """Await and record the elapsed time in milliseconds as timings[step]"""
+    start = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        timings[step] = round((time.perf_counter() - start) * 1000, 2)
+
+
 class VaultClient:
     """Helper class for Vault operations"""
     
     def __init__(self):
         self.vault_addr = VAULT_ADDR
+        # Vault sessions (token + resolved identity) keyed by SHA-256 of the user's JWT
+        self._sessions: Dict[str, dict] = {}
+        # In-flight logins keyed the same way, so concurrent calls for one user share a login
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.session_hits = 0
+        self.session_misses = 0
+        # Entity records by name / entity id, so hot users skip identity/entity/name lookups
+        self.entity_cache = EntityCache(ENTITY_CACHE_MAX_SIZE, ENTITY_CACHE_TTL, ENTITY_CACHE_NEGATIVE_TTL)
+        # Tokens of dropped sessions, revoked in batches in the background
+        self.token_revoker = TokenRevoker(
+            self.vault_addr,
+            lambda: get_http_client("vault"),
+            interval=VAULT_TOKEN_REVOKE_INTERVAL,
+            grace=VAULT_TOKEN_REVOKE_GRACE,
+            concurrency=VAULT_TOKEN_REVOKE_CONCURRENCY,
+            enabled=VAULT_TOKEN_REVOKE
+        )
     
-    async def get_credentials(self, user_jwt: str) -> dict:
-        """Authenticate with Vault using JWT and retrieve user credentials"""
+    @staticmethod
+    def _session_key(user_jwt: str) -> str:
+        return hashlib.sha256(user_jwt.encode()).hexdigest()
+    
+    async def get_session(self, user_jwt: str) -> dict:
+        """Return the cached Vault session for a JWT, logging in only when needed
+        
+        Sessions expire at the earlier of the JWT `exp` claim and the Vault token lease.
+        Concurrent callers for the same JWT wait on a single in-flight login.
+        """
+        key = self._session_key(user_jwt)
+        session = self._sessions.get(key)
+        if session and session["expires_at"] > time.time():
+            self.session_hits += 1
+            return session
+        
+        self.session_misses += 1
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._login(user_jwt, key))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._clear_inflight(key, t))
+        # Shield the shared login so one cancelled caller does not cancel it for the others
+        return await asyncio.shield(task)
+    
+    def session_stats(self) -> dict:
+        return {"entries": len(self._sessions), "hits": self.session_hits, "misses": self.session_misses}
+    
+    def invalidate_session(self, user_jwt: str) -> None:
+        """Drop the cached Vault session for a JWT and queue its token for revocation"""
+        session = self._sessions.pop(self._session_key(user_jwt), None)
+        if session:
+            self._retire_session(session)
+    
+    def _retire_session(self, session: dict) -> None:
+        """Queue a dropped session's Vault token for revocation"""
+        self.token_revoker.schedule(session["vault_token"], session["token_expires_at"], session["token_type"])
+    
+    def _discard_login(self, auth_data: dict) -> None:
+        """Queue the token of a login that did not become a session for revocation"""
+        self.token_revoker.schedule(auth_data["client_token"], token_type=auth_data.get("token_type"))
+    
+    def _clear_inflight(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+    
+    def _evict_expired_sessions(self) -> None:
+        now = time.time()
+        for key in [k for k, s in self._sessions.items() if s["expires_at"] <= now]:
+            self._retire_session(self._sessions.pop(key))
+    
+    async def _login(self, user_jwt: str, key: str) -> dict:
+        """Login to Vault with JWT, resolve the entity and cache the resulting session"""
+        auth_data = await self._jwt_login(user_jwt)
+        headers = {"X-Vault-Token": auth_data["client_token"]}
+        # Entity name is set to username (alice, bob) via pre-created entities, so the
+        # entity can be looked up by the JWT username concurrently with the token lookup
+        entity_name = self._jwt_entity_name(user_jwt)
         try:
-            async with httpx.AsyncClient() as client:
-                # Login to Vault with JWT
-                login_response = await client.post(
-                    f"{self.vault_addr}/v1/auth/jwt/login",
-                    json={"role": "user", "jwt": user_jwt}
-                )
-                login_response.raise_for_status()
-                auth_data = login_response.json()["auth"]
-                vault_token = auth_data["client_token"]
-                
-                # Get entity name from token lookup
-                # Entity name is set to username (alice, bob) via pre-created entities
-                lookup_response = await client.get(
-                    f"{self.vault_addr}/v1/auth/token/lookup-self",
-                    headers={"X-Vault-Token": vault_token}
+            lookup_response, entity_data = await asyncio.gather(
+                self._lookup_self(headers),
+                self._fetch_entity(entity_name, headers)
+            )
+            lookup_response.raise_for_status()
+            return self._store_session(key, user_jwt, auth_data, lookup_response.json()["data"], entity_name, entity_data)
+        except BaseException:
+            self._discard_login(auth_data)
+            raise
+    
+    async def _jwt_login(self, user_jwt: str) -> dict:
+        """auth/jwt/login; returns the `auth` block"""
+        with metrics.phase("vault_login"):
+            login_response = await get_http_client("vault").post(
+                f"{self.vault_addr}/v1/auth/jwt/login",
+                json={"role": "user", "jwt": user_jwt}
+            )
+        login_response.raise_for_status()
+        return login_response.json()["auth"]
+    
+    async def _lookup_self(self, headers: dict) -> httpx.Response:
+        with metrics.phase("vault_token_lookup"):
+            return await get_http_client("vault").get(f"{self.vault_addr}/v1/auth/token/lookup-self", headers=headers)
+    
+    @staticmethod
+    def _jwt_entity_name(user_jwt: str) -> str:
+        _, user_info = extract_user_id_from_jwt(user_jwt)
+        return user_info.get("preferred_username", "unknown")
+    
+    async def _fetch_entity(self, entity_name: str, headers: dict) -> Optional[dict]:
+        """Entity record by name, from the entity cache or Vault; None when unknown or unreadable"""
+        cached = self.entity_cache.get(entity_name)
+        if cached is not MISSING:
+            return cached
+        try:
+            with metrics.phase("vault_entity_lookup"):
+                response = await get_http_client("vault").get(
+                    f"{self.vault_addr}/v1/identity/entity/name/{entity_name}",
+                    headers=headers
                 )
+            if response.status_code == 200:
+                record = entity_record(response.json().get("data") or {})
+                self.entity_cache.put(entity_name, record)
+                return record
+            if response.status_code == 404:
+                self.entity_cache.put(entity_name, None)
+            logger.warning(f"Failed to fetch entity: {response.status_code}")
+        except Exception as e:
+            logger.error(f"Error fetching entity name: {e}")
+        return None
+    
+    def invalidate_entity(self, entity_name: Optional[str] = None, entity_id: Optional[str] = None) -> None:
+        """Drop a cached entity record, e.g. after its policies or aliases were changed in Vault"""
+        self.entity_cache.invalidate(name=entity_name, entity_id=entity_id)
+    
+    def _store_session(self, key: str, user_jwt: str, auth_data: dict, lookup_data: dict,
+                       entity_name: str, entity_data: Optional[dict]) -> dict:
+        """Build the session from the login and lookups and cache it under key"""
+        entity_id = lookup_data.get("entity_id")
+        if entity_data is None and entity_id:
+            # The name lookup failed, but the token's entity may be cached by id
+            cached = self.entity_cache.get_by_id(entity_id)
+            if cached is not MISSING:
+                entity_data = cached
+        if entity_data and entity_id and entity_data.get("id") != entity_id:
+            # The name now belongs to a different entity than the cached record; refetch next time
+            self.invalidate_entity(entity_name, entity_data.get("id"))
+            entity_data = None
+        if entity_data and entity_data.get("name"):
+            entity_name = entity_data["name"]
+            logger.info(f"Verified entity name: {entity_name}")
+        
+        # Cache until the earlier of the JWT expiry and the Vault token lease
+        now = time.time()
+        expiries = []
+        if auth_data.get("lease_duration"):
+            expiries.append(now + auth_data["lease_duration"])
+        jwt_exp = extract_jwt_expiry(user_jwt)
+        if jwt_exp:
+            expiries.append(jwt_exp)
+        expires_at = (min(expiries) if expiries else now) - VAULT_SESSION_EXPIRY_MARGIN
+        
+        session = {
+            "vault_token": auth_data["client_token"],
+            "entity_id": entity_id,
+            "entity_name": entity_name,
+            "policies": lookup_data.get("policies", []),
+            "metadata": lookup_data.get("meta", {}),
+            "aliases": lookup_data.get("aliases", []),
+            "lease_duration": auth_data.get("lease_duration"),
+            "renewable": auth_data.get("renewable", False),
+            "expires_at": expires_at,
+            # The token usually outlives the session, which also ends with the JWT
+            "token_expires_at": now + auth_data["lease_duration"] if auth_data.get("lease_duration") else None,
+            "token_type": auth_data.get("token_type")
+        }
+        self._evict_expired_sessions()
+        previous = self._sessions.get(key)
+        if previous and previous["vault_token"] != session["vault_token"]:
+            # A concurrent login for the same JWT (e.g. /debug/credentials) replaced it
+            self._retire_session(previous)
+        self._sessions[key] = session
+        return session
+    
+    async def trace(self, user_jwt: str, secret_path: str) -> dict:
+        """Resolve the user's session and read secret_path once, timing each step (for /debug/credentials)
+        
+        Reuses a cached session; otherwise logs in once and runs the token lookup, the entity
+        lookup and the read concurrently. `{entity_name}` in secret_path is filled in from the JWT.
+        Returns the session, whether it was cached, the read's response (or exception) and
+        per-step timings in milliseconds.
+        """
+        timings: Dict[str, float] = {}
+        started = time.perf_counter()
+        client = get_http_client("vault")
+        key = self._session_key(user_jwt)
+        session = self._sessions.get(key)
+        session_cached = bool(session and session["expires_at"] > time.time())
+        
+        if session_cached:
+            entity_name = session["entity_name"]
+            secret_response = await timed(timings, "secret_read", client.get(
+                f"{self.vault_addr}/v1/{secret_path.format(entity_name=entity_name)}",
+                headers={"X-Vault-Token": session["vault_token"]}
+            ))
+        else:
+            auth_data = await timed(timings, "vault_login", self._jwt_login(user_jwt))
+            headers = {"X-Vault-Token": auth_data["client_token"]}
+            entity_name = self._jwt_entity_name(user_jwt)
+            lookup_response, entity_data, secret_response = await asyncio.gather(
+                timed(timings, "token_lookup", self._lookup_self(headers)),
+                timed(timings, "entity_lookup", self._fetch_entity(entity_name, headers)),
+                timed(timings, "secret_read", client.get(
+                    f"{self.vault_addr}/v1/{secret_path.format(entity_name=entity_name)}", headers=headers
+                )),
+                return_exceptions=True
+            )
+            if isinstance(lookup_response, BaseException) or lookup_response.is_error:
+                self._discard_login(auth_data)
+                if isinstance(lookup_response, BaseException):
+                    raise lookup_response
                 lookup_response.raise_for_status()
-                lookup_data = lookup_response.json()["data"]
-                
-                # Extract entity name (which is the username for pre-created entities)
-                # First try to get entity_name from JWT (username)
-                entity_id = lookup_data.get("entity_id")
-                entity_name = None
-                
-                # Try to get entity_name from JWT first (username)
-                _, user_info = extract_user_id_from_jwt(user_jwt)
-                entity_name = user_info.get("preferred_username", "unknown")
-                logger.info(f"Using entity name from JWT: {entity_name}")
-                
-                # Fetch entity information using entity name (not entity ID)
-                if entity_name:
-                    try:
-                        entity_response = await client.get(
-                            f"{self.vault_addr}/v1/identity/entity/name/{entity_name}",
-                            headers={"X-Vault-Token": vault_token}
-                        )
-                        if entity_response.status_code == 200:
-                            entity_data = entity_response.json().get("data", {})
-                            # Verify the entity name matches
-                            fetched_name = entity_data.get("name")
-                            if fetched_name:
-                                entity_name = fetched_name
-                                logger.info(f"Verified entity name: {entity_name}")
-                        else:
-                            logger.warning(f"Failed to fetch entity: {entity_response.status_code}")
-                    except Exception as e:
-                        logger.error(f"Error fetching entity name: {e}")
-                        pass
-                
-                # Get user-specific credentials from Vault using entity name (username)
+            session = self._store_session(
+                key, user_jwt, auth_data, lookup_response.json()["data"], entity_name,
+                None if isinstance(entity_data, BaseException) else entity_data
+            )
+            if session["entity_name"] != entity_name:
+                # The entity is named differently from the JWT username; read from its path instead
+                entity_name = session["entity_name"]
+                secret_response = await timed(timings, "secret_read_retry", client.get(
+                    f"{self.vault_addr}/v1/{secret_path.format(entity_name=entity_name)}", headers=headers
+                ))
+        
+        timings["total"] = round((time.perf_counter() - started) * 1000, 2)
+        return {
+            "session": session,
+            "session_cached": session_cached,
+            "secret_response": secret_response,
+            "timings": timings
+        }
+    
+    async def get_credentials(self, user_jwt: str) -> dict:
+        """Authenticate with Vault using JWT and retrieve user credentials"""
+        try:
+            session = await self.get_session(user_jwt)
+            client = get_http_client("vault")
+            # Get user-specific credentials from Vault using entity name (username)
+            with metrics.phase("vault_secret_read"):
                 creds_response = await client.get(
-                    f"{self.vault_addr}/v1/secret/data/users/{entity_name}/github",
-                    headers={"X-Vault-Token": vault_token}
+                    f"{self.vault_addr}/v1/secret/data/users/{session['entity_name']}/github",
+                    headers={"X-Vault-Token": session["vault_token"]}
                 )
-                
-                if creds_response.status_code == 404:
-                    raise ValueError(f"Secret not found at path: secret/data/users/{entity_name}/github")
-                
-                creds_response.raise_for_status()
-                credentials = creds_response.json()["data"]["data"]
-                return credentials
-                
+            if creds_response.status_code == 403:
+                # Cached token was revoked or lost its policies; log in again once
+                self.invalidate_entity(session["entity_name"], session["entity_id"])
+                self.invalidate_session(user_jwt)
+                session = await self.get_session(user_jwt)
+                with metrics.phase("vault_secret_read"):
+                    creds_response = await client.get(
+                        f"{self.vault_addr}/v1/secret/data/users/{session['entity_name']}/github",
+                        headers={"X-Vault-Token": session["vault_token"]}
+                    )
+            
+            entity_name = session["entity_name"]
+            if creds_response.status_code == 404:
+                raise ValueError(f"Secret not found at path: secret/data/users/{entity_name}/github")
+            
+            creds_response.raise_for_status()
+            credentials = creds_response.json()["data"]["data"]
+            return credentials
         except httpx.HTTPStatusError as e:
             if e.response.status_code == 404:
                 # Extract entity name from error context if possible
@@ -118,96 +563,119 @@ class VaultClient:
             logger.error(f"Error getting credentials from Vault: {e}")
             raise
     
+    def start(self) -> None:
+        """Start revoking retired Vault tokens in the background (call from the app lifespan)"""
+        self.token_revoker.start()
+    
+    async def close(self) -> None:
+        """Revoke the Vault tokens of all cached sessions and any still queued (called on shutdown)"""
+        for session in self._sessions.values():
+            self._retire_session(session)
+        self._sessions.clear()
+        await self.token_revoker.stop()
+    
+    @staticmethod
+    def auth_info(session: dict) -> dict:
+        """The session's identity fields as reported by the debug endpoint"""
+        return {
+            "entity_id": session["entity_id"],
+            "entity_name": session["entity_name"],
+            "policies": session["policies"],
+            "metadata": session["metadata"],
+            "aliases": session["aliases"],
+            "lease_duration": session["lease_duration"],
+            "renewable": session["renewable"]
+        }
+    
     async def get_vault_auth_info(self, user_jwt: str) -> Optional[dict]:
         """Get Vault authentication and entity information"""
         try:
-            async with httpx.AsyncClient() as client:
-                # Login to Vault with JWT
-                login_response = await client.post(
-                    f"{self.vault_addr}/v1/auth/jwt/login",
-                    json={"role": "user", "jwt": user_jwt}
-                )
-                login_response.raise_for_status()
-                auth_data = login_response.json()["auth"]
-                vault_token = auth_data["client_token"]
-                
-                # Get token lookup info (includes entity information)
-                lookup_response = await client.get(
-                    f"{self.vault_addr}/v1/auth/token/lookup-self",
-                    headers={"X-Vault-Token": vault_token}
-                )
-                lookup_response.raise_for_status()
-                lookup_data = lookup_response.json()["data"]
-                
-                # Get entity name from JWT (username)
-                entity_id = lookup_data.get("entity_id")
-                entity_name = None
-                
-                # Try to get entity_name from JWT first (username)
-                _, user_info = extract_user_id_from_jwt(user_jwt)
-                entity_name = user_info.get("preferred_username", "unknown")
-                
-                # Fetch entity information using entity name (not entity ID)
-                if entity_name:
-                    try:
-                        entity_response = await client.get(
-                            f"{self.vault_addr}/v1/identity/entity/name/{entity_name}",
-                            headers={"X-Vault-Token": vault_token}
-                        )
-                        if entity_response.status_code == 200:
-                            entity_data = entity_response.json().get("data", {})
-                            # Verify the entity name matches
-                            fetched_name = entity_data.get("name")
-                            if fetched_name:
-                                entity_name = fetched_name
-                    except:
-                        pass
-                
-                return {
-                    "entity_id": entity_id,
-                    "entity_name": entity_name,
-                    "policies": lookup_data.get("policies", []),
-                    "metadata": lookup_data.get("meta", {}),
-                    "aliases": lookup_data.get("aliases", []),
-                    "lease_duration": auth_data.get("lease_duration"),
-                    "renewable": auth_data.get("renewable", False)
-                }
+            return self.auth_info(await self.get_session(user_jwt))
         except Exception as e:
             logger.error(f"Error getting Vault auth info: {e}")
             return None
 
 
 vault_client = VaultClient()
+metrics.add_stats_source("vault_session", vault_client.session_stats)
+metrics.add_stats_source("vault_entity", vault_client.entity_cache.stats)
+response_cache = ResponseCache(DOWNSTREAM_CACHE_TTL, DOWNSTREAM_CACHE_MAX_ENTRIES)
+metrics.add_stats_source("downstream_response", response_cache.stats)
+jwt_verifier = JWTVerifier(
+    JWT_JWKS_URL,
+    audiences=JWT_AUDIENCES,
+    issuer=JWT_ISSUER,
+    leeway=JWT_LEEWAY,
+    cache_ttl=JWKS_CACHE_TTL,
+    min_refresh_interval=JWKS_MIN_REFRESH_INTERVAL,
+    client_factory=lambda: get_http_client("keycloak")
+)
 
 
-def extract_user_id_from_jwt(user_jwt: str) -> Tuple[str, dict]:
-    """Extract user ID and info from JWT token"""
+def decode_jwt_claims(user_jwt: str) -> dict:
+    """Claims of a JWT: the ones verified by auth_middleware for this request, else decoded unverified"""
+    verified = jwt_claims_context.get()
+    if verified is not None and verified[0] == user_jwt:
+        return verified[1]
     try:
         parts = user_jwt.split('.')
         if len(parts) >= 2:
-            payload = json.loads(base64.urlsafe_b64decode(parts[1] + '=='))
-            user_id = payload.get('sub', 'default')
-            user_info = {
-                "sub": user_id,
-                "preferred_username": payload.get('preferred_username', 'unknown'),
-                "email": payload.get('email', 'unknown')
-            }
-            return user_id, user_info
+            return json.loads(base64.urlsafe_b64decode(parts[1] + '=='))
     except:
         pass
+    return {}
+
+
+def extract_user_id_from_jwt(user_jwt: str) -> Tuple[str, dict]:
+    """Extract user ID and info from JWT token"""
+    payload = decode_jwt_claims(user_jwt)
+    if payload:
+        user_id = payload.get('sub', 'default')
+        user_info = {
+            "sub": user_id,
+            "preferred_username": payload.get('preferred_username', 'unknown'),
+            "email": payload.get('email', 'unknown')
+        }
+        return user_id, user_info
     return 'default', {"sub": "default"}
 
 
+def extract_jwt_expiry(user_jwt: str) -> Optional[int]:
+    """Extract the `exp` claim (epoch seconds) from JWT token"""
+    return decode_jwt_claims(user_jwt).get('exp')
+
+
+async def verify_request_jwt(request: Request, user_jwt: str) -> Optional[JSONResponse]:
+    """Verify a bearer JWT locally and record its claims; returns an error response if it is rejected"""
+    try:
+        with metrics.phase("jwt_verify"):
+            claims = await jwt_verifier.verify(user_jwt)
+    except InvalidTokenError as e:
+        return JSONResponse(status_code=401, content={"detail": f"Invalid token: {e}"})
+    except JWKSUnavailableError as e:
+        logger.error(str(e))
+        return JSONResponse(status_code=503, content={"detail": "Unable to verify token: signing keys unavailable"})
+    request.state.jwt_claims = claims
+    jwt_claims_context.set((user_jwt, claims))
+    return None
+
+
 async def get_credentials() -> dict:
     """Get credentials for the current user"""
     user_jwt = user_jwt_context.get()
     if not user_jwt:
         raise ValueError("No JWT token found in context")
+    credentials = request_credentials_context.get()
+    if credentials is not None:
+        return credentials
     return await vault_client.get_credentials(user_jwt)
 
 
-async def call_github_api(method: str, path: str, credentials: dict, **kwargs) -> dict:
-    """Call Github API with credentials"""
+async def call_github_api(method: str, path: str, credentials: dict, cache: bool = False, **kwargs) -> dict:
+    """Call Github API with credentials
+    
+    With cache=True (read-only GETs) the response is served from the per-user response cache.
+    """
     url = f"{MOCK_GITHUB_URL}{path}"
     token = credentials.get("token", "demo-token")
     
@@ -215,36 +683,43 @@ async def call_github_api(method: str, path: str, credentials: dict, **kwargs) -
     headers["Authorization"] = f"Bearer {token}"
     kwargs["headers"] = headers
     
-    async with httpx.AsyncClient() as client:
+    client = get_http_client("github")
+    if cache and method == "GET":
+        async def send(conditional_headers: Dict[str, str]) -> httpx.Response:
+            with metrics.phase("downstream"):
+                return await client.request(method, url, **{**kwargs, "headers": {**headers, **conditional_headers}})
+        return await response_cache.fetch(credential_key(token), path, send)
+    
+    with metrics.phase("downstream"):
         response = await client.request(
             method,
             url,
             **kwargs
         )
-        response.raise_for_status()
-        return response.json()
+    response.raise_for_status()
+    return response.json()
 
 
 # Define tool functions first (before decorator)
 async def _list_repos_impl() -> str:
     """List GitHub repositories."""
     credentials = await get_credentials()
-    result = await call_github_api("GET", "/user/repos", credentials)
-    return json.dumps(result, indent=2)
+    result = await call_github_api("GET", "/user/repos", credentials, cache=True)
+    return format_result(result)
 
 
 async def _get_repo_impl(owner: str, repo: str) -> str:
     """Get a specific repository."""
     credentials = await get_credentials()
-    result = await call_github_api("GET", f"/repos/{owner}/{repo}", credentials)
-    return json.dumps(result, indent=2)
+    result = await call_github_api("GET", f"/repos/{owner}/{repo}", credentials, cache=True)
+    return format_result(result)
 
 
 async def _list_issues_impl(owner: str, repo: str, state: Optional[str] = "open") -> str:
     """List issues in a repository."""
     credentials = await get_credentials()
-    result = await call_github_api("GET", f"/repos/{owner}/{repo}/issues?state={state}", credentials)
-    return json.dumps(result, indent=2)
+    result = await call_github_api("GET", f"/repos/{owner}/{repo}/issues?state={state}", credentials, cache=True)
+    return format_result(result)
 
 
 async def _create_issue_impl(owner: str, repo: str, title: str, body: Optional[str] = None) -> str:
@@ -259,7 +734,9 @@ async def _create_issue_impl(owner: str, repo: str, title: str, body: Optional[s
             "body": body or ""
         }
     )
-    return json.dumps(result, indent=2)
+    # The repository and its issue lists changed for every user who can see them
+    response_cache.invalidate(f"/repos/{owner}/{repo}")
+    return format_result(result)
 
 
 # Register with FastMCP
@@ -270,27 +747,60 @@ async def list_repos() -> str:
 
 
 @mcp.tool()
-async def get_repo(owner: str, repo: str) -> str:
+async def get_repo(
+    owner: Annotated[str, Field(description="Repository owner")],
+    repo: Annotated[str, Field(description="Repository name")]
+) -> str:
     """Get a specific repository."""
     return await _get_repo_impl(owner, repo)
 
 
 @mcp.tool()
-async def list_issues(owner: str, repo: str, state: Optional[str] = "open") -> str:
+async def list_issues(
+    owner: Annotated[str, Field(description="Repository owner")],
+    repo: Annotated[str, Field(description="Repository name")],
+    state: Literal["open", "closed", "all"] = "open"
+) -> str:
     """List issues in a repository."""
     return await _list_issues_impl(owner, repo, state)
 
 
 @mcp.tool()
-async def create_issue(owner: str, repo: str, title: str, body: Optional[str] = None) -> str:
+async def create_issue(
+    owner: Annotated[str, Field(description="Repository owner")],
+    repo: Annotated[str, Field(description="Repository name")],
+    title: Annotated[str, Field(description="Issue title")],
+    body: Annotated[Optional[str], Field(description="Issue body")] = None
+) -> str:
     """Create a new issue."""
     return await _create_issue_impl(owner, repo, title, body)
 
 
+# Index the registered tools for /sse; loaded at startup
+tool_registry = ToolRegistry()
+
+
 # Create FastAPI app for custom endpoints
 from fastapi import FastAPI
 
-app = FastAPI(title="Github MCP Server")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Index tools and open shared upstream HTTP clients on startup; revoke cached Vault tokens and close the clients on shutdown"""
+    await tool_registry.load(mcp)
+    admission.start()
+    vault_client.start()
+    get_http_client("vault")
+    get_http_client("github")
+    yield
+    await vault_client.close()
+    await admission.stop()
+    await close_http_clients()
+    if tracer_provider is not None:
+        tracer_provider.shutdown()
+
+
+app = FastAPI(title="Github MCP Server", lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -302,29 +812,86 @@ app.add_middleware(
 )
 
 
+def overloaded_response(error: Overloaded) -> JSONResponse:
+    """429 for a shed request, in JSON-RPC error form"""
+    return JSONResponse(
+        status_code=429,
+        content={"jsonrpc": "2.0", "id": None, "error": {"code": -32000, "message": str(error)}},
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+
+async def call_admitted(request: Request, call_next):
+    """Run the request under admission control, keyed by the caller's JWT subject"""
+    claims = getattr(request.state, "jwt_claims", None) or {}
+    user_key = claims.get("sub") or (request.client.host if request.client else "anonymous")
+    try:
+        async with admission.admit(user_key):
+            return await call_next(request)
+    except Overloaded as e:
+        return overloaded_response(e)
+
+
 # Add middleware for authentication
 @app.middleware("http")
 async def auth_middleware(request: Request, call_next):
     """Middleware to extract JWT token from Authorization header"""
     # Skip authentication for health and debug endpoints
-    if request.url.path in ["/health", "/debug/credentials"]:
+    if request.url.path in ["/health", "/metrics", "/debug/credentials", "/debug/admission"]:
         # Still extract JWT for debug endpoint, but don't require it for health
         if request.url.path == "/debug/credentials":
             authorization = request.headers.get("Authorization", "")
             if authorization.startswith("Bearer "):
                 user_jwt = authorization.replace("Bearer ", "")
+                rejection = await verify_request_jwt(request, user_jwt)
+                if rejection is not None:
+                    return rejection
                 user_jwt_context.set(user_jwt)
+            return await call_admitted(request, call_next)
         return await call_next(request)
     
     authorization = request.headers.get("Authorization", "")
     if authorization.startswith("Bearer "):
         user_jwt = authorization.replace("Bearer ", "")
+        # Reject bad tokens locally before they cost a Vault login
+        rejection = await verify_request_jwt(request, user_jwt)
+        if rejection is not None:
+            return rejection
         user_jwt_context.set(user_jwt)
     else:
         raise HTTPException(status_code=401, detail="Bearer token required")
     
-    response = await call_next(request)
-    return response
+    return await call_admitted(request, call_next)
+
+
+def route_label(request: Request) -> str:
+    """The request path if it is one of the app's routes, else "other" (bounds label cardinality)"""
+    path = request.url.path
+    return path if any(getattr(r, "path", None) == path for r in app.routes) else "other"
+
+
+# Registered after auth_middleware so it wraps it and also sees rejected requests
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    """Count requests and record their latency per route"""
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        metrics.observe_request(request.method, route_label(request), status_code, time.perf_counter() - start)
+
+
+# Registered last so it is outermost: auth, admission and the handler all run inside the request's span
+@app.middleware("http")
+async def tracing_middleware(request: Request, call_next):
+    """Continue the caller's W3C trace context (traceparent) in a server span for the request"""
+    with server_span(request.method, route_label(request), request.headers) as span:
+        response = await call_next(request)
+        set_status_code(span, response.status_code)
+        return response
 
 
 # Add health endpoint
@@ -333,6 +900,19 @@ async def health():
     return {"status": "healthy", "service": "github-mcp-server"}
 
 
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus metrics: request, tool and per-phase latency histograms, cache and admission counters"""
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+
+@app.get("/debug/admission")
+async def debug_admission():
+    """Admission control counters: in-flight, queued and shed requests, loop lag and upstream slots"""
+    return JSONResponse(content=admission.stats())
+
+
 # Add debug endpoint to get current user's credentials (for debugging)
 @app.get("/debug/credentials")
 async def debug_credentials(request: Request):
@@ -349,9 +929,8 @@ async def debug_credentials(request: Request):
             # Parse JWT details
             jwt_details = {}
             try:
-                parts = user_jwt.split('.')
-                if len(parts) >= 2:
-                    payload = json.loads(base64.urlsafe_b64decode(parts[1] + '=='))
+                payload = decode_jwt_claims(user_jwt)
+                if payload:
                     jwt_details = {
                         "sub": payload.get("sub"),
                         "iss": payload.get("iss"),
@@ -365,61 +944,36 @@ async def debug_credentials(request: Request):
             except:
                 pass
             
-            # Get Vault auth info first (needed for entity_name fallback)
-            vault_auth_info = await vault_client.get_vault_auth_info(user_jwt)
-            
-            # Get credentials with error handling (this will determine the actual entity_name used)
-            entity_name = None
+            # One login (or the cached session); the token lookup, entity lookup and
+            # secret read then run concurrently
+            masked_creds = None
+            secret_exists = False
+            secret_error = None
             try:
-                credentials = await vault_client.get_credentials(user_jwt)
-                secret_exists = True
-                secret_error = None
-                # Mask sensitive data
-                masked_creds = {
-                    "token": "***" + credentials.get("token", "")[-4:] if credentials.get("token") else "",
-                    "username": credentials.get("username", "")
-                }
-                # Extract entity_name from vault_auth_info or JWT
-                if vault_auth_info and vault_auth_info.get("entity_name"):
-                    entity_name = vault_auth_info.get("entity_name")
-                else:
-                    entity_name = user_info.get("preferred_username", user_id)
-            except ValueError as e:
-                if "Secret not found" in str(e):
-                    credentials = None
-                    secret_exists = False
-                    secret_error = "Secret not found"
-                    masked_creds = None
-                    # Extract entity_name from error message
-                    if "secret/data/users/" in str(e):
-                        try:
-                            parts = str(e).split("secret/data/users/")
-                            if len(parts) > 1:
-                                entity_name = parts[1].split("/")[0]
-                        except:
-                            pass
-                    # Fallback to vault_auth_info or JWT username
-                    if not entity_name:
-                        if vault_auth_info and vault_auth_info.get("entity_name"):
-                            entity_name = vault_auth_info.get("entity_name")
-                        else:
-                            entity_name = user_info.get("preferred_username", user_id)
-                else:
-                    raise
+                trace = await vault_client.trace(user_jwt, "secret/data/users/{entity_name}/github")
             except Exception as e:
-                credentials = None
-                secret_exists = False
+                trace = None
+                vault_auth_info = None
                 secret_error = str(e)
-                masked_creds = None
-                # Fallback to vault_auth_info or JWT username
-                if vault_auth_info and vault_auth_info.get("entity_name"):
-                    entity_name = vault_auth_info.get("entity_name")
-                else:
-                    entity_name = user_info.get("preferred_username", user_id)
-            
-            # Final fallback if entity_name is still None
-            if not entity_name:
                 entity_name = user_info.get("preferred_username", user_id)
+            else:
+                vault_auth_info = vault_client.auth_info(trace["session"])
+                entity_name = trace["session"]["entity_name"]
+                secret_response = trace["secret_response"]
+                if isinstance(secret_response, BaseException):
+                    secret_error = str(secret_response)
+                elif secret_response.status_code == 404:
+                    secret_error = "Secret not found"
+                elif secret_response.status_code != 200:
+                    secret_error = f"Vault returned {secret_response.status_code}: {secret_response.text[:200]}"
+                else:
+                    credentials = secret_response.json()["data"]["data"]
+                    secret_exists = True
+                    # Mask sensitive data
+                    masked_creds = {
+                        "token": "***" + credentials.get("token", "")[-4:] if credentials.get("token") else "",
+                        "username": credentials.get("username", "")
+                    }
             
             return JSONResponse(content={
                 "user_id": user_id,
@@ -429,7 +983,9 @@ async def debug_credentials(request: Request):
                 "jwt_details": jwt_details,
                 "vault_auth_info": vault_auth_info,
                 "secret_exists": secret_exists,
-                "secret_error": secret_error
+                "secret_error": secret_error,
+                "vault_session_cached": trace["session_cached"] if trace else False,
+                "timings": trace["timings"] if trace else {}
             })
         except Exception as e:
             logger.error(f"Error getting debug credentials: {e}")
@@ -440,10 +996,34 @@ async def debug_credentials(request: Request):
         raise HTTPException(status_code=401, detail="Bearer token required")
 
 
+async def call_tool(name: str, arguments: Optional[dict]) -> Any:
+    """Dispatch a tools/call through the registry, recording its latency and a span"""
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        with tracer.start_as_current_span(f"tools/call {name}", attributes={"mcp.tool.name": name}):
+            result = await tool_registry.call(name, arguments)
+        outcome = "ok"
+        return result
+    finally:
+        metrics.observe_tool(name, outcome, time.perf_counter() - start)
+
+
+def tools_list_response(request: Request, request_id) -> Response:
+    """tools/list from the registry's pre-serialized result; 304 when the client's ETag still matches"""
+    headers = {"ETag": tool_registry.etag}
+    if tool_registry.etag_matches(request.headers.get("If-None-Match")):
+        return Response(status_code=304, headers=headers)
+    return compress_response(request, tool_registry.list_response_body(request_id), headers=headers)
+
+
 # For backward compatibility, add /sse endpoint
 @app.post("/sse")
 async def sse_endpoint(request: Request):
-    """SSE endpoint for backward compatibility"""
+    """SSE endpoint for backward compatibility
+    
+    Accepts a single JSON-RPC request or a batch (array).
+    """
     # Extract JWT token
     authorization = request.headers.get("Authorization", "")
     if authorization.startswith("Bearer "):
@@ -453,114 +1033,120 @@ async def sse_endpoint(request: Request):
         raise HTTPException(status_code=401, detail="Bearer token required")
     
     body = await request.json()
+    if isinstance(body, list):
+        return await handle_rpc_batch(request, body)
+    content, status_code = await handle_rpc(request, body)
+    if isinstance(content, Response):
+        return content
+    return encode_response(request, content, status_code)
+
+
+async def handle_rpc(request: Request, body: dict, in_batch: bool = False) -> Tuple[Any, int]:
+    """Handle one JSON-RPC request and return (response, HTTP status)
+    
+    The response is a ready Response instead of a dict for a single tools/list.
+    """
     method = body.get("method", "")
     params = body.get("params", {})
     
     # Handle MCP methods by directly calling FastMCP tools
     if method == "tools/list":
-        # Get tools from FastMCP's registered tools
-        tools = [
-            {
-                "name": "list_repos",
-                "description": "List GitHub repositories.",
-                "inputSchema": {
-                    "type": "object",
-                    "properties": {}
-                }
-            },
-            {
-                "name": "get_repo",
-                "description": "Get a specific repository.",
-                "inputSchema": {
-                    "type": "object",
-                    "properties": {
-                        "owner": {"type": "string"},
-                        "repo": {"type": "string"}
-                    },
-                    "required": ["owner", "repo"]
-                }
-            },
-            {
-                "name": "list_issues",
-                "description": "List issues in a repository.",
-                "inputSchema": {
-                    "type": "object",
-                    "properties": {
-                        "owner": {"type": "string"},
-                        "repo": {"type": "string"},
-                        "state": {"type": "string", "enum": ["open", "closed", "all"]}
-                    },
-                    "required": ["owner", "repo"]
-                }
-            },
-            {
-                "name": "create_issue",
-                "description": "Create a new issue.",
-                "inputSchema": {
-                    "type": "object",
-                    "properties": {
-                        "owner": {"type": "string"},
-                        "repo": {"type": "string"},
-                        "title": {"type": "string"},
-                        "body": {"type": "string"}
-                    },
-                    "required": ["owner", "repo", "title"]
-                }
-            }
-        ]
-        return JSONResponse(content={
-            "jsonrpc": "2.0",
-            "id": body.get("id"),
-            "result": {"tools": tools}
-        })
+        if in_batch:
+            return {"jsonrpc": "2.0", "id": body.get("id"), "result": {"tools": tool_registry.tools}}, 200
+        return tools_list_response(request, body.get("id")), 200
     elif method == "tools/call":
         tool_name = params.get("name")
         arguments = params.get("arguments", {})
+
+        # Per-call override of the tool output format
+        output_format = params.get("format")
+        if output_format:
+            if output_format not in OUTPUT_FORMATS:
+                return {
+                    "jsonrpc": "2.0",
+                    "id": body.get("id"),
+                    "error": {"code": -32602, "message": f"Unknown format: {output_format}. Use one of {', '.join(OUTPUT_FORMATS)}"}
+                }, 400
+            output_format_context.set(output_format)
         
         try:
-            # Call the appropriate tool function implementation (not the wrapped FunctionTool)
-            if tool_name == "list_repos":
-                result = await _list_repos_impl()
-            elif tool_name == "get_repo":
-                result = await _get_repo_impl(arguments.get("owner"), arguments.get("repo"))
-            elif tool_name == "list_issues":
-                result = await _list_issues_impl(
-                    arguments.get("owner"),
-                    arguments.get("repo"),
-                    arguments.get("state", "open")
-                )
-            elif tool_name == "create_issue":
-                result = await _create_issue_impl(
-                    arguments.get("owner"),
-                    arguments.get("repo"),
-                    arguments.get("title"),
-                    arguments.get("body")
-                )
+            # O(1) dispatch to the FastMCP-registered tool function
+            if tool_name in tool_registry:
+                result = await call_tool(tool_name, arguments)
             else:
-                return JSONResponse(content={
+                return {
                     "jsonrpc": "2.0",
                     "id": body.get("id"),
                     "error": {"code": -32601, "message": f"Unknown tool: {tool_name}"}
-                }, status_code=400)
+                }, 400
             
-            return JSONResponse(content={
+            return {
                 "jsonrpc": "2.0",
                 "id": body.get("id"),
                 "result": {"content": [{"type": "text", "text": result}]}
-            })
+            }, 200
+        except InvalidParams as e:
+            return {
+                "jsonrpc": "2.0",
+                "id": body.get("id"),
+                "error": {"code": -32602, "message": str(e)}
+            }, 400
+        except Overloaded as e:
+            if not in_batch:
+                raise
+            return {"jsonrpc": "2.0", "id": body.get("id"), "error": {"code": -32000, "message": str(e)}}, 429
         except Exception as e:
             logger.error(f"Error calling tool {tool_name}: {e}")
-            return JSONResponse(content={
+            return {
                 "jsonrpc": "2.0",
                 "id": body.get("id"),
                 "error": {"code": -32603, "message": str(e)}
-            }, status_code=500)
+            }, 500
     else:
-        return JSONResponse(content={
+        return {
             "jsonrpc": "2.0",
             "id": body.get("id"),
             "error": {"code": -32601, "message": f"Unknown method: {method}"}
+        }, 400
+
+
+async def handle_rpc_batch(request: Request, messages: list) -> Response:
+    """Handle a JSON-RPC batch
+    
+    Entries run concurrently, at most RPC_BATCH_CONCURRENCY at a time, and responses come back
+    in request order. Credentials are resolved once and shared by every tools/call in the batch.
+    """
+    if not messages or len(messages) > RPC_MAX_BATCH_SIZE:
+        message = "empty batch" if not messages else f"batch exceeds {RPC_MAX_BATCH_SIZE} entries"
+        return JSONResponse(content={
+            "jsonrpc": "2.0",
+            "id": None,
+            "error": {"code": -32600, "message": f"Invalid Request: {message}"}
         }, status_code=400)
+    
+    if any(isinstance(m, dict) and m.get("method") == "tools/call" for m in messages):
+        try:
+            request_credentials_context.set(await get_credentials())
+        except Exception as e:
+            # Leave it to each call to report the failure
+            logger.warning(f"Could not resolve credentials for batch: {e}")
+    
+    semaphore = asyncio.Semaphore(RPC_BATCH_CONCURRENCY)
+    
+    async def run(message) -> dict:
+        if not isinstance(message, dict):
+            return {"jsonrpc": "2.0", "id": None, "error": {"code": -32600, "message": "Invalid Request"}}
+        async with semaphore:
+            content, _ = await handle_rpc(request, message, in_batch=True)
+        return content
+    
+    # gather runs each entry in its own task, so per-call context (e.g. output format) stays separate
+    responses = await asyncio.gather(*(run(m) for m in messages))
+    # Notifications (no "id") get no response
+    responses = [r for m, r in zip(messages, responses) if not isinstance(m, dict) or "id" in m]
+    if not responses:
+        return Response(status_code=204)
+    return encode_response(request, responses)
 
 
 if __name__ == "__main__":
@@ -3,18 +3,55 @@ PostgreSQL MCP Server using FastMCP
 Handles MCP requests and retrieves credentials from Vault
 """
 import os
+import re
+import sys
 import json
+import time
 import base64
+import asyncio
+import gzip
+import hashlib
+import functools
+import threading
+import uuid
+import secrets
 import httpx
 import psycopg2
 from psycopg2.extras import RealDictCursor
-from typing import Optional, Tuple
+from typing import Annotated, Any, AsyncIterator, Dict, List, Optional, Tuple
 import logging
-from contextvars import ContextVar
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AsyncExitStack, asynccontextmanager
+from contextvars import ContextVar, copy_context
 from fastmcp import FastMCP
 from fastapi import Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+# Optional fast JSON serializer and brotli compression; both fall back gracefully
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+from pydantic import Field
+from opentelemetry import trace
+from opentelemetry.trace import SpanKind, Status, StatusCode
+
+# Modules shared by the MCP servers: copied next to main.py in the image, ../shared in a checkout
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared"))
+from tool_registry import InvalidParams, ToolRegistry
+from admission import AdmissionController, LimitedTransport, Overloaded
+from metrics import ServerMetrics
+from tracing import inject_trace_headers, server_span, set_status_code, setup_tracing, tracer
+from entity_cache import MISSING, EntityCache, entity_record
+from token_revoker import TokenRevoker
+from jwt_verifier import JWKSUnavailableError, JWTVerifier
+from jwt import InvalidTokenError
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -27,89 +64,535 @@ VAULT_ADDR = os.getenv("VAULT_ADDR", "http://localhost:8200")
 POSTGRES_HOST = os.getenv("POSTGRES_HOST", "localhost")
 POSTGRES_PORT = os.getenv("POSTGRES_PORT", "5432")
 
+# Shared HTTP client settings (one pooled, keep-alive client per upstream)
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "10"))
+HTTP_POOL_TIMEOUT = float(os.getenv("HTTP_POOL_TIMEOUT", "5"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "false").lower() == "true"
+# Concurrent requests per upstream (vault, keycloak, ...); UPSTREAM_MAX_CONCURRENCY_<NAME> overrides it
+UPSTREAM_MAX_CONCURRENCY = int(os.getenv("UPSTREAM_MAX_CONCURRENCY", "32"))
+
+# Admission control: requests in flight overall and per user (JWT sub). Excess requests wait up to
+# ADMISSION_QUEUE_TIMEOUT seconds; they are shed with 429 + Retry-After when that runs out, when
+# ADMISSION_MAX_QUEUE requests are already waiting, or while event loop lag exceeds ADMISSION_MAX_LOOP_LAG
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "64"))
+ADMISSION_MAX_PER_USER = int(os.getenv("ADMISSION_MAX_PER_USER", "8"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "128"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "5"))
+ADMISSION_MAX_LOOP_LAG = float(os.getenv("ADMISSION_MAX_LOOP_LAG", "0.5"))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "1"))
+# Seconds before expiry at which a cached Vault session is considered stale
+VAULT_SESSION_EXPIRY_MARGIN = int(os.getenv("VAULT_SESSION_EXPIRY_MARGIN", "10"))
+# Vault tokens of evicted or replaced sessions are revoked (auth/token/revoke-self) in batches every
+# VAULT_TOKEN_REVOKE_INTERVAL seconds, at least VAULT_TOKEN_REVOKE_GRACE seconds after eviction, and
+# the rest on shutdown. Batch tokens (VAULT_USER_TOKEN_TYPE=batch in init-vault.sh) are skipped.
+VAULT_TOKEN_REVOKE = os.getenv("VAULT_TOKEN_REVOKE", "true").lower() == "true"
+VAULT_TOKEN_REVOKE_INTERVAL = float(os.getenv("VAULT_TOKEN_REVOKE_INTERVAL", "5"))
+VAULT_TOKEN_REVOKE_GRACE = float(os.getenv("VAULT_TOKEN_REVOKE_GRACE", "5"))
+VAULT_TOKEN_REVOKE_CONCURRENCY = int(os.getenv("VAULT_TOKEN_REVOKE_CONCURRENCY", "8"))
+# Identity entity records, shared across users and keyed by name and entity id;
+# names Vault does not know are remembered for ENTITY_CACHE_NEGATIVE_TTL seconds
+ENTITY_CACHE_MAX_SIZE = int(os.getenv("ENTITY_CACHE_MAX_SIZE", "1024"))
+ENTITY_CACHE_TTL = int(os.getenv("ENTITY_CACHE_TTL", "300"))
+ENTITY_CACHE_NEGATIVE_TTL = int(os.getenv("ENTITY_CACHE_NEGATIVE_TTL", "30"))
+
+# Tool output encoding: "compact" JSON, "pretty" (indented) or "columnar" ({columns, rows} for
+# lists of records). A tools/call can override it with "format" in its params.
+OUTPUT_FORMATS = ("compact", "pretty", "columnar")
+MCP_OUTPUT_FORMAT = os.getenv("MCP_OUTPUT_FORMAT", "compact")
+# /sse responses at least this large are compressed when the client accepts br or gzip
+RESPONSE_COMPRESSION_MIN_SIZE = int(os.getenv("RESPONSE_COMPRESSION_MIN_SIZE", "1024"))
+RESPONSE_GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", "6"))
+RESPONSE_BROTLI_QUALITY = int(os.getenv("RESPONSE_BROTLI_QUALITY", "4"))
+
+# Local JWT verification against the Keycloak realm's JWKS (mirrors Vault's JWT auth config)
+KEYCLOAK_URL = os.getenv("KEYCLOAK_URL", "http://localhost:8080")
+KEYCLOAK_REALM = os.getenv("KEYCLOAK_REALM", "mcp-demo")
+JWT_JWKS_URL = os.getenv("JWT_JWKS_URL", f"{KEYCLOAK_URL}/realms/{KEYCLOAK_REALM}/protocol/openid-connect/certs")
+JWT_AUDIENCES = [a.strip() for a in os.getenv("JWT_AUDIENCES", "mcp-client,account").split(",") if a.strip()]
+# Must match the `iss` claim of tokens issued to the client; empty disables the issuer check
+JWT_ISSUER = os.getenv("JWT_ISSUER", "http://localhost:8080/realms/mcp-demo")
+JWT_LEEWAY = int(os.getenv("JWT_LEEWAY", "30"))
+JWKS_CACHE_TTL = int(os.getenv("JWKS_CACHE_TTL", "3600"))
+JWKS_MIN_REFRESH_INTERVAL = int(os.getenv("JWKS_MIN_REFRESH_INTERVAL", "30"))
+
+# JSON-RPC batches on /sse: maximum entries per batch and how many run at once
+RPC_MAX_BATCH_SIZE = int(os.getenv("RPC_MAX_BATCH_SIZE", "50"))
+RPC_BATCH_CONCURRENCY = int(os.getenv("RPC_BATCH_CONCURRENCY", "8"))
+
+# Context variable holding (JWT, verified claims) for the current request
+jwt_claims_context: ContextVar[Optional[Tuple[str, dict]]] = ContextVar("jwt_claims", default=None)
+# Context variable holding credentials resolved once for a whole JSON-RPC batch
+request_credentials_context: ContextVar[Optional[Any]] = ContextVar("request_credentials", default=None)
+# Context variable holding the output format for the current tool call
+output_format_context: ContextVar[str] = ContextVar("output_format", default=MCP_OUTPUT_FORMAT)
+# Dynamic database credentials are reused until less than DB_CREDS_MIN_TTL seconds remain,
+# renewed by DB_CREDS_RENEW_INCREMENT seconds (0 = role default) and revoked after
+# DB_CREDS_IDLE_TIMEOUT seconds without use. Replaced and idle leases are revoked by a
+# background sweep every DB_CREDS_SWEEP_INTERVAL seconds, once no connection of theirs is checked out
+DB_CREDS_MIN_TTL = int(os.getenv("DB_CREDS_MIN_TTL", "60"))
+DB_CREDS_RENEW_INCREMENT = int(os.getenv("DB_CREDS_RENEW_INCREMENT", "0"))
+DB_CREDS_IDLE_TIMEOUT = int(os.getenv("DB_CREDS_IDLE_TIMEOUT", "900"))
+DB_CREDS_SWEEP_INTERVAL = float(os.getenv("DB_CREDS_SWEEP_INTERVAL", "30"))
+# Connection pool settings (one pool per Vault-issued database username)
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "0"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "5"))
+DB_POOL_IDLE_TIMEOUT = int(os.getenv("DB_POOL_IDLE_TIMEOUT", "300"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Database executor size and per-user limit on concurrent queries
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", "16"))
+DB_MAX_CONCURRENCY_PER_USER = int(os.getenv("DB_MAX_CONCURRENCY_PER_USER", "2"))
+# execute_query result limits: rows are fetched in batches and capped by count and JSON size
+QUERY_FETCH_BATCH_SIZE = int(os.getenv("QUERY_FETCH_BATCH_SIZE", "500"))
+QUERY_MAX_ROWS = int(os.getenv("QUERY_MAX_ROWS", "10000"))
+QUERY_MAX_BYTES = int(os.getenv("QUERY_MAX_BYTES", str(10 * 1024 * 1024)))
+# Batches buffered between the database thread and a streaming /sse response
+QUERY_STREAM_QUEUE_SIZE = int(os.getenv("QUERY_STREAM_QUEUE_SIZE", "4"))
+# Paginated execute_query: held cursors expire after QUERY_PAGE_CURSOR_TTL idle seconds and
+# are reaped every QUERY_PAGE_CURSOR_SWEEP_INTERVAL seconds
+QUERY_PAGE_CURSOR_TTL = int(os.getenv("QUERY_PAGE_CURSOR_TTL", "300"))
+QUERY_PAGE_CURSOR_SWEEP_INTERVAL = float(os.getenv("QUERY_PAGE_CURSOR_SWEEP_INTERVAL", "30"))
+QUERY_MAX_OPEN_CURSORS_PER_USER = int(os.getenv("QUERY_MAX_OPEN_CURSORS_PER_USER", "3"))
+# Default statement_timeout per execute_query call (kept under the Streamlit client's 15s timeout),
+# and the upper bound for a caller-supplied timeout_seconds
+QUERY_STATEMENT_TIMEOUT = float(os.getenv("QUERY_STATEMENT_TIMEOUT", "10"))
+QUERY_MAX_STATEMENT_TIMEOUT = float(os.getenv("QUERY_MAX_STATEMENT_TIMEOUT", "300"))
+# Reject queries whose EXPLAIN total cost exceeds this before running them (0 disables the check)
+QUERY_MAX_PLAN_COST = float(os.getenv("QUERY_MAX_PLAN_COST", "0"))
+# Seconds between checks for an aborted HTTP request while a query runs
+CLIENT_DISCONNECT_POLL_INTERVAL = float(os.getenv("CLIENT_DISCONNECT_POLL_INTERVAL", "0.5"))
+# Schema catalog: seconds between catalog version checks before a cached schema is trusted again
+SCHEMA_CATALOG_CHECK_INTERVAL = float(os.getenv("SCHEMA_CATALOG_CHECK_INTERVAL", "5"))
+
 # Initialize FastMCP server
 mcp = FastMCP("PostgreSQL MCP Server")
 
 
+admission = AdmissionController(
+    max_in_flight=ADMISSION_MAX_IN_FLIGHT,
+    max_per_user=ADMISSION_MAX_PER_USER,
+    max_queue=ADMISSION_MAX_QUEUE,
+    queue_timeout=ADMISSION_QUEUE_TIMEOUT,
+    max_loop_lag=ADMISSION_MAX_LOOP_LAG,
+    retry_after=ADMISSION_RETRY_AFTER,
+    upstream_limit=UPSTREAM_MAX_CONCURRENCY
+)
+# Prometheus metrics served on /metrics
+metrics = ServerMetrics()
+metrics.add_stats_source("admission", admission.stats)
+# OpenTelemetry traces continuing the caller's W3C trace context (exporters: see shared/tracing.py)
+tracer_provider = setup_tracing("postgresql-mcp-server")
+
+# Shared HTTP clients keyed by upstream name, opened and closed with the app lifespan
+_http_clients: Dict[str, httpx.AsyncClient] = {}
+
+
+def create_http_client(upstream: str) -> httpx.AsyncClient:
+    """Create a pooled HTTP client with explicit limits, keep-alive and timeouts
+    
+    Requests hold one of the upstream's admission slots until their response body is closed,
+    and carry the current trace context.
+    """
+    http2 = HTTP2_ENABLED
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("HTTP2_ENABLED is set but the 'h2' package is not installed, using HTTP/1.1")
+            http2 = False
+    limit = os.getenv(f"UPSTREAM_MAX_CONCURRENCY_{upstream.upper()}")
+    if limit:
+        admission.set_upstream_limit(upstream, int(limit))
+    transport = httpx.AsyncHTTPTransport(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+        )
+    )
+    return httpx.AsyncClient(
+        transport=LimitedTransport(transport, admission, upstream),
+        event_hooks={"request": [inject_trace_headers]},
+        timeout=httpx.Timeout(
+            HTTP_READ_TIMEOUT,
+            connect=HTTP_CONNECT_TIMEOUT,
+            pool=HTTP_POOL_TIMEOUT
+        )
+    )
+
+
+def get_http_client(upstream: str) -> httpx.AsyncClient:
+    """Return the shared HTTP client for an upstream, creating it on first use"""
+    client = _http_clients.get(upstream)
+    if client is None or client.is_closed:
+        client = create_http_client(upstream)
+        _http_clients[upstream] = client
+    return client
+
+
+async def close_http_clients() -> None:
+    """Close all shared HTTP clients"""
+    clients = list(_http_clients.values())
+    _http_clients.clear()
+    for client in clients:
+        await client.aclose()
+
+
+def dump_json(obj, pretty: bool = False) -> str:
+    """Serialize to JSON with orjson when it is installed, otherwise the json module"""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if pretty else 0)
+        try:
+            return orjson.dumps(obj, default=str, option=option).decode()
+        except TypeError:
+            # e.g. integers wider than 64 bits; the json module handles those
+            pass
+    if pretty:
+        return json.dumps(obj, indent=2, default=str)
+    return json.dumps(obj, separators=(",", ":"), default=str)
+
+
+def to_columnar(obj):
+    """Turn a list of records with the same keys into {"columns": [...], "rows": [[...], ...]}
+    
+    A dict with a "rows" list (e.g. a page or truncated result) keeps its other fields.
+    Anything else is returned unchanged.
+    """
+    if isinstance(obj, dict) and isinstance(obj.get("rows"), list):
+        columnar = to_columnar(obj["rows"])
+        if isinstance(columnar, dict):
+            return {**columnar, **{key: value for key, value in obj.items() if key != "rows"}}
+        return obj
+    if isinstance(obj, list) and obj and all(isinstance(row, dict) for row in obj):
+        columns = list(obj[0])
+        if all(list(row) == columns for row in obj):
+            return {"columns": columns, "rows": [list(row.values()) for row in obj]}
+    return obj
+
+
+def format_result(result) -> str:
+    """Encode a tool result in the output format selected for the current call"""
+    output_format = output_format_context.get()
+    with metrics.phase("serialization"):
+        if output_format == "columnar":
+            result = to_columnar(result)
+        return dump_json(result, pretty=output_format == "pretty")
+
+
+def encode_response(request: Request, content, status_code: int = 200) -> Response:
+    """JSON response, compressed with br or gzip when the client accepts it and the body is large enough"""
+    return compress_response(request, dump_json(content).encode(), status_code)
+
+
+def compress_response(request: Request, body: bytes, status_code: int = 200,
+                      headers: Optional[Dict[str, str]] = None) -> Response:
+    """Response for an already serialized JSON body, compressed as in encode_response"""
+    headers = {**(headers or {}), "Vary": "Accept-Encoding"}
+    if len(body) >= RESPONSE_COMPRESSION_MIN_SIZE:
+        accepted = {
+            encoding.split(";")[0].strip().lower()
+            for encoding in request.headers.get("Accept-Encoding", "").split(",")
+        }
+        with metrics.phase("compression"):
+            if brotli is not None and "br" in accepted:
+                body = brotli.compress(body, quality=RESPONSE_BROTLI_QUALITY)
+                headers["Content-Encoding"] = "br"
+            elif "gzip" in accepted:
+                body = gzip.compress(body, compresslevel=RESPONSE_GZIP_LEVEL)
+                headers["Content-Encoding"] = "gzip"
+    return Response(content=body, status_code=status_code, media_type="application/json", headers=headers)
+
+
+async def timed(timings: Dict[str, float], step: str, awaitable):
+    """Await and record the elapsed time in milliseconds as timings[step]"""
+    start = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        timings[step] = round((time.perf_counter() - start) * 1000, 2)
+
+
 class VaultClient:
     """Helper class for Vault operations"""
     
     def __init__(self):
         self.vault_addr = VAULT_ADDR
+        # Vault sessions (token + resolved identity) keyed by SHA-256 of the user's JWT
+        self._sessions: Dict[str, dict] = {}
+        # In-flight logins keyed the same way, so concurrent calls for one user share a login
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.session_hits = 0
+        self.session_misses = 0
+        # Entity records by name / entity id, so hot users skip identity/entity/name lookups
+        self.entity_cache = EntityCache(ENTITY_CACHE_MAX_SIZE, ENTITY_CACHE_TTL, ENTITY_CACHE_NEGATIVE_TTL)
+        # Tokens of dropped sessions, revoked in batches in the background
+        self.token_revoker = TokenRevoker(
+            self.vault_addr,
+            lambda: get_http_client("vault"),
+            interval=VAULT_TOKEN_REVOKE_INTERVAL,
+            grace=VAULT_TOKEN_REVOKE_GRACE,
+            concurrency=VAULT_TOKEN_REVOKE_CONCURRENCY,
+            enabled=VAULT_TOKEN_REVOKE
+        )
+        # Dynamic database credential leases keyed by entity name
+        self._db_leases: Dict[str, dict] = {}
+        # Replaced or idle leases, revoked by the sweep once their connections are back in the pool
+        self._draining_db_leases: List[dict] = []
+        self._db_lease_sweeper: Optional[asyncio.Task] = None
+    
+    @staticmethod
+    def _session_key(user_jwt: str) -> str:
+        return hashlib.sha256(user_jwt.encode()).hexdigest()
+    
+    async def get_session(self, user_jwt: str) -> dict:
+        """Return the cached Vault session for a JWT, logging in only when needed
+        
+        Sessions expire at the earlier of the JWT `exp` claim and the Vault token lease.
+        Concurrent callers for the same JWT wait on a single in-flight login.
+        """
+        key = self._session_key(user_jwt)
+        session = self._sessions.get(key)
+        if session and session["expires_at"] > time.time():
+            self.session_hits += 1
+            return session
+        
+        self.session_misses += 1
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._login(user_jwt, key))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._clear_inflight(key, t))
+        # Shield the shared login so one cancelled caller does not cancel it for the others
+        return await asyncio.shield(task)
+    
+    def session_stats(self) -> dict:
+        return {"entries": len(self._sessions), "hits": self.session_hits, "misses": self.session_misses}
+    
+    def invalidate_session(self, user_jwt: str) -> None:
+        """Drop the cached Vault session for a JWT and queue its token for revocation"""
+        session = self._sessions.pop(self._session_key(user_jwt), None)
+        if session:
+            self._retire_session(session)
+    
+    def _retire_session(self, session: dict) -> None:
+        """Queue a dropped session's Vault token for revocation, unless a cached database lease needs it
+        
+        Revoking a token also revokes its leases; such tokens are retired by _revoke_db_leases.
+        """
+        if any(lease["vault_token"] == session["vault_token"] for lease in self._live_db_leases()):
+            return
+        self.token_revoker.schedule(session["vault_token"], session["token_expires_at"], session["token_type"])
+    
+    def _discard_login(self, auth_data: dict) -> None:
+        """Queue the token of a login that did not become a session for revocation"""
+        self.token_revoker.schedule(auth_data["client_token"], token_type=auth_data.get("token_type"))
+    
+    def _clear_inflight(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+    
+    def _evict_expired_sessions(self) -> None:
+        now = time.time()
+        for key in [k for k, s in self._sessions.items() if s["expires_at"] <= now]:
+            self._retire_session(self._sessions.pop(key))
+    
+    async def _login(self, user_jwt: str, key: str) -> dict:
+        """Login to Vault with JWT, resolve the entity and cache the resulting session"""
+        auth_data = await self._jwt_login(user_jwt)
+        headers = {"X-Vault-Token": auth_data["client_token"]}
+        # Entity name is set to username (alice, bob) via pre-created entities, so the
+        # entity can be looked up by the JWT username concurrently with the token lookup
+        entity_name = self._jwt_entity_name(user_jwt)
+        try:
+            lookup_response, entity_data = await asyncio.gather(
+                self._lookup_self(headers),
+                self._fetch_entity(entity_name, headers)
+            )
+            lookup_response.raise_for_status()
+            return self._store_session(key, user_jwt, auth_data, lookup_response.json()["data"], entity_name, entity_data)
+        except BaseException:
+            self._discard_login(auth_data)
+            raise
+    
+    async def _jwt_login(self, user_jwt: str) -> dict:
+        """auth/jwt/login; returns the `auth` block"""
+        with metrics.phase("vault_login"):
+            login_response = await get_http_client("vault").post(
+                f"{self.vault_addr}/v1/auth/jwt/login",
+                json={"role": "user", "jwt": user_jwt}
+            )
+        login_response.raise_for_status()
+        return login_response.json()["auth"]
+    
+    async def _lookup_self(self, headers: dict) -> httpx.Response:
+        with metrics.phase("vault_token_lookup"):
+            return await get_http_client("vault").get(f"{self.vault_addr}/v1/auth/token/lookup-self", headers=headers)
+    
+    @staticmethod
+    def _jwt_entity_name(user_jwt: str) -> str:
+        _, user_info = extract_user_id_from_jwt(user_jwt)
+        return user_info.get("preferred_username", "unknown")
+    
+    async def _fetch_entity(self, entity_name: str, headers: dict) -> Optional[dict]:
+        """Entity record by name, from the entity cache or Vault; None when unknown or unreadable"""
+        cached = self.entity_cache.get(entity_name)
+        if cached is not MISSING:
+            return cached
+        try:
+            with metrics.phase("vault_entity_lookup"):
+                response = await get_http_client("vault").get(
+                    f"{self.vault_addr}/v1/identity/entity/name/{entity_name}",
+                    headers=headers
+                )
+            if response.status_code == 200:
+                record = entity_record(response.json().get("data") or {})
+                self.entity_cache.put(entity_name, record)
+                return record
+            if response.status_code == 404:
+                self.entity_cache.put(entity_name, None)
+            logger.warning(f"Failed to fetch entity: {response.status_code}")
+        except Exception as e:
+            logger.error(f"Error fetching entity name: {e}")
+        return None
+    
+    def invalidate_entity(self, entity_name: Optional[str] = None, entity_id: Optional[str] = None) -> None:
+        """Drop a cached entity record, e.g. after its policies or aliases were changed in Vault"""
+        self.entity_cache.invalidate(name=entity_name, entity_id=entity_id)
+    
+    def _store_session(self, key: str, user_jwt: str, auth_data: dict, lookup_data: dict,
+                       entity_name: str, entity_data: Optional[dict]) -> dict:
+        """Build the session from the login and lookups and cache it under key"""
+        entity_id = lookup_data.get("entity_id")
+        if entity_data is None and entity_id:
+            # The name lookup failed, but the token's entity may be cached by id
+            cached = self.entity_cache.get_by_id(entity_id)
+            if cached is not MISSING:
+                entity_data = cached
+        if entity_data and entity_id and entity_data.get("id") != entity_id:
+            # The name now belongs to a different entity than the cached record; refetch next time
+            self.invalidate_entity(entity_name, entity_data.get("id"))
+            entity_data = None
+        if entity_data and entity_data.get("name"):
+            entity_name = entity_data["name"]
+            logger.info(f"Verified entity name: {entity_name}")
+        
+        # Cache until the earlier of the JWT expiry and the Vault token lease
+        now = time.time()
+        expiries = []
+        if auth_data.get("lease_duration"):
+            expiries.append(now + auth_data["lease_duration"])
+        jwt_exp = extract_jwt_expiry(user_jwt)
+        if jwt_exp:
+            expiries.append(jwt_exp)
+        expires_at = (min(expiries) if expiries else now) - VAULT_SESSION_EXPIRY_MARGIN
+        
+        session = {
+            "vault_token": auth_data["client_token"],
+            "entity_id": entity_id,
+            "entity_name": entity_name,
+            "policies": lookup_data.get("policies", []),
+            "metadata": lookup_data.get("meta", {}),
+            "aliases": lookup_data.get("aliases", []),
+            "lease_duration": auth_data.get("lease_duration"),
+            "renewable": auth_data.get("renewable", False),
+            "expires_at": expires_at,
+            # Dynamic database leases die with the token that created them
+            "token_expires_at": now + auth_data["lease_duration"] if auth_data.get("lease_duration") else float("inf"),
+            "token_type": auth_data.get("token_type")
+        }
+        self._evict_expired_sessions()
+        previous = self._sessions.get(key)
+        if previous and previous["vault_token"] != session["vault_token"]:
+            # A concurrent login for the same JWT (e.g. /debug/credentials) replaced it
+            self._retire_session(previous)
+        self._sessions[key] = session
+        return session
+    
+    async def trace(self, user_jwt: str, secret_path: str) -> dict:
+        """Resolve the user's session and read secret_path once, timing each step (for /debug/credentials)
+        
+        Reuses a cached session; otherwise logs in once and runs the token lookup, the entity
+        lookup and the read concurrently. `{entity_name}` in secret_path is filled in from the JWT.
+        Returns the session, whether it was cached, the read's response (or exception) and
+        per-step timings in milliseconds.
+        """
+        timings: Dict[str, float] = {}
+        started = time.perf_counter()
+        client = get_http_client("vault")
+        key = self._session_key(user_jwt)
+        session = self._sessions.get(key)
+        session_cached = bool(session and session["expires_at"] > time.time())
+        
+        if session_cached:
+            entity_name = session["entity_name"]
+            secret_response = await timed(timings, "secret_read", client.get(
+                f"{self.vault_addr}/v1/{secret_path.format(entity_name=entity_name)}",
+                headers={"X-Vault-Token": session["vault_token"]}
+            ))
+        else:
+            auth_data = await timed(timings, "vault_login", self._jwt_login(user_jwt))
+            headers = {"X-Vault-Token": auth_data["client_token"]}
+            entity_name = self._jwt_entity_name(user_jwt)
+            lookup_response, entity_data, secret_response = await asyncio.gather(
+                timed(timings, "token_lookup", self._lookup_self(headers)),
+                timed(timings, "entity_lookup", self._fetch_entity(entity_name, headers)),
+                timed(timings, "secret_read", client.get(
+                    f"{self.vault_addr}/v1/{secret_path.format(entity_name=entity_name)}", headers=headers
+                )),
+                return_exceptions=True
+            )
+            if isinstance(lookup_response, BaseException) or lookup_response.is_error:
+                self._discard_login(auth_data)
+                if isinstance(lookup_response, BaseException):
+                    raise lookup_response
+                lookup_response.raise_for_status()
+            session = self._store_session(
+                key, user_jwt, auth_data, lookup_response.json()["data"], entity_name,
+                None if isinstance(entity_data, BaseException) else entity_data
+            )
+            if session["entity_name"] != entity_name:
+                # The entity is named differently from the JWT username; read from its path instead
+                entity_name = session["entity_name"]
+                secret_response = await timed(timings, "secret_read_retry", client.get(
+                    f"{self.vault_addr}/v1/{secret_path.format(entity_name=entity_name)}", headers=headers
+                ))
+        
+        timings["total"] = round((time.perf_counter() - started) * 1000, 2)
+        return {
+            "session": session,
+            "session_cached": session_cached,
+            "secret_response": secret_response,
+            "timings": timings
+        }
     
     async def get_credentials(self, user_jwt: str) -> Tuple[dict, str]:
         """Authenticate with Vault using JWT and retrieve user credentials
+        
+        Dynamic database credentials are cached per entity and reused while enough of
+        their lease remains; near expiry the lease is renewed before a new one is minted.
         Returns: (credentials_dict, entity_name)
         """
         try:
-            async with httpx.AsyncClient() as client:
-                # Login to Vault with JWT
-                login_response = await client.post(
-                    f"{self.vault_addr}/v1/auth/jwt/login",
-                    json={"role": "user", "jwt": user_jwt}
-                )
-                login_response.raise_for_status()
-                auth_data = login_response.json()["auth"]
-                vault_token = auth_data["client_token"]
-                
-                # Get entity name from token lookup
-                lookup_response = await client.get(
-                    f"{self.vault_addr}/v1/auth/token/lookup-self",
-                    headers={"X-Vault-Token": vault_token}
-                )
-                lookup_response.raise_for_status()
-                lookup_data = lookup_response.json()["data"]
-                
-                # Extract entity name (which is the username for pre-created entities)
-                entity_id = lookup_data.get("entity_id")
-                entity_name = None
-                
-                # Try to get entity_name from JWT first (username)
-                _, user_info = extract_user_id_from_jwt(user_jwt)
-                entity_name = user_info.get("preferred_username", "unknown")
-                logger.info(f"Using entity name from JWT: {entity_name}")
-                
-                # Fetch entity information using entity name
-                if entity_name:
-                    try:
-                        entity_response = await client.get(
-                            f"{self.vault_addr}/v1/identity/entity/name/{entity_name}",
-                            headers={"X-Vault-Token": vault_token}
-                        )
-                        if entity_response.status_code == 200:
-                            entity_data = entity_response.json().get("data", {})
-                            fetched_name = entity_data.get("name")
-                            if fetched_name:
-                                entity_name = fetched_name
-                                logger.info(f"Verified entity name: {entity_name}")
-                    except Exception as e:
-                        logger.error(f"Error fetching entity name: {e}")
-                        pass
-                
-                # Get database credentials from Database secrets engine using role name (entity_name)
-                # The role name matches the entity name (alice, bob)
-                creds_response = await client.get(
-                    f"{self.vault_addr}/v1/database/creds/{entity_name}",
-                    headers={"X-Vault-Token": vault_token}
-                )
-                
-                if creds_response.status_code == 404:
-                    raise ValueError(f"Database role not found: {entity_name}")
-                
-                creds_response.raise_for_status()
-                creds_data = creds_response.json()["data"]
-                
-                # Database secrets engine returns username and password
-                # We need to construct the full connection info
-                credentials = {
-                    "host": POSTGRES_HOST,
-                    "port": POSTGRES_PORT,
-                    "database": "mcp_demo",
-                    "username": creds_data.get("username"),
-                    "password": creds_data.get("password")
-                }
-                
-                return credentials, entity_name
+            session = await self.get_session(user_jwt)
+            entity_name = session["entity_name"]
+            
+            lease = self._db_leases.get(entity_name)
+            if lease is None or lease["expires_at"] - time.time() <= DB_CREDS_MIN_TTL:
+                # Renewal/minting is shared by concurrent callers for the same entity
+                key = f"db:{entity_name}"
+                task = self._inflight.get(key)
+                if task is None:
+                    task = asyncio.create_task(self._refresh_db_lease(user_jwt, entity_name))
+                    self._inflight[key] = task
+                    task.add_done_callback(lambda t: self._clear_inflight(key, t))
+                lease = await asyncio.shield(task)
+            
+            lease["last_used"] = time.time()
+            return lease["credentials"], entity_name
                 
         except httpx.HTTPStatusError as e:
             logger.error(f"HTTP error getting credentials: {e.response.status_code} - {e.response.text}")
@@ -118,179 +601,1284 @@ class VaultClient:
             logger.error(f"Error getting credentials: {e}")
             raise
     
-    async def get_vault_auth_info(self, user_jwt: str) -> Optional[dict]:
-        """Get Vault authentication and entity information"""
-        try:
-            async with httpx.AsyncClient() as client:
-                # Login to Vault with JWT
-                login_response = await client.post(
-                    f"{self.vault_addr}/v1/auth/jwt/login",
-                    json={"role": "user", "jwt": user_jwt}
+    async def _refresh_db_lease(self, user_jwt: str, entity_name: str) -> dict:
+        """Renew the cached database lease for an entity, or mint a new credential"""
+        lease = self._db_leases.get(entity_name)
+        if lease and lease["renewable"] and lease["expires_at"] > time.time():
+            session = await self.get_session(user_jwt)
+            if await self._renew_db_lease(lease, session["vault_token"]):
+                return lease
+        
+        new_lease = await self._create_db_lease(user_jwt)
+        self._db_leases[entity_name] = new_lease
+        if lease:
+            # Queries and held cursors may still be using the old credential; let them finish
+            self._drain_db_lease(lease)
+        return new_lease
+    
+    async def _create_db_lease(self, user_jwt: str) -> dict:
+        """Generate dynamic database credentials and wrap them in a lease entry"""
+        session = await self.get_session(user_jwt)
+        client = get_http_client("vault")
+        # Get database credentials from Database secrets engine using role name (entity_name)
+        # The role name matches the entity name (alice, bob)
+        with metrics.phase("vault_db_creds"):
+            creds_response = await client.get(
+                f"{self.vault_addr}/v1/database/creds/{session['entity_name']}",
+                headers={"X-Vault-Token": session["vault_token"]}
+            )
+        if creds_response.status_code == 403:
+            # Cached token was revoked or lost its policies; log in again once
+            self.invalidate_entity(session["entity_name"], session["entity_id"])
+            self.invalidate_session(user_jwt)
+            session = await self.get_session(user_jwt)
+            with metrics.phase("vault_db_creds"):
+                creds_response = await client.get(
+                    f"{self.vault_addr}/v1/database/creds/{session['entity_name']}",
+                    headers={"X-Vault-Token": session["vault_token"]}
                 )
-                login_response.raise_for_status()
-                auth_data = login_response.json()["auth"]
-                vault_token = auth_data["client_token"]
-                
-                # Get token lookup info
-                lookup_response = await client.get(
-                    f"{self.vault_addr}/v1/auth/token/lookup-self",
+        
+        entity_name = session["entity_name"]
+        if creds_response.status_code == 404:
+            raise ValueError(f"Database role not found: {entity_name}")
+        
+        creds_response.raise_for_status()
+        creds_body = creds_response.json()
+        creds_data = creds_body["data"]
+        
+        # Database secrets engine returns username and password
+        # We need to construct the full connection info
+        credentials = {
+            "host": POSTGRES_HOST,
+            "port": POSTGRES_PORT,
+            "database": "mcp_demo",
+            "username": creds_data.get("username"),
+            "password": creds_data.get("password")
+        }
+        now = time.time()
+        logger.info(f"Issued database credential {credentials['username']} for {entity_name} (lease {creds_body.get('lease_id')})")
+        return {
+            "entity_name": entity_name,
+            "credentials": credentials,
+            "lease_id": creds_body.get("lease_id"),
+            "renewable": creds_body.get("renewable", False),
+            "expires_at": min(now + creds_body.get("lease_duration", 0), session["token_expires_at"]),
+            "token_expires_at": session["token_expires_at"],
+            "vault_token": session["vault_token"],
+            "token_type": session["token_type"],
+            "last_used": now
+        }
+    
+    async def _renew_db_lease(self, lease: dict, vault_token: str) -> bool:
+        """Extend a database lease via sys/leases/renew; False when it can no longer be extended"""
+        body = {"increment": DB_CREDS_RENEW_INCREMENT} if DB_CREDS_RENEW_INCREMENT else {}
+        try:
+            with metrics.phase("vault_lease_renew"):
+                response = await get_http_client("vault").put(
+                    f"{self.vault_addr}/v1/sys/leases/renew/{lease['lease_id']}",
+                    json=body,
                     headers={"X-Vault-Token": vault_token}
                 )
-                lookup_response.raise_for_status()
-                lookup_data = lookup_response.json()["data"]
-                
-                # Get entity name
-                entity_id = lookup_data.get("entity_id")
-                entity_name = None
-                
-                _, user_info = extract_user_id_from_jwt(user_jwt)
-                entity_name = user_info.get("preferred_username", "unknown")
-                
-                # Fetch entity information using entity name
-                if entity_name:
-                    try:
-                        entity_response = await client.get(
-                            f"{self.vault_addr}/v1/identity/entity/name/{entity_name}",
-                            headers={"X-Vault-Token": vault_token}
-                        )
-                        if entity_response.status_code == 200:
-                            entity_data = entity_response.json().get("data", {})
-                            fetched_name = entity_data.get("name")
-                            if fetched_name:
-                                entity_name = fetched_name
-                    except:
-                        pass
-                
-                return {
-                    "entity_id": entity_id,
-                    "entity_name": entity_name,
-                    "policies": lookup_data.get("policies", []),
-                    "metadata": lookup_data.get("meta", {}),
-                    "aliases": lookup_data.get("aliases", []),
-                    "lease_duration": auth_data.get("lease_duration"),
-                    "renewable": auth_data.get("renewable", False)
-                }
+            response.raise_for_status()
+            renew_data = response.json()
+        except Exception as e:
+            logger.warning(f"Failed to renew database lease {lease['lease_id']}: {e}")
+            return False
+        
+        # Leases cannot outlive the token that created them, and stop growing at max_ttl
+        expires_at = min(time.time() + renew_data.get("lease_duration", 0), lease["token_expires_at"])
+        if expires_at - time.time() <= DB_CREDS_MIN_TTL:
+            return False
+        lease["expires_at"] = expires_at
+        lease["renewable"] = renew_data.get("renewable", False)
+        logger.info(f"Renewed database lease {lease['lease_id']} for {renew_data.get('lease_duration')}s")
+        return True
+    
+    async def _revoke_db_leases(self, leases: list) -> None:
+        """Revoke database leases concurrently (best effort)"""
+        # Pooled connections must not outlive their credential
+        for lease in leases:
+            db_pools.retire(lease["credentials"]["username"])
+        
+        client = get_http_client("vault")
+        
+        async def revoke(lease: dict) -> None:
+            try:
+                response = await client.put(
+                    f"{self.vault_addr}/v1/sys/leases/revoke/{lease['lease_id']}",
+                    headers={"X-Vault-Token": lease["vault_token"]}
+                )
+                response.raise_for_status()
+                logger.info(f"Revoked database lease {lease['lease_id']}")
+            except Exception as e:
+                logger.warning(f"Failed to revoke database lease {lease['lease_id']}: {e}")
+        
+        # Expired leases have already been revoked by Vault
+        now = time.time()
+        await asyncio.gather(*(revoke(lease) for lease in leases if lease["lease_id"] and lease["expires_at"] > now))
+        
+        # Tokens that were only kept for these leases can go as well
+        in_use = {s["vault_token"] for s in self._sessions.values()}
+        in_use.update(lease["vault_token"] for lease in self._live_db_leases())
+        for lease in leases:
+            if lease["vault_token"] not in in_use:
+                self.token_revoker.schedule(lease["vault_token"], lease["token_expires_at"], lease.get("token_type"))
+    
+    def _live_db_leases(self) -> list:
+        """Cached and draining leases, whose Vault tokens must not be revoked yet"""
+        return list(self._db_leases.values()) + self._draining_db_leases
+    
+    def _drain_db_lease(self, lease: dict) -> None:
+        """Queue a lease that is no longer handed out for revocation by the sweep"""
+        self._draining_db_leases.append(lease)
+    
+    def is_draining_db_username(self, entity_name: str, username: str) -> bool:
+        """Whether a replaced credential of the entity is still valid while its connections drain"""
+        now = time.time()
+        return any(
+            lease["credentials"]["username"] == username and lease["expires_at"] > now
+            for lease in self._draining_db_leases
+            if lease["entity_name"] == entity_name
+        )
+    
+    async def sweep_db_leases(self) -> None:
+        """Retire expired and idle leases, then revoke draining leases with no checked-out connection
+        
+        A lease is revoked no earlier than DB_CREDS_SWEEP_INTERVAL after it was last handed out, so
+        requests that picked up the credential just before it was replaced can still check out a connection.
+        """
+        now = time.time()
+        stale = [
+            name for name, lease in self._db_leases.items()
+            if lease["expires_at"] <= now or now - lease["last_used"] > DB_CREDS_IDLE_TIMEOUT
+        ]
+        for name in stale:
+            self._drain_db_lease(self._db_leases.pop(name))
+        
+        due, draining = [], []
+        for lease in self._draining_db_leases:
+            expired = lease["expires_at"] <= now
+            drained = (now - lease["last_used"] >= DB_CREDS_SWEEP_INTERVAL
+                       and db_pools.in_use(lease["credentials"]["username"]) == 0)
+            (due if expired or drained else draining).append(lease)
+        self._draining_db_leases = draining
+        if due:
+            await self._revoke_db_leases(due)
+    
+    async def _sweep_db_leases_loop(self) -> None:
+        while True:
+            await asyncio.sleep(DB_CREDS_SWEEP_INTERVAL)
+            try:
+                await self.sweep_db_leases()
+            except Exception as e:
+                logger.error(f"Error sweeping database leases: {e}")
+    
+    def cached_db_credentials(self, entity_name: str) -> Optional[dict]:
+        """Credentials of the entity's live cached lease, if any (never mints one)"""
+        lease = self._db_leases.get(entity_name)
+        if lease and lease["expires_at"] > time.time():
+            return lease["credentials"]
+        return None
+    
+    def start(self) -> None:
+        """Start revoking retired Vault tokens and database leases in the background (call from the app lifespan)"""
+        self.token_revoker.start()
+        if self._db_lease_sweeper is None:
+            self._db_lease_sweeper = asyncio.create_task(self._sweep_db_leases_loop())
+    
+    async def close(self) -> None:
+        """Batch-revoke all cached and draining database leases, then the sessions' Vault tokens (called on shutdown)"""
+        if self._db_lease_sweeper is not None:
+            self._db_lease_sweeper.cancel()
+            try:
+                await self._db_lease_sweeper
+            except asyncio.CancelledError:
+                pass
+            self._db_lease_sweeper = None
+        leases = list(self._db_leases.values()) + self._draining_db_leases
+        self._db_leases.clear()
+        self._draining_db_leases = []
+        if leases:
+            logger.info(f"Revoking {len(leases)} cached database lease(s)")
+            await self._revoke_db_leases(leases)
+        for session in self._sessions.values():
+            self._retire_session(session)
+        self._sessions.clear()
+        await self.token_revoker.stop()
+    
+    @staticmethod
+    def auth_info(session: dict) -> dict:
+        """The session's identity fields as reported by the debug endpoint"""
+        return {
+            "entity_id": session["entity_id"],
+            "entity_name": session["entity_name"],
+            "policies": session["policies"],
+            "metadata": session["metadata"],
+            "aliases": session["aliases"],
+            "lease_duration": session["lease_duration"],
+            "renewable": session["renewable"]
+        }
+    
+    async def get_vault_auth_info(self, user_jwt: str) -> Optional[dict]:
+        """Get Vault authentication and entity information"""
+        try:
+            return self.auth_info(await self.get_session(user_jwt))
         except Exception as e:
             logger.error(f"Error getting Vault auth info: {e}")
             return None
 
 
 vault_client = VaultClient()
+metrics.add_stats_source("vault_session", vault_client.session_stats)
+metrics.add_stats_source("vault_entity", vault_client.entity_cache.stats)
+jwt_verifier = JWTVerifier(
+    JWT_JWKS_URL,
+    audiences=JWT_AUDIENCES,
+    issuer=JWT_ISSUER,
+    leeway=JWT_LEEWAY,
+    cache_ttl=JWKS_CACHE_TTL,
+    min_refresh_interval=JWKS_MIN_REFRESH_INTERVAL,
+    client_factory=lambda: get_http_client("keycloak")
+)
 
 
-def extract_user_id_from_jwt(user_jwt: str) -> Tuple[str, dict]:
-    """Extract user ID and info from JWT token"""
+def decode_jwt_claims(user_jwt: str) -> dict:
+    """Claims of a JWT: the ones verified by auth_middleware for this request, else decoded unverified"""
+    verified = jwt_claims_context.get()
+    if verified is not None and verified[0] == user_jwt:
+        return verified[1]
     try:
         parts = user_jwt.split('.')
         if len(parts) >= 2:
-            payload = json.loads(base64.urlsafe_b64decode(parts[1] + '=='))
-            user_id = payload.get('sub', 'default')
-            user_info = {
-                "sub": user_id,
-                "preferred_username": payload.get('preferred_username', 'unknown'),
-                "email": payload.get('email', 'unknown')
-            }
-            return user_id, user_info
+            return json.loads(base64.urlsafe_b64decode(parts[1] + '=='))
     except:
         pass
+    return {}
+
+
+def extract_user_id_from_jwt(user_jwt: str) -> Tuple[str, dict]:
+    """Extract user ID and info from JWT token"""
+    payload = decode_jwt_claims(user_jwt)
+    if payload:
+        user_id = payload.get('sub', 'default')
+        user_info = {
+            "sub": user_id,
+            "preferred_username": payload.get('preferred_username', 'unknown'),
+            "email": payload.get('email', 'unknown')
+        }
+        return user_id, user_info
     return 'default', {"sub": "default"}
 
 
-async def get_credentials() -> dict:
-    """Get credentials for the current user"""
+def extract_jwt_expiry(user_jwt: str) -> Optional[int]:
+    """Extract the `exp` claim (epoch seconds) from JWT token"""
+    return decode_jwt_claims(user_jwt).get('exp')
+
+
+async def verify_request_jwt(request: Request, user_jwt: str) -> Optional[JSONResponse]:
+    """Verify a bearer JWT locally and record its claims; returns an error response if it is rejected"""
+    try:
+        with metrics.phase("jwt_verify"):
+            claims = await jwt_verifier.verify(user_jwt)
+    except InvalidTokenError as e:
+        return JSONResponse(status_code=401, content={"detail": f"Invalid token: {e}"})
+    except JWKSUnavailableError as e:
+        logger.error(str(e))
+        return JSONResponse(status_code=503, content={"detail": "Unable to verify token: signing keys unavailable"})
+    request.state.jwt_claims = claims
+    jwt_claims_context.set((user_jwt, claims))
+    return None
+
+
+async def get_credentials() -> Tuple[dict, str]:
+    """Get credentials for the current user
+    Returns: (credentials_dict, entity_name)
+    """
     user_jwt = user_jwt_context.get()
     if not user_jwt:
         raise ValueError("No JWT token found in context")
-    credentials, _ = await vault_client.get_credentials(user_jwt)
-    return credentials
+    credentials = request_credentials_context.get()
+    if credentials is not None:
+        return credentials
+    return await vault_client.get_credentials(user_jwt)
+
+
+class CredentialPool:
+    """Thread-safe pool of PostgreSQL connections opened with one Vault-issued credential"""
+    
+    def __init__(self, credentials: dict):
+        self.credentials = credentials
+        self.username = credentials.get("username")
+        self.created_at = time.time()
+        self.last_used = self.created_at
+        self.retired = False
+        # Idle connections as (connection, returned_at), most recently returned last
+        self._idle: List[Tuple[Any, float]] = []
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self._counters = {
+            "opened": 0,
+            "closed": 0,
+            "checkouts": 0,
+            "reused": 0,
+            "waits": 0,
+            "timeouts": 0
+        }
+    
+    def _connect(self):
+        """Create PostgreSQL connection using credentials"""
+        return psycopg2.connect(
+            host=self.credentials.get("host", POSTGRES_HOST),
+            port=int(self.credentials.get("port", POSTGRES_PORT)),
+            database=self.credentials.get("database", "mcp_demo"),
+            user=self.credentials.get("username", "postgres"),
+            password=self.credentials.get("password", "postgres123")
+        )
+    
+    def getconn(self):
+        """Check out an idle connection, opening a new one while below DB_POOL_MAX_SIZE"""
+        deadline = time.monotonic() + DB_POOL_TIMEOUT
+        stale = []
+        conn = None
+        try:
+            with self._cond:
+                while True:
+                    if self.retired:
+                        raise ValueError(f"Connection pool for {self.username} has been retired")
+                    if self._idle:
+                        candidate, _ = self._idle.pop()
+                        if candidate.closed:
+                            stale.append(candidate)
+                            continue
+                        conn = candidate
+                        self._counters["reused"] += 1
+                        break
+                    if self._in_use + len(self._idle) < DB_POOL_MAX_SIZE:
+                        break
+                    self._counters["waits"] += 1
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or not self._cond.wait(remaining):
+                        self._counters["timeouts"] += 1
+                        raise ValueError(f"Timed out waiting for a database connection for {self.username}")
+                self._in_use += 1
+                self._counters["checkouts"] += 1
+                self.last_used = time.time()
+        finally:
+            self._close_all(stale)
+        
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._in_use -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._counters["opened"] += 1
+        return conn
+    
+    def putconn(self, conn) -> None:
+        """Return a connection; broken connections and those of a retired pool are closed"""
+        discard = conn.closed or self.retired
+        if not discard:
+            try:
+                # Never hand out a connection with an open or failed transaction
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+        with self._cond:
+            self._in_use -= 1
+            if not discard:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+        if discard:
+            self._close_all([conn])
+    
+    def close_idle(self) -> None:
+        """Close connections idle longer than DB_POOL_IDLE_TIMEOUT, keeping DB_POOL_MIN_SIZE open"""
+        cutoff = time.monotonic() - DB_POOL_IDLE_TIMEOUT
+        with self._cond:
+            removable = max(0, self._in_use + len(self._idle) - DB_POOL_MIN_SIZE)
+            expired = [entry for entry in self._idle if entry[1] < cutoff][:removable]
+            for entry in expired:
+                self._idle.remove(entry)
+        self._close_all([conn for conn, _ in expired])
+    
+    def retire(self) -> None:
+        """Stop handing out connections; idle ones close now, checked-out ones on return"""
+        with self._cond:
+            self.retired = True
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            self._cond.notify_all()
+        self._close_all(idle)
+    
+    def _close_all(self, conns: list) -> None:
+        for conn in conns:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        if conns:
+            with self._cond:
+                self._counters["closed"] += len(conns)
+    
+    @property
+    def size(self) -> int:
+        return self._in_use + len(self._idle)
+    
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "username": self.username,
+                "size": self._in_use + len(self._idle),
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "retired": self.retired,
+                "age_seconds": round(time.time() - self.created_at, 1),
+                "idle_seconds": round(time.time() - self.last_used, 1),
+                **self._counters
+            }
+
+
+class ConnectionPoolManager:
+    """Connection pools keyed by the Vault-issued database username
+    
+    A pool is retired when its dynamic credential is rotated or its lease is revoked or expires.
+    """
+    
+    def __init__(self):
+        self._pools: Dict[str, CredentialPool] = {}
+        self._checked_out: Dict[int, CredentialPool] = {}
+        self._lock = threading.Lock()
+        self._retired = 0
+    
+    def getconn(self, credentials: dict):
+        """Check out a connection from the pool of the credential's username"""
+        self.close_idle()
+        username = credentials.get("username")
+        with self._lock:
+            pool = self._pools.get(username)
+            if pool is None or pool.retired:
+                pool = CredentialPool(credentials)
+                self._pools[username] = pool
+        conn = pool.getconn()
+        with self._lock:
+            self._checked_out[id(conn)] = pool
+        return conn
+    
+    def putconn(self, conn) -> None:
+        """Return a connection to the pool it was checked out from"""
+        with self._lock:
+            pool = self._checked_out.pop(id(conn), None)
+        if pool is None:
+            conn.close()
+            return
+        pool.putconn(conn)
+    
+    def retire(self, username: str) -> None:
+        """Retire the pool for a credential that was rotated, revoked or expired"""
+        with self._lock:
+            pool = self._pools.pop(username, None)
+            if pool is not None:
+                self._retired += 1
+        if pool is not None:
+            pool.retire()
+            logger.info(f"Retired connection pool for {username}")
+    
+    def in_use(self, username: str) -> int:
+        """Number of connections checked out with a credential (held cursors included)"""
+        with self._lock:
+            pool = self._pools.get(username)
+        return pool.stats()["in_use"] if pool is not None else 0
+    
+    def close_idle(self) -> None:
+        """Reap idle connections and drop empty pools nobody has used for DB_POOL_IDLE_TIMEOUT"""
+        with self._lock:
+            pools = list(self._pools.items())
+        now = time.time()
+        for username, pool in pools:
+            pool.close_idle()
+            if pool.size == 0 and now - pool.last_used > DB_POOL_IDLE_TIMEOUT:
+                with self._lock:
+                    if self._pools.get(username) is pool:
+                        del self._pools[username]
+    
+    def close_all(self) -> None:
+        """Retire every pool (called on shutdown)"""
+        with self._lock:
+            pools = list(self._pools.values())
+            self._pools.clear()
+        for pool in pools:
+            pool.retire()
+    
+    def stats(self) -> dict:
+        with self._lock:
+            pools = list(self._pools.values())
+            retired = self._retired
+        pool_stats = [pool.stats() for pool in pools]
+        return {
+            "config": {
+                "min_size": DB_POOL_MIN_SIZE,
+                "max_size": DB_POOL_MAX_SIZE,
+                "idle_timeout": DB_POOL_IDLE_TIMEOUT,
+                "timeout": DB_POOL_TIMEOUT
+            },
+            "pools": pool_stats,
+            "total_connections": sum(p["size"] for p in pool_stats),
+            "total_in_use": sum(p["in_use"] for p in pool_stats),
+            "retired_pools": retired
+        }
+
+
+db_pools = ConnectionPoolManager()
 
 
 def get_db_connection(credentials: dict):
-    """Create PostgreSQL connection using credentials"""
-    conn = psycopg2.connect(
-        host=credentials.get("host", POSTGRES_HOST),
-        port=int(credentials.get("port", POSTGRES_PORT)),
-        database=credentials.get("database", "mcp_demo"),
-        user=credentials.get("username", "postgres"),
-        password=credentials.get("password", "postgres123")
-    )
-    return conn
+    """Check out a pooled PostgreSQL connection for the credentials"""
+    with metrics.phase("db_connect"):
+        return db_pools.getconn(credentials)
+
+
+def release_db_connection(conn) -> None:
+    """Return a connection obtained from get_db_connection to its pool"""
+    db_pools.putconn(conn)
+
+
+# Blocking psycopg2 work runs on a bounded thread pool so slow queries never stall the event loop
+db_executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="db")
+# Database work beyond the executor's threads waits for a "postgres" admission slot instead of queueing unboundedly
+admission.set_upstream_limit("postgres", int(os.getenv("UPSTREAM_MAX_CONCURRENCY_POSTGRES", str(DB_EXECUTOR_WORKERS))))
+# Per-user caps on concurrent database work: entity name -> [semaphore, holders + waiters],
+# dropped when the count returns to zero
+_user_db_semaphores: Dict[str, list] = {}
+
+
+def _drop_user_db_slot(entity_name: str, user: list) -> None:
+    user[1] -= 1
+    if user[1] == 0 and _user_db_semaphores.get(entity_name) is user:
+        del _user_db_semaphores[entity_name]
+
+
+async def run_db(entity_name: str, func, *args):
+    """Run blocking database work on the executor, at most DB_MAX_CONCURRENCY_PER_USER per user
+    and UPSTREAM_MAX_CONCURRENCY_POSTGRES in total
+    
+    The user's slot is held until the worker thread finishes, even if the caller is cancelled.
+    """
+    user = _user_db_semaphores.get(entity_name)
+    if user is None:
+        user = _user_db_semaphores[entity_name] = [asyncio.Semaphore(DB_MAX_CONCURRENCY_PER_USER), 0]
+    semaphore = user[0]
+    user[1] += 1
+    try:
+        await semaphore.acquire()
+    except BaseException:
+        _drop_user_db_slot(entity_name, user)
+        raise
+    try:
+        # Server-wide database slot; a request that cannot get one in time is shed with 429
+        await admission.acquire_upstream("postgres")
+    except BaseException:
+        semaphore.release()
+        _drop_user_db_slot(entity_name, user)
+        raise
+    # Ended when the worker finishes; the worker's spans (connection checkout, ...) are its children
+    span = tracer.start_span("db_execute", kind=SpanKind.CLIENT,
+                             attributes={"db.system": "postgresql", "db.user": entity_name})
+    try:
+        # Copy the context so the worker sees per-call settings such as the output format
+        with trace.use_span(span):
+            context = copy_context()
+        submitted = time.perf_counter()
+        future = asyncio.get_running_loop().run_in_executor(db_executor, functools.partial(context.run, func, *args))
+    except Exception:
+        span.end()
+        admission.release_upstream("postgres")
+        semaphore.release()
+        _drop_user_db_slot(entity_name, user)
+        raise
+    
+    def _release(f: asyncio.Future) -> None:
+        admission.release_upstream("postgres")
+        semaphore.release()
+        _drop_user_db_slot(entity_name, user)
+        # Executor queueing plus the work itself (connection checkout, query, serialization)
+        outcome = "ok" if not f.cancelled() and f.exception() is None else "error"
+        metrics.observe("db_execute", time.perf_counter() - submitted, outcome)
+        if outcome == "error":
+            span.set_status(Status(StatusCode.ERROR))
+        span.end()
+        if not f.cancelled():
+            # Mark the exception as retrieved when the caller has gone away
+            f.exception()
+    
+    future.add_done_callback(_release)
+    return await asyncio.shield(future)
+
+
+class QueryCanceller:
+    """Lets the event loop cancel the statement a worker thread is running on a connection"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._conn = None
+        self.cancelled = False
+    
+    def attach(self, conn) -> None:
+        with self._lock:
+            if self.cancelled:
+                raise ValueError("Query cancelled")
+            self._conn = conn
+    
+    def detach(self) -> None:
+        """Call before the connection goes back to its pool so a late cancel cannot hit another query"""
+        with self._lock:
+            self._conn = None
+    
+    def cancel(self) -> None:
+        with self._lock:
+            self.cancelled = True
+            if self._conn is not None:
+                try:
+                    # Sends a cancel request to the backend; the worker sees QueryCanceled
+                    self._conn.cancel()
+                except Exception as e:
+                    logger.warning(f"Failed to cancel query: {e}")
+
+
+def resolve_statement_timeout(timeout_seconds: Optional[float]) -> float:
+    """Per-call timeout, defaulting to QUERY_STATEMENT_TIMEOUT and capped at QUERY_MAX_STATEMENT_TIMEOUT"""
+    if not timeout_seconds:
+        return QUERY_STATEMENT_TIMEOUT
+    return min(max(float(timeout_seconds), 0.001), QUERY_MAX_STATEMENT_TIMEOUT)
+
+
+def _prepare_statement(conn, query: str, timeout: float) -> None:
+    """Apply statement_timeout to the current transaction and run the EXPLAIN cost guard"""
+    with conn.cursor() as cursor:
+        cursor.execute("SET LOCAL statement_timeout = %s", (int(timeout * 1000),))
+        if QUERY_MAX_PLAN_COST > 0 and query.strip().upper().startswith(('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')):
+            cursor.execute("EXPLAIN (FORMAT JSON) " + query)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            cost = plan[0]["Plan"]["Total Cost"]
+            if cost > QUERY_MAX_PLAN_COST:
+                raise ValueError(
+                    f"Query rejected: estimated cost {cost:.0f} exceeds the limit of {QUERY_MAX_PLAN_COST:.0f}. "
+                    "Add filters or a LIMIT, or use page_size."
+                )
+
+
+def _is_plain_select(query: str) -> bool:
+    """Whether a query can run as DECLARE ... CURSOR: a single read-only SELECT (or WITH ... SELECT)
+    
+    Data-modifying WITH, SELECT ... INTO and several statements in one string cannot.
+    The check is conservative (keywords inside literals count too); anything it rejects still
+    runs on a client-side cursor.
+    """
+    statement = query.strip().rstrip(";").strip()
+    upper = statement.upper()
+    if ";" in statement or re.search(r"\bINTO\b", upper):
+        return False
+    if upper.startswith("SELECT"):
+        return True
+    return upper.startswith("WITH") and not re.search(r"\b(INSERT|UPDATE|DELETE|MERGE)\b", upper)
 
 
 # Define tool functions
-async def _execute_query_impl(query: str) -> str:
-    """Execute a SQL query and return results."""
-    credentials = await get_credentials()
+def _run_query(conn, query: str, on_batch, timeout: float = QUERY_STATEMENT_TIMEOUT) -> dict:
+    """Run a SQL statement and return a summary
+    
+    Rows are handed to on_batch in QUERY_FETCH_BATCH_SIZE batches, stopping at QUERY_MAX_ROWS
+    rows or QUERY_MAX_BYTES of JSON; on_batch may return False to stop early. A plain SELECT is
+    read through a server-side (named) cursor so the result set stays in PostgreSQL; other
+    SELECT/WITH statements run on a client-side cursor and are committed.
+    """
+    _prepare_statement(conn, query, timeout)
+    if not query.strip().upper().startswith(('SELECT', 'WITH')):
+        with conn.cursor() as cursor:
+            cursor.execute(query)
+            conn.commit()
+            # May have been DDL; make the next schema lookup re-check the catalog version
+            schema_catalog.invalidate()
+            return {"message": "Query executed successfully", "rows_affected": cursor.rowcount}
+    
+    summary = {"row_count": 0, "truncated": False}
+    size = 0
+    server_side = _is_plain_select(query)
+    if server_side:
+        # Named cursor: the result set stays in PostgreSQL and is fetched batch by batch
+        cursor = conn.cursor(name=f"mcp_{uuid.uuid4().hex}", cursor_factory=RealDictCursor)
+    else:
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+    with cursor:
+        cursor.execute(query)
+        if not server_side and cursor.description is None:
+            # No result set (e.g. SELECT ... INTO, or a script ending in a modification)
+            conn.commit()
+            schema_catalog.invalidate()
+            return {"message": "Query executed successfully", "rows_affected": cursor.rowcount}
+        while not summary["truncated"]:
+            batch = cursor.fetchmany(QUERY_FETCH_BATCH_SIZE)
+            if not batch:
+                break
+            rows = []
+            for row in batch:
+                row = dict(row)
+                size += len(dump_json(row))
+                if summary["row_count"] >= QUERY_MAX_ROWS or size > QUERY_MAX_BYTES:
+                    summary["truncated"] = True
+                    break
+                rows.append(row)
+                summary["row_count"] += 1
+            if rows and on_batch(rows) is False:
+                break
+        if not server_side:
+            # Data-modifying WITH ... RETURNING and multi-statement strings are kept
+            conn.commit()
+            schema_catalog.invalidate()
+    return summary
+
+
+def _truncation_marker(summary: dict) -> dict:
+    return {
+        "truncated": True,
+        "row_count": summary["row_count"],
+        "max_rows": QUERY_MAX_ROWS,
+        "max_bytes": QUERY_MAX_BYTES
+    }
+
+
+def _execute_query_sync(credentials: dict, query: str, timeout: float, canceller: QueryCanceller) -> str:
+    """Execute a SQL query and return results. Runs on the database executor."""
     conn = get_db_connection(credentials)
     try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-            cursor.execute(query)
-            if query.strip().upper().startswith(('SELECT', 'WITH')):
-                results = cursor.fetchall()
-                # Convert to list of dicts for JSON serialization
-                return json.dumps([dict(row) for row in results], indent=2, default=str)
-            else:
-                conn.commit()
-                return json.dumps({"message": "Query executed successfully", "rows_affected": cursor.rowcount}, indent=2)
+        canceller.attach(conn)
+        rows = []
+        summary = _run_query(conn, query, rows.extend, timeout)
+        if "rows_affected" in summary:
+            return format_result(summary)
+        if summary["truncated"]:
+            return format_result({"rows": rows, **_truncation_marker(summary)})
+        return format_result(rows)
+    except ValueError:
+        conn.rollback()
+        raise
     except Exception as e:
         conn.rollback()
         raise ValueError(f"Database error: {str(e)}")
     finally:
-        conn.close()
+        canceller.detach()
+        release_db_connection(conn)
 
 
-async def _list_tables_impl() -> str:
-    """List all tables in the database."""
-    credentials = await get_credentials()
+def _stream_query_sync(credentials: dict, query: str, emit, timeout: float, canceller: QueryCanceller) -> dict:
+    """Execute a SQL query, passing row batches to emit. Runs on the database executor."""
     conn = get_db_connection(credentials)
     try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-            cursor.execute("""
-                SELECT table_name, table_schema
-                FROM information_schema.tables
-                WHERE table_schema NOT IN ('pg_catalog', 'information_schema')
-                ORDER BY table_schema, table_name
-            """)
-            results = cursor.fetchall()
-            return json.dumps([dict(row) for row in results], indent=2, default=str)
+        canceller.attach(conn)
+        return _run_query(conn, query, emit, timeout)
+    except ValueError:
+        conn.rollback()
+        raise
+    except Exception as e:
+        conn.rollback()
+        raise ValueError(f"Database error: {str(e)}")
+    finally:
+        canceller.detach()
+        release_db_connection(conn)
+
+
+class PagedCursorStore:
+    """Server-side cursors held open between paginated execute_query calls
+    
+    Entries are keyed by an opaque continuation token. Each one keeps its pooled connection
+    checked out with the transaction open and is bound to the entity and the Vault-issued
+    database username that opened it.
+    """
+    
+    def __init__(self):
+        self._entries: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._reaper: Optional[asyncio.Task] = None
+    
+    def start(self) -> None:
+        """Start closing expired cursors in the background (call from the app lifespan)"""
+        if self._reaper is None:
+            self._reaper = asyncio.create_task(self._reap_loop())
+    
+    async def stop(self) -> None:
+        """Stop the reaper and close every held cursor (called on shutdown)"""
+        if self._reaper is not None:
+            self._reaper.cancel()
+            try:
+                await self._reaper
+            except asyncio.CancelledError:
+                pass
+            self._reaper = None
+        self.close_all()
+    
+    async def _reap_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(QUERY_PAGE_CURSOR_SWEEP_INTERVAL)
+            try:
+                # Closing a cursor rolls back its transaction, which may block
+                await loop.run_in_executor(db_executor, self.close_expired)
+            except Exception as e:
+                logger.error(f"Error closing expired cursors: {e}")
+    
+    def open(self, credentials: dict, entity_name: str, query: str, page_size: int,
+             timeout: float = QUERY_STATEMENT_TIMEOUT) -> Tuple[str, dict]:
+        """Declare a cursor for the query and return (token, entry), claimed by the caller
+        
+        The statement_timeout is SET LOCAL, so it applies to every page fetched from the cursor.
+        """
+        self.close_expired()
+        self._close_oldest_for(entity_name)
+        conn = get_db_connection(credentials)
+        try:
+            _prepare_statement(conn, query, timeout)
+            cursor = conn.cursor(name=f"mcp_{uuid.uuid4().hex}", cursor_factory=RealDictCursor)
+            cursor.execute(query)
+        except Exception:
+            release_db_connection(conn)
+            raise
+        token = secrets.token_urlsafe(24)
+        entry = {
+            "entity_name": entity_name,
+            "username": credentials.get("username"),
+            "conn": conn,
+            "cursor": cursor,
+            "page_size": page_size,
+            "pending": deque(),
+            "exhausted": False,
+            "busy": True,
+            "last_used": time.time()
+        }
+        with self._lock:
+            self._entries[token] = entry
+        return token, entry
+    
+    def claim(self, token: str, credentials: dict, entity_name: str) -> dict:
+        """Claim the entry behind a continuation token for the calling user"""
+        self.close_expired()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry["entity_name"] != entity_name:
+                raise ValueError("Invalid or expired continuation token")
+            if entry["busy"]:
+                raise ValueError("Continuation token is already in use")
+            # A cursor opened with a replaced credential stays usable until its lease is revoked
+            rotated = (entry["username"] != credentials.get("username")
+                       and not vault_client.is_draining_db_username(entity_name, entry["username"]))
+            if not rotated:
+                entry["busy"] = True
+        if rotated:
+            self.close(token)
+            raise ValueError("Continuation token expired: the database credential was rotated")
+        return entry
+    
+    def release(self, token: str, entry: dict, finished: bool) -> None:
+        """Hand a claimed entry back, closing it when the result set is exhausted"""
+        with self._lock:
+            entry["busy"] = False
+            entry["last_used"] = time.time()
+        if finished:
+            self.close(token)
+    
+    def close(self, token: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        try:
+            entry["cursor"].close()
+        except Exception:
+            pass
+        # Rolls back the open transaction and returns the connection to its pool
+        release_db_connection(entry["conn"])
+    
+    def close_expired(self) -> None:
+        """Close cursors unused for QUERY_PAGE_CURSOR_TTL seconds"""
+        cutoff = time.time() - QUERY_PAGE_CURSOR_TTL
+        with self._lock:
+            expired = [t for t, e in self._entries.items() if not e["busy"] and e["last_used"] < cutoff]
+        for token in expired:
+            self.close(token)
+    
+    def _close_oldest_for(self, entity_name: str) -> None:
+        """Keep below QUERY_MAX_OPEN_CURSORS_PER_USER open cursors before opening another"""
+        with self._lock:
+            idle = sorted(
+                (e["last_used"], t) for t, e in self._entries.items()
+                if e["entity_name"] == entity_name and not e["busy"]
+            )
+            open_count = sum(1 for e in self._entries.values() if e["entity_name"] == entity_name)
+        for _, token in idle[:max(0, open_count - QUERY_MAX_OPEN_CURSORS_PER_USER + 1)]:
+            self.close(token)
+    
+    def close_all(self) -> None:
+        with self._lock:
+            tokens = list(self._entries)
+        for token in tokens:
+            self.close(token)
+
+
+paged_cursors = PagedCursorStore()
+
+
+def _fetch_page(entry: dict, page_size: int) -> Tuple[list, bool]:
+    """Fetch the next page from a held cursor; one extra row is read ahead to detect the end"""
+    pending = entry["pending"]
+    need = page_size + 1 - len(pending)
+    if need > 0 and not entry["exhausted"]:
+        batch = entry["cursor"].fetchmany(need)
+        if len(batch) < need:
+            entry["exhausted"] = True
+        pending.extend(dict(row) for row in batch)
+    
+    rows = []
+    size = 0
+    while pending and len(rows) < page_size:
+        row_size = len(dump_json(pending[0]))
+        # A page is also capped by QUERY_MAX_BYTES; the remaining rows go to the next page
+        if rows and size + row_size > QUERY_MAX_BYTES:
+            break
+        rows.append(pending.popleft())
+        size += row_size
+    return rows, bool(pending)
+
+
+def _execute_query_page_sync(credentials: dict, entity_name: str, query: Optional[str],
+                             page_size: Optional[int], continuation_token: Optional[str],
+                             timeout: float, canceller: QueryCanceller) -> str:
+    """Return one page of a SELECT, resuming from a continuation token. Runs on the database executor."""
+    if continuation_token:
+        token = continuation_token
+        entry = paged_cursors.claim(token, credentials, entity_name)
+    else:
+        if not _is_plain_select(query):
+            raise ValueError("Paginated mode only supports a single read-only SELECT/WITH query")
+        try:
+            token, entry = paged_cursors.open(credentials, entity_name, query, page_size, timeout)
+        except ValueError:
+            raise
+        except Exception as e:
+            raise ValueError(f"Database error: {str(e)}")
+    page_size = min(page_size or entry["page_size"], QUERY_MAX_ROWS)
+    
+    has_more = False
+    try:
+        canceller.attach(entry["conn"])
+        rows, has_more = _fetch_page(entry, page_size)
+    except ValueError:
+        raise
     except Exception as e:
         raise ValueError(f"Database error: {str(e)}")
     finally:
-        conn.close()
+        canceller.detach()
+        paged_cursors.release(token, entry, finished=not has_more)
+    return format_result({
+        "rows": rows,
+        "row_count": len(rows),
+        "has_more": has_more,
+        "continuation_token": token if has_more else None
+    })
+
+
+async def _execute_query_impl(query: Optional[str] = None, page_size: Optional[int] = None,
+                              continuation_token: Optional[str] = None,
+                              timeout_seconds: Optional[float] = None) -> str:
+    """Execute a SQL query and return results, one page at a time when page_size or continuation_token is given.
+    
+    If the caller is cancelled (e.g. the HTTP request was aborted) the backend query is cancelled too.
+    """
+    if not query and not continuation_token:
+        raise InvalidParams("Invalid arguments for execute_query: query or continuation_token is required")
+    credentials, entity_name = await get_credentials()
+    timeout = resolve_statement_timeout(timeout_seconds)
+    canceller = QueryCanceller()
+    try:
+        if page_size or continuation_token:
+            return await run_db(entity_name, _execute_query_page_sync, credentials, entity_name,
+                                query, page_size, continuation_token, timeout, canceller)
+        return await run_db(entity_name, _execute_query_sync, credentials, query, timeout, canceller)
+    except asyncio.CancelledError:
+        canceller.cancel()
+        raise
+
+
+async def cancel_on_disconnect(request: Request, awaitable) -> Tuple[bool, Any]:
+    """Await a tool call, cancelling it if the HTTP client disconnects first
+    
+    Returns (disconnected, result).
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=CLIENT_DISCONNECT_POLL_INTERVAL)
+            if done:
+                return False, task.result()
+            if await request.is_disconnected():
+                logger.info("Client disconnected, cancelling query")
+                task.cancel()
+                return True, None
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+async def stream_query_ndjson(credentials: dict, entity_name: str, query: str, request_id,
+                             timeout_seconds: Optional[float] = None,
+                             output_format: str = MCP_OUTPUT_FORMAT) -> AsyncIterator[str]:
+    """Stream execute_query results as NDJSON lines while rows are fetched
+    
+    Emits {"id", "rows": [...]} per batch ({"id", "columns", "rows"} in columnar format), then a final {"id", "done": true, ...} summary
+    (with the truncation marker when a cap was hit) or {"id", "error": {...}}.
+    Recorded like call_tool (tool latency and a tools/call span), plus the serialization phase.
+    """
+    loop = asyncio.get_running_loop()
+    columnar = output_format == "columnar"
+    queue: asyncio.Queue = asyncio.Queue(maxsize=QUERY_STREAM_QUEUE_SIZE)
+    end = object()
+    finished = asyncio.Event()
+    cancelled = threading.Event()
+    start = time.perf_counter()
+    outcome = "error"
+    serialization = 0.0
+    # Not made current across yields: the generator may resume in another context
+    span = tracer.start_span("tools/call execute_query", attributes={"mcp.tool.name": "execute_query", "mcp.stream": True})
+    
+    def emit(rows: list) -> bool:
+        # Blocks the worker thread while the client is behind, so memory stays bounded
+        if cancelled.is_set():
+            return False
+        asyncio.run_coroutine_threadsafe(queue.put(rows), loop).result()
+        return not cancelled.is_set()
+    
+    def on_done(_) -> None:
+        # Never blocks: if the queue is full the consumer sees `finished` once it has drained it
+        finished.set()
+        try:
+            queue.put_nowait(end)
+        except asyncio.QueueFull:
+            pass
+    
+    canceller = QueryCanceller()
+    with trace.use_span(span):
+        producer = asyncio.ensure_future(run_db(
+            entity_name, _stream_query_sync, credentials, query, emit,
+            resolve_statement_timeout(timeout_seconds), canceller
+        ))
+    producer.add_done_callback(on_done)
+    try:
+        while True:
+            if queue.empty() and finished.is_set():
+                break
+            item = await queue.get()
+            if item is end:
+                break
+            batch = {"rows": item}
+            if columnar:
+                batch = to_columnar(batch)
+            serialize_start = time.perf_counter()
+            line = dump_json({"id": request_id, **batch}) + "\n"
+            serialization += time.perf_counter() - serialize_start
+            yield line
+        
+        if producer.cancelled():
+            yield dump_json({"id": request_id, "error": {"code": -32603, "message": "Query cancelled"}}) + "\n"
+        elif producer.exception() is not None:
+            # Execution failures are internal errors; only argument validation is "Invalid params"
+            error = producer.exception()
+            code = -32602 if isinstance(error, InvalidParams) else -32603
+            yield dump_json({"id": request_id, "error": {"code": code, "message": str(error)}}) + "\n"
+        else:
+            summary = producer.result()
+            if summary.get("truncated"):
+                summary = _truncation_marker(summary)
+            outcome = "ok"
+            yield dump_json({"id": request_id, "done": True, **summary}) + "\n"
+    finally:
+        # Client went away (or we are done): stop the worker and unblock any pending put
+        cancelled.set()
+        if not producer.done():
+            canceller.cancel()
+        while not queue.empty():
+            queue.get_nowait()
+        if outcome == "error":
+            span.set_status(Status(StatusCode.ERROR))
+        span.end()
+        metrics.observe("serialization", serialization)
+        metrics.observe_tool("execute_query", outcome, time.perf_counter() - start)
+
+
+# Changes whenever a relation or column is created, altered, dropped or re-granted
+SCHEMA_VERSION_SQL = """
+    SELECT (SELECT count(*) FROM pg_class)::text
+        || ':' || (SELECT coalesce(max(xmin::text::bigint), 0) FROM pg_class)::text
+        || ':' || (SELECT coalesce(max(xmin::text::bigint), 0) FROM pg_attribute)::text
+"""
+
+# Every visible table and its columns in one round trip
+SCHEMA_CATALOG_SQL = """
+    SELECT
+        t.table_schema,
+        t.table_name,
+        c.column_name,
+        c.data_type,
+        c.character_maximum_length,
+        c.is_nullable,
+        c.column_default
+    FROM information_schema.tables t
+    LEFT JOIN information_schema.columns c
+        ON c.table_schema = t.table_schema AND c.table_name = t.table_name
+    WHERE t.table_schema NOT IN ('pg_catalog', 'information_schema')
+    ORDER BY t.table_schema, t.table_name, c.ordinal_position
+"""
+
+
+class SchemaCatalog:
+    """In-process cache of tables and columns, one snapshot per entity
+    
+    Snapshots are per entity because information_schema only shows what the role may access.
+    A cached snapshot is trusted for SCHEMA_CATALOG_CHECK_INTERVAL seconds; after that a cheap
+    pg_class/pg_attribute version check decides whether the catalog must be reloaded.
+    """
+    
+    def __init__(self):
+        self._entries: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+    
+    def get(self, credentials: dict, entity_name: str) -> dict:
+        """Return {"tables": [...], "columns": {table_name: [...]}} for the entity"""
+        with self._lock:
+            entry = self._entries.setdefault(entity_name, {
+                "lock": threading.Lock(),
+                "version": None,
+                "checked_at": 0.0,
+                "snapshot": None
+            })
+        # Concurrent callers for the same entity wait for one check/reload
+        with entry["lock"]:
+            if entry["snapshot"] is not None and time.time() - entry["checked_at"] < SCHEMA_CATALOG_CHECK_INTERVAL:
+                return entry["snapshot"]
+            conn = get_db_connection(credentials)
+            try:
+                with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                    cursor.execute(SCHEMA_VERSION_SQL)
+                    version = list(cursor.fetchone().values())[0]
+                    if entry["snapshot"] is None or version != entry["version"]:
+                        cursor.execute(SCHEMA_CATALOG_SQL)
+                        entry["snapshot"] = self._build(cursor.fetchall())
+                        entry["version"] = version
+                        logger.info(f"Loaded schema catalog for {entity_name}: {len(entry['snapshot']['tables'])} tables")
+                conn.rollback()
+            finally:
+                release_db_connection(conn)
+            entry["checked_at"] = time.time()
+            return entry["snapshot"]
+    
+    @staticmethod
+    def _build(rows: list) -> dict:
+        tables = []
+        columns: Dict[str, list] = {}
+        for row in rows:
+            table = {"table_name": row["table_name"], "table_schema": row["table_schema"]}
+            if not tables or tables[-1] != table:
+                tables.append(table)
+            if row["column_name"] is not None:
+                columns.setdefault(row["table_name"], []).append({
+                    "column_name": row["column_name"],
+                    "data_type": row["data_type"],
+                    "character_maximum_length": row["character_maximum_length"],
+                    "is_nullable": row["is_nullable"],
+                    "column_default": row["column_default"]
+                })
+        return {"tables": tables, "columns": columns}
+    
+    def invalidate(self) -> None:
+        """Force a version check on the next lookup for every entity (e.g. after a write or DDL)"""
+        with self._lock:
+            for entry in self._entries.values():
+                entry["checked_at"] = 0.0
+
+
+schema_catalog = SchemaCatalog()
+
+
+def _list_tables_sync(credentials: dict, entity_name: str) -> str:
+    """List all tables in the database. Runs on the database executor."""
+    try:
+        catalog = schema_catalog.get(credentials, entity_name)
+    except Exception as e:
+        raise ValueError(f"Database error: {str(e)}")
+    return format_result(catalog["tables"])
+
+
+async def _list_tables_impl() -> str:
+    """List all tables in the database."""
+    credentials, entity_name = await get_credentials()
+    return await run_db(entity_name, _list_tables_sync, credentials, entity_name)
+
+
+def _describe_table_sync(credentials: dict, entity_name: str, table_name: str) -> str:
+    """Describe the schema of a specific table. Runs on the database executor."""
+    try:
+        catalog = schema_catalog.get(credentials, entity_name)
+    except Exception as e:
+        raise ValueError(f"Database error: {str(e)}")
+    columns = catalog["columns"].get(table_name)
+    if not columns:
+        raise ValueError(f"Database error: Table '{table_name}' not found")
+    return format_result(columns)
 
 
 async def _describe_table_impl(table_name: str) -> str:
     """Describe the schema of a specific table."""
-    credentials = await get_credentials()
-    conn = get_db_connection(credentials)
+    credentials, entity_name = await get_credentials()
+    return await run_db(entity_name, _describe_table_sync, credentials, entity_name, table_name)
+
+
+def _describe_tables_sync(credentials: dict, entity_name: str, table_names: List[str]) -> str:
+    """Describe several tables from one catalog lookup. Runs on the database executor."""
     try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-            cursor.execute("""
-                SELECT 
-                    column_name,
-                    data_type,
-                    character_maximum_length,
-                    is_nullable,
-                    column_default
-                FROM information_schema.columns
-                WHERE table_name = %s
-                ORDER BY ordinal_position
-            """, (table_name,))
-            results = cursor.fetchall()
-            if not results:
-                raise ValueError(f"Table '{table_name}' not found")
-            return json.dumps([dict(row) for row in results], indent=2, default=str)
+        catalog = schema_catalog.get(credentials, entity_name)
     except Exception as e:
         raise ValueError(f"Database error: {str(e)}")
-    finally:
-        conn.close()
+    tables = {}
+    not_found = []
+    for table_name in table_names:
+        if table_name in catalog["columns"]:
+            tables[table_name] = catalog["columns"][table_name]
+        else:
+            not_found.append(table_name)
+    return format_result({"tables": tables, "not_found": not_found})
+
+
+async def _describe_tables_impl(table_names: List[str]) -> str:
+    """Describe the schemas of several tables in one call."""
+    if not table_names:
+        raise ValueError("table_names must list at least one table")
+    credentials, entity_name = await get_credentials()
+    return await run_db(entity_name, _describe_tables_sync, credentials, entity_name, list(table_names))
 
 
 # Register with FastMCP
 @mcp.tool()
-async def execute_query(query: str) -> str:
+async def execute_query(
+    query: Annotated[Optional[str], Field(description="SQL query to execute (omit when resuming with continuation_token)")] = None,
+    page_size: Annotated[Optional[int], Field(description="Return at most this many rows plus a continuation_token for the rest")] = None,
+    continuation_token: Annotated[Optional[str], Field(description="Token from a previous page; resumes that query (query is ignored)")] = None,
+    timeout_seconds: Annotated[Optional[float], Field(description="Statement timeout for this call (defaults to the server setting)")] = None
+) -> str:
     """Execute a SQL query and return results. Use SELECT for queries, INSERT/UPDATE/DELETE for modifications."""
-    return await _execute_query_impl(query)
+    return await _execute_query_impl(query, page_size, continuation_token, timeout_seconds)
 
 
 @mcp.tool()
@@ -300,15 +1888,46 @@ async def list_tables() -> str:
 
 
 @mcp.tool()
-async def describe_table(table_name: str) -> str:
+async def describe_table(table_name: Annotated[str, Field(description="Name of the table to describe")]) -> str:
     """Describe the schema of a specific table. Returns column names, types, and constraints."""
     return await _describe_table_impl(table_name)
 
 
+@mcp.tool()
+async def describe_tables(table_names: Annotated[List[str], Field(description="Names of the tables to describe")]) -> str:
+    """Describe the schemas of several tables in one call. Returns columns per table and any names not found."""
+    return await _describe_tables_impl(table_names)
+
+
+# Index the registered tools for /sse; loaded at startup
+tool_registry = ToolRegistry()
+
+
 # Create FastAPI app for custom endpoints
 from fastapi import FastAPI
 
-app = FastAPI(title="PostgreSQL MCP Server")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Index tools and open shared upstream HTTP clients on startup; revoke cached Vault tokens and close the clients on shutdown"""
+    await tool_registry.load(mcp)
+    admission.start()
+    vault_client.start()
+    paged_cursors.start()
+    get_http_client("vault")
+    yield
+    # Held cursors go first, so their connections are back before the leases are revoked
+    await paged_cursors.stop()
+    await vault_client.close()
+    db_executor.shutdown(wait=False, cancel_futures=True)
+    db_pools.close_all()
+    await admission.stop()
+    await close_http_clients()
+    if tracer_provider is not None:
+        tracer_provider.shutdown()
+
+
+app = FastAPI(title="PostgreSQL MCP Server", lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -320,15 +1939,61 @@ app.add_middleware(
 )
 
 
+def overloaded_response(error: Overloaded) -> JSONResponse:
+    """429 for a shed request, in JSON-RPC error form"""
+    return JSONResponse(
+        status_code=429,
+        content={"jsonrpc": "2.0", "id": None, "error": {"code": -32000, "message": str(error)}},
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+
+class _AdmittedResponse:
+    """Response that holds its admission slot until it has been sent, or the client has gone"""
+
+    def __init__(self, response: Response, slot: AsyncExitStack):
+        self._response = response
+        self._slot = slot
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await self._response(scope, receive, send)
+        finally:
+            await self._slot.aclose()
+
+
+async def call_admitted(request: Request, call_next):
+    """Run the request under admission control, keyed by the caller's JWT subject"""
+    claims = getattr(request.state, "jwt_claims", None) or {}
+    user_key = claims.get("sub") or (request.client.host if request.client else "anonymous")
+    slot = AsyncExitStack()
+    try:
+        await slot.enter_async_context(admission.admit(user_key))
+    except Overloaded as e:
+        return overloaded_response(e)
+    try:
+        response = await call_next(request)
+    except BaseException:
+        await slot.aclose()
+        raise
+    # call_next returns as soon as the headers are ready; a streamed query keeps the
+    # connection and its database work busy until the last body chunk, so hold the slot until then
+    return _AdmittedResponse(response, slot)
+
+
 async def auth_middleware(request: Request, call_next):
     """Middleware to extract JWT token from Authorization header"""
     # Skip authentication for health and debug endpoints
-    if request.url.path in ["/health", "/debug/credentials"]:
+    if request.url.path in ["/health", "/metrics", "/debug/pools", "/debug/admission"]:
         return await call_next(request)
     
     authorization = request.headers.get("Authorization", "")
     if authorization.startswith("Bearer "):
         token = authorization[7:]
+        # Reject bad tokens locally before they cost a Vault login
+        rejection = await verify_request_jwt(request, token)
+        if rejection is not None:
+            return rejection
         user_jwt_context.set(token)
     else:
         # For SSE endpoint, try to get token from query params or header
@@ -336,18 +2001,66 @@ async def auth_middleware(request: Request, call_next):
             # Allow SSE without auth for now (will be handled in endpoint)
             pass
     
-    response = await call_next(request)
-    return response
+    return await call_admitted(request, call_next)
 
 
 app.middleware("http")(auth_middleware)
 
 
+def route_label(request: Request) -> str:
+    """The request path if it is one of the app's routes, else "other" (bounds label cardinality)"""
+    path = request.url.path
+    return path if any(getattr(r, "path", None) == path for r in app.routes) else "other"
+
+
+# Registered after auth_middleware so it wraps it and also sees rejected requests
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    """Count requests and record their latency per route"""
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        metrics.observe_request(request.method, route_label(request), status_code, time.perf_counter() - start)
+
+
+# Registered last so it is outermost: auth, admission and the handler all run inside the request's span
+@app.middleware("http")
+async def tracing_middleware(request: Request, call_next):
+    """Continue the caller's W3C trace context (traceparent) in a server span for the request"""
+    with server_span(request.method, route_label(request), request.headers) as span:
+        response = await call_next(request)
+        set_status_code(span, response.status_code)
+        return response
+
+
 @app.get("/health")
 async def health():
     return {"status": "healthy", "service": "postgresql-mcp-server"}
 
 
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus metrics: request, tool and per-phase latency histograms, cache and admission counters"""
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+
+@app.get("/debug/pools")
+async def debug_pools():
+    """Connection pool statistics for sizing DB_POOL_* settings"""
+    return JSONResponse(content=db_pools.stats())
+
+
+@app.get("/debug/admission")
+async def debug_admission():
+    """Admission control counters: in-flight, queued and shed requests, loop lag and upstream slots"""
+    return JSONResponse(content=admission.stats())
+
+
 @app.get("/debug/credentials")
 async def debug_credentials(request: Request):
     """Debug endpoint to get current user's credentials and auth trace"""
@@ -361,7 +2074,6 @@ async def debug_credentials(request: Request):
         )
     
     user_id, user_info = extract_user_id_from_jwt(user_jwt)
-    vault_auth_info = await vault_client.get_vault_auth_info(user_jwt)
     
     jwt_details = {
         "sub": user_info.get("sub"),
@@ -369,53 +2081,41 @@ async def debug_credentials(request: Request):
         "email": user_info.get("email")
     }
     
-    # Get credentials with error handling
-    entity_name = None
+    # One login (or the cached session); the token lookup, entity lookup and role read then
+    # run concurrently. Reading the role checks access without minting a database credential.
+    masked_creds = None
+    secret_exists = False
+    secret_error = None
     try:
-        credentials, entity_name = await vault_client.get_credentials(user_jwt)
-        secret_exists = True
-        secret_error = None
-        # Mask sensitive data
-        masked_creds = {
-            "host": credentials.get("host", ""),
-            "port": credentials.get("port", ""),
-            "database": credentials.get("database", ""),
-            "username": credentials.get("username", ""),
-            "password": "***" + credentials.get("password", "")[-4:] if credentials.get("password") else ""
-        }
-    except ValueError as e:
-        if "Database role not found" in str(e) or "not found" in str(e).lower():
-            credentials = None
-            secret_exists = False
-            secret_error = "Database role not found"
-            masked_creds = None
-            # Extract entity_name from error message
-            if "role not found:" in str(e):
-                try:
-                    parts = str(e).split("role not found: ")
-                    if len(parts) > 1:
-                        entity_name = parts[1].strip()
-                except:
-                    pass
-            if not entity_name:
-                if vault_auth_info and vault_auth_info.get("entity_name"):
-                    entity_name = vault_auth_info.get("entity_name")
-                else:
-                    entity_name = user_info.get("preferred_username", user_id)
-        else:
-            raise
+        trace = await vault_client.trace(user_jwt, "database/roles/{entity_name}")
     except Exception as e:
-        credentials = None
-        secret_exists = False
+        trace = None
+        vault_auth_info = None
         secret_error = str(e)
-        masked_creds = None
-        if vault_auth_info and vault_auth_info.get("entity_name"):
-            entity_name = vault_auth_info.get("entity_name")
-        else:
-            entity_name = user_info.get("preferred_username", user_id)
-    
-    if not entity_name:
         entity_name = user_info.get("preferred_username", user_id)
+    else:
+        vault_auth_info = vault_client.auth_info(trace["session"])
+        entity_name = trace["session"]["entity_name"]
+        role_response = trace["secret_response"]
+        if isinstance(role_response, BaseException):
+            secret_error = str(role_response)
+        elif role_response.status_code == 404:
+            secret_error = "Database role not found"
+        elif role_response.status_code != 200:
+            secret_error = f"Vault returned {role_response.status_code}: {role_response.text[:200]}"
+        else:
+            secret_exists = True
+            # Only credentials this server already holds are shown; none are generated here
+            credentials = vault_client.cached_db_credentials(entity_name)
+            if credentials:
+                # Mask sensitive data
+                masked_creds = {
+                    "host": credentials.get("host", ""),
+                    "port": credentials.get("port", ""),
+                    "database": credentials.get("database", ""),
+                    "username": credentials.get("username", ""),
+                    "password": "***" + credentials.get("password", "")[-4:] if credentials.get("password") else ""
+                }
     
     return JSONResponse(content={
         "user_id": user_id,
@@ -425,13 +2125,41 @@ async def debug_credentials(request: Request):
         "jwt_details": jwt_details,
         "vault_auth_info": vault_auth_info,
         "secret_exists": secret_exists,
-        "secret_error": secret_error
+        "secret_error": secret_error,
+        "vault_session_cached": trace["session_cached"] if trace else False,
+        "timings": trace["timings"] if trace else {}
     })
 
 
+async def call_tool(name: str, arguments: Optional[dict]) -> Any:
+    """Dispatch a tools/call through the registry, recording its latency and a span"""
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        with tracer.start_as_current_span(f"tools/call {name}", attributes={"mcp.tool.name": name}):
+            result = await tool_registry.call(name, arguments)
+        outcome = "ok"
+        return result
+    finally:
+        metrics.observe_tool(name, outcome, time.perf_counter() - start)
+
+
+def tools_list_response(request: Request, request_id) -> Response:
+    """tools/list from the registry's pre-serialized result; 304 when the client's ETag still matches"""
+    headers = {"ETag": tool_registry.etag}
+    if tool_registry.etag_matches(request.headers.get("If-None-Match")):
+        return Response(status_code=304, headers=headers)
+    return compress_response(request, tool_registry.list_response_body(request_id), headers=headers)
+
+
 @app.post("/sse")
 async def sse_endpoint(request: Request):
-    """SSE endpoint for backward compatibility"""
+    """SSE endpoint for backward compatibility
+    
+    Accepts a single JSON-RPC request or a batch (array). A single tools/call for execute_query
+    with "stream": true in params returns the rows as NDJSON batches (application/x-ndjson)
+    instead of a JSON-RPC response.
+    """
     # Extract JWT token
     authorization = request.headers.get("Authorization", "")
     if authorization.startswith("Bearer "):
@@ -452,98 +2180,143 @@ async def sse_endpoint(request: Request):
             content={"jsonrpc": "2.0", "id": body.get("id"), "error": {"code": -32700, "message": "Invalid JSON in request body"}}
         )
     
-    # Handle MCP protocol
+    if isinstance(body, list):
+        return await handle_rpc_batch(request, body)
+    content, status_code = await handle_rpc(request, body)
+    if isinstance(content, Response):
+        return content
+    return encode_response(request, content, status_code)
+
+
+async def handle_rpc(request: Request, body: dict, in_batch: bool = False) -> Tuple[Any, int]:
+    """Handle one JSON-RPC request and return (response, HTTP status)
+    
+    The response is a Response instead of a dict for a single tools/list, streamed results
+    and aborted requests.
+    """
     method = body.get("method", "")
     params = body.get("params", {})
     
     try:
         if method == "tools/list":
-            tools = [
-                {
-                    "name": "execute_query",
-                    "description": "Execute a SQL query and return results. Use SELECT for queries, INSERT/UPDATE/DELETE for modifications.",
-                    "inputSchema": {
-                        "type": "object",
-                        "properties": {
-                            "query": {
-                                "type": "string",
-                                "description": "SQL query to execute"
-                            }
-                        },
-                        "required": ["query"]
-                    }
-                },
-                {
-                    "name": "list_tables",
-                    "description": "List all tables in the database.",
-                    "inputSchema": {
-                        "type": "object",
-                        "properties": {}
-                    }
-                },
-                {
-                    "name": "describe_table",
-                    "description": "Describe the schema of a specific table. Returns column names, types, and constraints.",
-                    "inputSchema": {
-                        "type": "object",
-                        "properties": {
-                            "table_name": {
-                                "type": "string",
-                                "description": "Name of the table to describe"
-                            }
-                        },
-                        "required": ["table_name"]
-                    }
-                }
-            ]
-            return JSONResponse(content={
-                "jsonrpc": "2.0",
-                "id": body.get("id"),
-                "result": {"tools": tools}
-            })
+            if in_batch:
+                return {"jsonrpc": "2.0", "id": body.get("id"), "result": {"tools": tool_registry.tools}}, 200
+            return tools_list_response(request, body.get("id")), 200
         
         elif method == "tools/call":
             tool_name = params.get("name", "")
             tool_args = params.get("arguments", {})
+
+            # Per-call override of the tool output format
+            output_format = params.get("format")
+            if output_format:
+                if output_format not in OUTPUT_FORMATS:
+                    return {
+                        "jsonrpc": "2.0",
+                        "id": body.get("id"),
+                        "error": {"code": -32602, "message": f"Unknown format: {output_format}. Use one of {', '.join(OUTPUT_FORMATS)}"}
+                    }, 400
+                output_format_context.set(output_format)
             
             try:
-                if tool_name == "execute_query":
-                    result = await _execute_query_impl(tool_args.get("query", ""))
-                elif tool_name == "list_tables":
-                    result = await _list_tables_impl()
-                elif tool_name == "describe_table":
-                    result = await _describe_table_impl(tool_args.get("table_name", ""))
+                if tool_name == "execute_query" and params.get("stream"):
+                    if in_batch:
+                        raise ValueError("stream is not supported in batch requests")
+                    # Stream rows back as NDJSON instead of buffering the whole result
+                    stream_args = tool_registry.validate(tool_name, tool_args)
+                    if not stream_args["query"]:
+                        raise InvalidParams("Invalid arguments for execute_query: query is required when streaming")
+                    credentials, entity_name = await get_credentials()
+                    return StreamingResponse(
+                        stream_query_ndjson(credentials, entity_name, stream_args["query"], body.get("id"),
+                                            stream_args["timeout_seconds"], output_format_context.get()),
+                        media_type="application/x-ndjson"
+                    ), 200
+                elif tool_name == "execute_query":
+                    # Cancel the backend query if the client gives up before it finishes
+                    disconnected, result = await cancel_on_disconnect(request, call_tool(tool_name, tool_args))
+                    if disconnected:
+                        return Response(status_code=499), 499
+                elif tool_name in tool_registry:
+                    # O(1) dispatch to the FastMCP-registered tool function
+                    result = await call_tool(tool_name, tool_args)
                 else:
-                    return JSONResponse(content={
+                    return {
                         "jsonrpc": "2.0",
                         "id": body.get("id"),
                         "error": {"code": -32601, "message": f"Unknown tool: {tool_name}"}
-                    }, status_code=400)
+                    }, 400
                 
-                return JSONResponse(content={
+                return {
                     "jsonrpc": "2.0",
                     "id": body.get("id"),
                     "result": {"content": [{"type": "text", "text": result}]}
-                })
+                }, 200
             except ValueError as e:
-                return JSONResponse(content={
+                return {
                     "jsonrpc": "2.0",
                     "id": body.get("id"),
                     "error": {"code": -32602, "message": str(e)}
-                }, status_code=400)
+                }, 400
         else:
-            return JSONResponse(content={
+            return {
                 "jsonrpc": "2.0",
                 "id": body.get("id"),
                 "error": {"code": -32601, "message": f"Unknown method: {method}"}
-            }, status_code=400)
+            }, 400
+    except Overloaded as e:
+        if not in_batch:
+            raise
+        return {"jsonrpc": "2.0", "id": body.get("id"), "error": {"code": -32000, "message": str(e)}}, 429
     except Exception as e:
         logger.error(f"Error handling request: {e}")
-        return JSONResponse(content={
+        return {
             "jsonrpc": "2.0",
             "id": body.get("id"),
             "error": {"code": -32603, "message": f"Internal server error: {str(e)}"}
-        }, status_code=500)
+        }, 500
+
+
+async def handle_rpc_batch(request: Request, messages: list) -> Response:
+    """Handle a JSON-RPC batch
+    
+    Entries run concurrently, at most RPC_BATCH_CONCURRENCY at a time, and responses come back
+    in request order. Credentials are resolved once and shared by every tools/call in the batch.
+    """
+    if not messages or len(messages) > RPC_MAX_BATCH_SIZE:
+        message = "empty batch" if not messages else f"batch exceeds {RPC_MAX_BATCH_SIZE} entries"
+        return JSONResponse(content={
+            "jsonrpc": "2.0",
+            "id": None,
+            "error": {"code": -32600, "message": f"Invalid Request: {message}"}
+        }, status_code=400)
+    
+    if any(isinstance(m, dict) and m.get("method") == "tools/call" for m in messages):
+        try:
+            request_credentials_context.set(await get_credentials())
+        except Exception as e:
+            # Leave it to each call to report the failure
+            logger.warning(f"Could not resolve credentials for batch: {e}")
+    
+    semaphore = asyncio.Semaphore(RPC_BATCH_CONCURRENCY)
+    
+    async def run(message) -> dict:
+        if not isinstance(message, dict):
+            return {"jsonrpc": "2.0", "id": None, "error": {"code": -32600, "message": "Invalid Request"}}
+        async with semaphore:
+            content, _ = await handle_rpc(request, message, in_batch=True)
+        if isinstance(content, Response):
+            # The client went away mid-batch
+            return {"jsonrpc": "2.0", "id": message.get("id"), "error": {"code": -32603, "message": "Client disconnected"}}
+        return content
+    
+    # gather runs each entry in its own task, so per-call context (e.g. output format) stays separate
+    responses = await asyncio.gather(*(run(m) for m in messages))
+    # Notifications (no "id") get no response
+    responses = [r for m, r in zip(messages, responses) if not isinstance(m, dict) or "id" in m]
+    if not responses:
+        return Response(status_code=204)
+    return encode_response(request, responses)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,238 @@
+"""
+Admission control shared by the MCP servers
+
+Bounds how much work the server accepts so that bursts degrade into 429s instead of
+unbounded Vault logins, downstream calls and database connections:
+
+- a global cap on in-flight requests and a per-user cap, with excess requests waiting in
+  a bounded queue for at most queue_timeout seconds;
+- shedding of new requests when the queue is full or the event loop lags behind;
+- per-upstream concurrency limits, applied to the shared HTTP clients via LimitedTransport.
+
+Rejections raise Overloaded, which the servers turn into 429 with Retry-After.
+"""
+import time
+import asyncio
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+import httpx
+
+
+class Overloaded(Exception):
+    """The request was shed; retry after retry_after seconds"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Server overloaded ({reason}), retry after {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Global / per-user in-flight limits, bounded queueing, loop-lag shedding and upstream limits"""
+
+    def __init__(self, max_in_flight: int = 64, max_per_user: int = 8, max_queue: int = 128,
+                 queue_timeout: float = 5.0, max_loop_lag: float = 0.5, retry_after: int = 1,
+                 upstream_limit: int = 32, lag_interval: float = 0.1):
+        self.max_in_flight = max_in_flight
+        self.max_per_user = max_per_user
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_loop_lag = max_loop_lag
+        self.retry_after = retry_after
+        self.upstream_limit = upstream_limit
+        self.lag_interval = lag_interval
+        self._global = asyncio.Semaphore(max_in_flight)
+        # user key -> [semaphore, holders + waiters]; dropped when nobody references it
+        self._users: Dict[str, list] = {}
+        self._upstreams: Dict[str, asyncio.Semaphore] = {}
+        self._upstream_limits: Dict[str, int] = {}
+        self.in_flight = 0
+        self.queued = 0
+        self.upstream_in_flight: Counter = Counter()
+        self.upstream_queued: Counter = Counter()
+        self.admitted = 0
+        self.shed: Counter = Counter()
+        self.loop_lag = 0.0
+        self._monitor: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Start sampling event loop lag (call from the app lifespan)"""
+        if self._monitor is None:
+            self._monitor = asyncio.create_task(self._monitor_loop_lag())
+
+    async def stop(self) -> None:
+        if self._monitor is not None:
+            self._monitor.cancel()
+            try:
+                await self._monitor
+            except asyncio.CancelledError:
+                pass
+            self._monitor = None
+
+    async def _monitor_loop_lag(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.lag_interval
+            await asyncio.sleep(self.lag_interval)
+            # How late the loop woke us up: time spent behind other callbacks
+            self.loop_lag = max(0.0, loop.time() - expected)
+
+    def _reject(self, reason: str) -> Overloaded:
+        self.shed[reason] += 1
+        return Overloaded(reason, self.retry_after)
+
+    @asynccontextmanager
+    async def admit(self, user_key: str):
+        """Hold a global and a per-user slot for the duration of a request, or raise Overloaded"""
+        if self.max_loop_lag and self.loop_lag > self.max_loop_lag:
+            raise self._reject("loop_lag")
+        user = self._users.get(user_key)
+        if user is None:
+            user = self._users[user_key] = [asyncio.Semaphore(self.max_per_user), 0]
+        must_wait = user[0].locked() or self._global.locked()
+        if must_wait and self.queued >= self.max_queue:
+            raise self._reject("queue_full")
+
+        user[1] += 1
+        acquired = []
+        self.queued += 1
+        try:
+            deadline = time.monotonic() + self.queue_timeout
+            for semaphore, reason in ((user[0], "user_limit"), (self._global, "queue_timeout")):
+                try:
+                    await asyncio.wait_for(semaphore.acquire(), max(0.0, deadline - time.monotonic()))
+                except asyncio.TimeoutError:
+                    raise self._reject(reason)
+                acquired.append(semaphore)
+        except BaseException:
+            self.queued -= 1
+            for semaphore in acquired:
+                semaphore.release()
+            self._drop_user(user_key, user)
+            raise
+        self.queued -= 1
+
+        self.in_flight += 1
+        self.admitted += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            for semaphore in acquired:
+                semaphore.release()
+            self._drop_user(user_key, user)
+
+    def _drop_user(self, user_key: str, user: list) -> None:
+        user[1] -= 1
+        if user[1] == 0 and self._users.get(user_key) is user:
+            del self._users[user_key]
+
+    def set_upstream_limit(self, upstream: str, limit: int) -> None:
+        self._upstream_limits[upstream] = limit
+
+    async def acquire_upstream(self, upstream: str) -> None:
+        """Take one of the upstream's concurrency slots, waiting at most queue_timeout"""
+        semaphore = self._upstreams.get(upstream)
+        if semaphore is None:
+            limit = self._upstream_limits.get(upstream, self.upstream_limit)
+            semaphore = self._upstreams[upstream] = asyncio.Semaphore(limit)
+        self.upstream_queued[upstream] += 1
+        try:
+            await asyncio.wait_for(semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise self._reject(f"upstream:{upstream}")
+        finally:
+            self.upstream_queued[upstream] -= 1
+        self.upstream_in_flight[upstream] += 1
+
+    def release_upstream(self, upstream: str) -> None:
+        self.upstream_in_flight[upstream] -= 1
+        self._upstreams[upstream].release()
+
+    @asynccontextmanager
+    async def upstream(self, upstream: str):
+        """Hold one of the upstream's concurrency slots for the duration of the block"""
+        await self.acquire_upstream(upstream)
+        try:
+            yield
+        finally:
+            self.release_upstream(upstream)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "shed": dict(self.shed),
+            "loop_lag_seconds": round(self.loop_lag, 4),
+            "users_active": len(self._users),
+            "upstreams": {
+                name: {
+                    "limit": self._upstream_limits.get(name, self.upstream_limit),
+                    "in_flight": self.upstream_in_flight[name],
+                    "queued": self.upstream_queued[name]
+                }
+                for name in self._upstreams
+            },
+            "limits": {
+                "max_in_flight": self.max_in_flight,
+                "max_per_user": self.max_per_user,
+                "max_queue": self.max_queue,
+                "queue_timeout": self.queue_timeout,
+                "max_loop_lag": self.max_loop_lag
+            }
+        }
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    """Response body that releases the upstream slot once it has been read or closed"""
+
+    def __init__(self, stream: httpx.AsyncByteStream, release):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            self._release()
+
+
+class LimitedTransport(httpx.AsyncBaseTransport):
+    """Transport holding an upstream slot from sending a request until its body is closed"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, admission: AdmissionController, upstream: str):
+        self._transport = transport
+        self._admission = admission
+        self._upstream = upstream
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await self._admission.acquire_upstream(self._upstream)
+        released = False
+
+        def release() -> None:
+            nonlocal released
+            if not released:
+                released = True
+                self._admission.release_upstream(self._upstream)
+
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            release()
+            raise
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_ReleasingStream(response.stream, release),
+            extensions=response.extensions
+        )
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
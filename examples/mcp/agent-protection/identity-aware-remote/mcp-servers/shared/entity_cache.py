@@ -0,0 +1,95 @@
+"""
+Identity entity cache shared by the MCP servers
+
+Vault identity entities (alice, bob) are resolved by name on every login just to confirm
+a record that rarely changes. Entries are kept in one LRU with a TTL, indexed both by
+entity name and by entity id (as returned by token lookup-self). Names Vault does not
+know are cached negatively for a shorter TTL.
+"""
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+# Returned by get() / get_by_id() when nothing usable is cached
+MISSING = object()
+
+
+def entity_record(data: dict) -> dict:
+    """The fields of an identity/entity read that the servers use"""
+    return {
+        "id": data.get("id"),
+        "name": data.get("name"),
+        "policies": data.get("policies") or [],
+        "aliases": [
+            {"name": alias.get("name"), "mount_accessor": alias.get("mount_accessor"),
+             "mount_type": alias.get("mount_type")}
+            for alias in data.get("aliases") or []
+        ]
+    }
+
+
+class EntityCache:
+    """LRU+TTL cache of entity records keyed by name and by id, with negative entries for names"""
+
+    def __init__(self, max_size: int = 1024, ttl: float = 300, negative_ttl: float = 30):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        # ("name", name) / ("id", entity_id) -> (expires_at, record or None)
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, Optional[dict]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, name: str):
+        """The cached record for a name, None if the name is known not to exist, else MISSING"""
+        return self._get(("name", name))
+
+    def get_by_id(self, entity_id: str):
+        """The cached record for an entity id, else MISSING"""
+        return self._get(("id", entity_id))
+
+    def put(self, name: str, record: Optional[dict]) -> None:
+        """Cache a record under its name and id; None records that the name does not exist"""
+        if self.max_size <= 0:
+            return
+        if record is None:
+            self._set(("name", name), None, self.negative_ttl)
+            return
+        self._set(("name", record.get("name") or name), record, self.ttl)
+        if record.get("name") and record["name"] != name:
+            self._set(("name", name), record, self.ttl)
+        if record.get("id"):
+            self._set(("id", record["id"]), record, self.ttl)
+
+    def invalidate(self, name: Optional[str] = None, entity_id: Optional[str] = None) -> None:
+        """Drop an entity (both of its keys) by name and/or id, e.g. after its policies changed"""
+        for key in [("name", name), ("id", entity_id)]:
+            if key[1] is None:
+                continue
+            entry = self._entries.pop(key, None)
+            if entry and entry[1]:
+                self._entries.pop(("name", entry[1].get("name")), None)
+                self._entries.pop(("id", entry[1].get("id")), None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    def _get(self, key: Tuple[str, str]):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return MISSING
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def _set(self, key: Tuple[str, str], record: Optional[dict], ttl: float) -> None:
+        self._entries[key] = (time.monotonic() + ttl, record)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
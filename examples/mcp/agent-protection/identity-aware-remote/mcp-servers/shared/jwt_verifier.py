@@ -0,0 +1,105 @@
+"""
+Local JWT verification shared by the MCP servers
+
+Checks signature, exp and aud (and iss when configured) against the Keycloak realm's
+JWKS, cached in process. The JWKS is refreshed when it is older than its TTL or when a
+token names an unknown key id (key rotation), at most once per min_refresh_interval.
+Bad tokens are rejected locally instead of costing a Vault auth/jwt/login round trip.
+"""
+import time
+import asyncio
+from typing import Callable, Dict, Iterable, List, Optional
+
+import httpx
+import jwt
+from jwt import InvalidTokenError, PyJWK
+
+
+class JWKSUnavailableError(Exception):
+    """The signing keys could not be fetched, so tokens cannot be verified"""
+
+
+class JWTVerifier:
+    """Verifies bearer JWTs against a cached JWKS"""
+
+    def __init__(self, jwks_url: str, audiences: Iterable[str], issuer: Optional[str] = None,
+                 algorithms: Iterable[str] = ("RS256",), leeway: int = 0,
+                 cache_ttl: int = 3600, min_refresh_interval: int = 30,
+                 client_factory: Optional[Callable[[], httpx.AsyncClient]] = None):
+        self.jwks_url = jwks_url
+        self.audiences: List[str] = list(audiences)
+        self.issuer = issuer or None
+        self.algorithms: List[str] = list(algorithms)
+        self.leeway = leeway
+        self.cache_ttl = cache_ttl
+        self.min_refresh_interval = min_refresh_interval
+        self._client_factory = client_factory
+        self._keys: Dict[str, PyJWK] = {}
+        self._fetched_at = 0.0
+        self._attempted_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def verify(self, token: str) -> dict:
+        """Return the token's claims, or raise InvalidTokenError / JWKSUnavailableError"""
+        header = jwt.get_unverified_header(token)
+        if header.get("alg") not in self.algorithms:
+            raise InvalidTokenError(f"Unsupported signing algorithm: {header.get('alg')}")
+        key = await self._get_key(header.get("kid"))
+        return jwt.decode(
+            token,
+            key.key,
+            algorithms=self.algorithms,
+            audience=self.audiences or None,
+            issuer=self.issuer,
+            leeway=self.leeway,
+            options={"require": ["exp"], "verify_aud": bool(self.audiences)}
+        )
+
+    async def _get_key(self, kid: Optional[str]) -> PyJWK:
+        if not self._keys or time.time() - self._fetched_at > self.cache_ttl:
+            await self._refresh()
+        key = self._keys.get(kid)
+        if key is None:
+            # Unknown kid: the realm may have rotated its keys
+            await self._refresh()
+            key = self._keys.get(kid)
+        if key is None:
+            raise InvalidTokenError(f"Unknown signing key: {kid}")
+        return key
+
+    async def _refresh(self) -> None:
+        fetched_at = self._fetched_at
+        async with self._lock:
+            if self._fetched_at != fetched_at:
+                # Another caller refreshed while we waited
+                return
+            # Rate limit fetches, e.g. against tokens with made-up key ids
+            if time.time() - self._attempted_at < self.min_refresh_interval:
+                if self._keys:
+                    return
+                raise JWKSUnavailableError(f"JWKS from {self.jwks_url} is unavailable")
+            self._attempted_at = time.time()
+            try:
+                if self._client_factory is not None:
+                    response = await self._client_factory().get(self.jwks_url)
+                else:
+                    async with httpx.AsyncClient(timeout=5.0) as client:
+                        response = await client.get(self.jwks_url)
+                response.raise_for_status()
+                jwks = response.json()
+            except (httpx.HTTPError, ValueError) as e:
+                if self._keys:
+                    # Keep verifying with the keys we have
+                    return
+                raise JWKSUnavailableError(f"Failed to fetch JWKS from {self.jwks_url}: {e}")
+
+            keys = {}
+            for jwk in jwks.get("keys", []):
+                if jwk.get("use", "sig") != "sig" or "kid" not in jwk:
+                    continue
+                try:
+                    keys[jwk["kid"]] = PyJWK(jwk)
+                except jwt.PyJWKError:
+                    continue
+            self._keys = keys
+            self._fetched_at = time.time()
@@ -0,0 +1,117 @@
+"""
+Prometheus metrics shared by the MCP servers
+
+Request, tool and per-phase latency histograms (Vault login, entity lookup, secret read,
+downstream API, database, serialization, ...). Cache hit/miss counts and admission
+counters and gauges are read from the components' stats() when /metrics is scraped.
+Each phase is also recorded as an OpenTelemetry span (see tracing.py).
+"""
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Tuple
+
+from opentelemetry import trace
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Phases range from sub-millisecond cache work to multi-second queries
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# stats() keys of the caches -> `result` label of mcp_cache_lookups_total
+CACHE_RESULTS = {"hits": "hit", "misses": "miss", "revalidations": "revalidated"}
+
+tracer = trace.get_tracer("mcp-servers")
+
+
+class _StatsCollector:
+    """Exposes components' stats() dicts, read at scrape time"""
+
+    def __init__(self):
+        self.sources: Dict[str, Callable[[], dict]] = {}
+
+    def collect(self) -> Iterable:
+        admission = self.sources.get("admission")
+        if admission is not None:
+            stats = admission()
+            yield GaugeMetricFamily("mcp_admission_in_flight", "Requests currently admitted", value=stats["in_flight"])
+            yield GaugeMetricFamily("mcp_admission_queued", "Requests waiting for admission", value=stats["queued"])
+            yield GaugeMetricFamily("mcp_event_loop_lag_seconds", "Last sampled event loop lag",
+                                    value=stats["loop_lag_seconds"])
+            yield CounterMetricFamily("mcp_admission_admitted", "Requests admitted", value=stats["admitted"])
+            shed = CounterMetricFamily("mcp_admission_shed", "Requests shed with 429", labels=["reason"])
+            for reason, count in stats["shed"].items():
+                shed.add_metric([reason], count)
+            yield shed
+            in_flight = GaugeMetricFamily("mcp_upstream_in_flight", "Requests in flight per upstream", labels=["upstream"])
+            queued = GaugeMetricFamily("mcp_upstream_queued", "Requests waiting for an upstream slot", labels=["upstream"])
+            for upstream, upstream_stats in stats["upstreams"].items():
+                in_flight.add_metric([upstream], upstream_stats["in_flight"])
+                queued.add_metric([upstream], upstream_stats["queued"])
+            yield in_flight
+            yield queued
+
+        lookups = CounterMetricFamily("mcp_cache_lookups", "Cache lookups by result", labels=["cache", "result"])
+        for name, source in self.sources.items():
+            if name == "admission":
+                continue
+            stats = source()
+            for key, result in CACHE_RESULTS.items():
+                if key in stats:
+                    lookups.add_metric([name, result], stats[key])
+        yield lookups
+
+
+class ServerMetrics:
+    """Prometheus metrics for one MCP server process"""
+
+    def __init__(self):
+        self.registry = CollectorRegistry()
+        self.requests = Counter(
+            "mcp_http_requests", "HTTP requests by route and status",
+            ["method", "route", "status"], registry=self.registry
+        )
+        self.request_latency = Histogram(
+            "mcp_http_request_duration_seconds", "HTTP request latency by route",
+            ["method", "route"], buckets=LATENCY_BUCKETS, registry=self.registry
+        )
+        self.tool_latency = Histogram(
+            "mcp_tool_call_duration_seconds", "tools/call latency by tool and outcome",
+            ["tool", "outcome"], buckets=LATENCY_BUCKETS, registry=self.registry
+        )
+        self.phase_latency = Histogram(
+            "mcp_phase_duration_seconds", "Latency of one phase of handling a request",
+            ["phase", "outcome"], buckets=LATENCY_BUCKETS, registry=self.registry
+        )
+        self._stats = _StatsCollector()
+        self.registry.register(self._stats)
+
+    def add_stats_source(self, name: str, stats: Callable[[], dict]) -> None:
+        """Export a component's stats() at scrape time: "admission", or a cache with hits/misses"""
+        self._stats.sources[name] = stats
+
+    def observe(self, phase: str, seconds: float, outcome: str = "ok") -> None:
+        self.phase_latency.labels(phase, outcome).observe(seconds)
+
+    @contextmanager
+    def phase(self, phase: str):
+        """Time a block (sync or containing awaits) as one phase and span; exceptions count as outcome="error" """
+        start = time.perf_counter()
+        outcome = "ok"
+        try:
+            with tracer.start_as_current_span(phase):
+                yield
+        except BaseException:
+            outcome = "error"
+            raise
+        finally:
+            self.observe(phase, time.perf_counter() - start, outcome)
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float) -> None:
+        self.requests.labels(method, route, str(status)).inc()
+        self.request_latency.labels(method, route).observe(seconds)
+
+    def observe_tool(self, tool: str, outcome: str, seconds: float) -> None:
+        self.tool_latency.labels(tool, outcome).observe(seconds)
+
+    def render(self) -> Tuple[bytes, str]:
+        """Exposition body and content type for /metrics"""
+        return generate_latest(self.registry), CONTENT_TYPE_LATEST
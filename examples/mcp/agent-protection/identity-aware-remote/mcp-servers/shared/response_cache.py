@@ -0,0 +1,99 @@
+"""
+Downstream response cache shared by the MCP servers
+
+Read-only tools (list_repos, get_issue, ...) are often repeated within one agent
+conversation. Their parsed GET responses are cached per user (per downstream credential)
+and path. Within the TTL a hit is served without a request. Once stale, an entry that
+carried an ETag is revalidated with If-None-Match, and a 304 refreshes it without
+re-transferring the body. Writes invalidate entries by path for every user.
+"""
+import time
+import hashlib
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import httpx
+
+
+def credential_key(*secrets: str) -> str:
+    """Cache partition for a downstream credential, without keeping the secret itself"""
+    return hashlib.sha256("\0".join(secrets).encode()).hexdigest()
+
+
+class ResponseCache:
+    """LRU of parsed GET responses keyed by (user key, path), with TTL and ETag revalidation"""
+
+    def __init__(self, ttl: float = 15, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # (user_key, path) -> {"data", "etag", "fresh_until"}
+        self._entries: "OrderedDict[Tuple[str, str], dict]" = OrderedDict()
+        self.hits = 0
+        self.revalidations = 0
+        self.misses = 0
+
+    async def fetch(self, user_key: str, path: str,
+                    send: Callable[[Dict[str, str]], Awaitable[httpx.Response]]) -> Any:
+        """Parsed JSON for a GET of path, from the cache or via send(extra_headers)
+
+        send is called with If-None-Match for a stale entry; other errors are raised as by
+        raise_for_status() and are not cached.
+        """
+        entry = self.get(user_key, path)
+        if entry is not None and self.is_fresh(entry):
+            self.hits += 1
+            return entry["data"]
+        response = await send({"If-None-Match": entry["etag"]} if entry is not None else {})
+        if response.status_code == 304 and entry is not None:
+            self.revalidations += 1
+            self.revalidated(entry)
+            return entry["data"]
+        response.raise_for_status()
+        self.misses += 1
+        data = response.json()
+        self.put(user_key, path, data, response.headers.get("ETag"))
+        return data
+
+    def get(self, user_key: str, path: str) -> Optional[dict]:
+        """The entry for a path, fresh or (if it has an ETag) stale; None on a miss"""
+        if self.max_entries <= 0:
+            return None
+        key = (user_key, path)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if not self.is_fresh(entry) and not entry["etag"]:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    @staticmethod
+    def is_fresh(entry: dict) -> bool:
+        return entry["fresh_until"] > time.monotonic()
+
+    def put(self, user_key: str, path: str, data: Any, etag: Optional[str]) -> None:
+        if self.max_entries <= 0:
+            return
+        key = (user_key, path)
+        self._entries[key] = {"data": data, "etag": etag, "fresh_until": time.monotonic() + self.ttl}
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def revalidated(self, entry: dict) -> None:
+        """Mark an entry fresh again after the downstream answered 304 Not Modified"""
+        entry["fresh_until"] = time.monotonic() + self.ttl
+
+    def invalidate(self, path: str) -> None:
+        """Drop, for every user, the entries for path and for paths below it (including query strings)"""
+        for key in [k for k in self._entries if k[1] == path or k[1].startswith((path + "/", path + "?"))]:
+            del self._entries[key]
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "revalidations": self.revalidations,
+            "misses": self.misses
+        }
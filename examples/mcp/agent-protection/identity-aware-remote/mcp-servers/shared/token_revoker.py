@@ -0,0 +1,117 @@
+"""
+Vault token revocation shared by the MCP servers
+
+Every auth/jwt/login creates a service token that would otherwise stay in Vault's token
+store (and expiration manager) until its TTL runs out. Tokens of sessions the server
+evicted or replaced are queued here and revoked in batches by a background task, through
+auth/token/revoke-self with bounded concurrency. A token is revoked no earlier than a grace
+period after it was queued, so requests still holding it can finish; whatever is left is
+revoked on shutdown. Batch tokens are not persisted by Vault and cannot be revoked, so
+they are skipped.
+"""
+import time
+import asyncio
+import logging
+from typing import Callable, Dict, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Batch token prefixes (Vault >= 1.10 and older releases)
+BATCH_TOKEN_PREFIXES = ("hvb.", "b.")
+
+
+def is_batch_token(token: str, token_type: Optional[str] = None) -> bool:
+    """Whether a token is a batch token, from the login's token_type or the token prefix"""
+    return token_type == "batch" or token.startswith(BATCH_TOKEN_PREFIXES)
+
+
+class TokenRevoker:
+    """Queue of Vault tokens to revoke, flushed in batches by a background task"""
+
+    def __init__(self, vault_addr: str, client_factory: Callable[[], httpx.AsyncClient],
+                 interval: float = 5.0, grace: float = 5.0, concurrency: int = 8, enabled: bool = True):
+        self.vault_addr = vault_addr
+        self._client_factory = client_factory
+        self.interval = interval
+        self.grace = grace
+        self.concurrency = concurrency
+        self.enabled = enabled
+        # token -> (revoke no earlier than, token expiry or None)
+        self._pending: Dict[str, Tuple[float, Optional[float]]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.revoked = 0
+        self.failed = 0
+
+    def schedule(self, token: Optional[str], expires_at: Optional[float] = None,
+                 token_type: Optional[str] = None) -> None:
+        """Queue a token for revocation; batch tokens and expired tokens are ignored"""
+        if not self.enabled or not token or is_batch_token(token, token_type):
+            return
+        now = time.time()
+        if expires_at is not None and expires_at <= now:
+            return
+        self._pending.setdefault(token, (now + self.grace, expires_at))
+
+    def start(self) -> None:
+        """Start the periodic flush (call from the app lifespan)"""
+        if self._task is None and self.enabled:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the periodic flush and revoke everything still queued"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush(force=True)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error revoking Vault tokens: {e}")
+
+    async def flush(self, force: bool = False) -> int:
+        """Revoke the queued tokens whose grace period has passed (all of them with force)"""
+        now = time.time()
+        due = [token for token, (not_before, _) in self._pending.items() if force or not_before <= now]
+        tokens = []
+        for token in due:
+            _, expires_at = self._pending.pop(token)
+            # Expired tokens are already gone from Vault
+            if expires_at is None or expires_at > now:
+                tokens.append(token)
+        if not tokens:
+            return 0
+
+        client = self._client_factory()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def revoke(token: str) -> None:
+            async with semaphore:
+                try:
+                    response = await client.post(
+                        f"{self.vault_addr}/v1/auth/token/revoke-self",
+                        headers={"X-Vault-Token": token}
+                    )
+                    # 403: the token was already revoked or has expired
+                    if response.status_code != 403:
+                        response.raise_for_status()
+                        self.revoked += 1
+                except Exception as e:
+                    self.failed += 1
+                    logger.warning(f"Failed to revoke Vault token: {e}")
+
+        await asyncio.gather(*(revoke(token) for token in tokens))
+        logger.info(f"Revoked {len(tokens)} Vault token(s)")
+        return len(tokens)
+
+    def stats(self) -> dict:
+        return {"pending": len(self._pending), "revoked": self.revoked, "failed": self.failed}
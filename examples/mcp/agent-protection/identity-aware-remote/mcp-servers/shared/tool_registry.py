@@ -0,0 +1,119 @@
+"""
+Tool registry shared by the MCP servers
+
+Indexes the tools registered with FastMCP (@mcp.tool()) by name so the /sse endpoint can
+dispatch tools/call without an if/elif ladder, and serializes the tools/list result once
+so it can be served (and revalidated with an ETag) without rebuilding it per request.
+Arguments are validated and coerced against each tool's signature with pydantic, as
+FastMCP does, before the tool function runs.
+"""
+import json
+import hashlib
+import inspect
+from typing import Any, Dict, List, Optional, get_type_hints
+
+from pydantic import BaseModel, ValidationError, create_model
+
+
+class InvalidParams(ValueError):
+    """Tool arguments do not match the tool's schema (JSON-RPC -32602)"""
+
+
+def normalize_schema(schema: dict) -> dict:
+    """Flatten Optional[X] properties (anyOf X/null) into plain X for simple form-based clients"""
+    schema = dict(schema)
+    properties = {}
+    for name, prop in schema.get("properties", {}).items():
+        variants = prop.get("anyOf")
+        if variants and len(variants) == 2 and {"type": "null"} in variants:
+            flattened = {k: v for k, v in prop.items() if k != "anyOf"}
+            flattened.update(next(v for v in variants if v != {"type": "null"}))
+            prop = flattened
+        properties[name] = prop
+    schema["properties"] = properties
+    return schema
+
+
+async def _list_fastmcp_tools(mcp) -> list:
+    """Registered tools across FastMCP versions (get_tools() in 2.x, list_tools() later)"""
+    if hasattr(mcp, "get_tools"):
+        return list((await mcp.get_tools()).values())
+    return list(await mcp.list_tools())
+
+
+def _arguments_model(name: str, fn) -> type:
+    """Pydantic model of a tool function's parameters; unknown arguments are ignored"""
+    hints = get_type_hints(fn, include_extras=True)
+    fields = {}
+    for param in inspect.signature(fn).parameters.values():
+        annotation = hints.get(param.name, Any)
+        default = ... if param.default is inspect.Parameter.empty else param.default
+        fields[param.name] = (annotation, default)
+    return create_model(f"{name}_arguments", **fields)
+
+
+def _format_errors(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in e['loc']) or 'arguments'}: {e['msg']}" for e in error.errors()
+    )
+
+
+class ToolRegistry:
+    """FastMCP tool registrations indexed by name, with a pre-serialized tools/list result"""
+
+    def __init__(self):
+        self._tools: Dict[str, dict] = {}
+        self.tools: List[dict] = []
+        self.result_json = '{"tools":[]}'
+        self.etag: Optional[str] = None
+
+    async def load(self, mcp) -> None:
+        """Build the registry from the FastMCP server; call once at startup"""
+        self._tools = {}
+        self.tools = []
+        for tool in await _list_fastmcp_tools(mcp):
+            schema = normalize_schema(tool.parameters)
+            self._tools[tool.name] = {
+                "fn": tool.fn,
+                "model": _arguments_model(tool.name, tool.fn)
+            }
+            self.tools.append({
+                "name": tool.name,
+                "description": tool.description or "",
+                "inputSchema": schema
+            })
+        self.result_json = json.dumps({"tools": self.tools}, separators=(",", ":"))
+        # Weak: the representation may be compressed differently per client
+        self.etag = 'W/"' + hashlib.sha256(self.result_json.encode()).hexdigest()[:32] + '"'
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._tools
+
+    def names(self) -> List[str]:
+        return list(self._tools)
+
+    def validate(self, name: str, arguments: Optional[dict]) -> Dict[str, Any]:
+        """Validated and coerced keyword arguments for a tool; raises InvalidParams"""
+        if arguments is not None and not isinstance(arguments, dict):
+            raise InvalidParams(f"Invalid arguments for {name}: expected an object")
+        model = self._tools[name]["model"]
+        try:
+            values: BaseModel = model.model_validate(arguments or {})
+        except ValidationError as e:
+            raise InvalidParams(f"Invalid arguments for {name}: {_format_errors(e)}")
+        return {field: getattr(values, field) for field in model.model_fields}
+
+    async def call(self, name: str, arguments: Optional[dict]) -> Any:
+        """Call a tool by name; unknown arguments are ignored, invalid or missing ones raise InvalidParams"""
+        return await self._tools[name]["fn"](**self.validate(name, arguments))
+
+    def list_response_body(self, request_id) -> bytes:
+        """Full JSON-RPC tools/list response, spliced around the pre-serialized result"""
+        return f'{{"jsonrpc":"2.0","id":{json.dumps(request_id)},"result":{self.result_json}}}'.encode()
+
+    def etag_matches(self, if_none_match: Optional[str]) -> bool:
+        if not if_none_match or self.etag is None:
+            return False
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        # Weak comparison, as for GET revalidation
+        return "*" in tags or any(tag.removeprefix("W/") == self.etag.removeprefix("W/") for tag in tags)
@@ -0,0 +1,107 @@
+"""
+Distributed tracing shared by the MCP servers
+
+Requests carrying a W3C trace context (traceparent / tracestate, as sent by the Streamlit
+client) continue that trace; the server span, the per-phase spans opened by
+ServerMetrics.phase() and the database spans become its children. The context is injected
+into outgoing Vault, Keycloak and downstream API requests.
+
+Spans are exported over OTLP/HTTP when an OTLP endpoint is configured, otherwise written one
+JSON object per line to TRACING_FILE; with neither, tracing is off. TRACING_EXPORTER forces a
+choice ("otlp", "file", "console" or "none"); sampling follows the standard
+OTEL_TRACES_SAMPLER settings.
+"""
+import os
+import sys
+import logging
+from contextlib import contextmanager
+from typing import Optional
+
+import httpx
+from opentelemetry import propagate, trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import ReadableSpan, TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter, SpanExporter
+from opentelemetry.trace import SpanKind, Status, StatusCode
+
+logger = logging.getLogger(__name__)
+
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "")
+TRACING_FILE = os.getenv("TRACING_FILE", "")
+
+tracer = trace.get_tracer("mcp-servers")
+
+
+def _json_line(span: ReadableSpan) -> str:
+    return span.to_json(indent=None) + os.linesep
+
+
+def create_exporter(exporter: str = TRACING_EXPORTER, file_path: str = TRACING_FILE) -> Optional[SpanExporter]:
+    """Span exporter for the configured backend; None when tracing is disabled
+
+    Without an explicit choice, OTLP is used when OTEL_EXPORTER_OTLP_(TRACES_)ENDPOINT is set,
+    then TRACING_FILE; otherwise spans are not exported. The console is only used on request.
+    """
+    if not exporter:
+        if os.getenv("OTEL_EXPORTER_OTLP_TRACES_ENDPOINT") or os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"):
+            exporter = "otlp"
+        elif file_path:
+            exporter = "file"
+    if exporter == "otlp":
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        except ImportError:
+            logger.warning("OTLP exporter requested but opentelemetry-exporter-otlp-proto-http is not installed")
+            return None
+        # Endpoint, headers and timeout come from the standard OTEL_EXPORTER_OTLP_* variables
+        return OTLPSpanExporter()
+    if exporter == "file" and file_path:
+        return ConsoleSpanExporter(out=open(file_path, "a", buffering=1), formatter=_json_line)
+    if exporter == "console":
+        return ConsoleSpanExporter(out=sys.stdout, formatter=_json_line)
+    return None
+
+
+def setup_tracing(service_name: str) -> Optional[TracerProvider]:
+    """Install the global tracer provider for this process; returns it for shutdown()"""
+    exporter = create_exporter()
+    if exporter is None:
+        return None
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": os.getenv("OTEL_SERVICE_NAME", service_name)})
+    )
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    return provider
+
+
+@contextmanager
+def server_span(method: str, route: str, headers):
+    """SERVER span for an incoming request, continuing the caller's trace context if it sent one
+
+    When the ASGI stack already opened a span for the request (instrumented frameworks),
+    the span is nested under it instead.
+    """
+    if trace.get_current_span().get_span_context().is_valid:
+        context, kind = None, SpanKind.INTERNAL
+    else:
+        context, kind = propagate.extract(headers), SpanKind.SERVER
+    with tracer.start_as_current_span(
+        f"{method} {route}",
+        context=context,
+        kind=kind,
+        attributes={"http.request.method": method, "http.route": route}
+    ) as span:
+        yield span
+
+
+def set_status_code(span: trace.Span, status_code: int) -> None:
+    """Record an HTTP status on a span; 5xx marks it as an error"""
+    span.set_attribute("http.response.status_code", status_code)
+    if status_code >= 500:
+        span.set_status(Status(StatusCode.ERROR))
+
+
+async def inject_trace_headers(request: httpx.Request) -> None:
+    """httpx request hook: propagate the current trace context to the upstream"""
+    propagate.inject(request.headers)
@@ -2,10 +2,11 @@
 Mock Jira API Server
 Simulates Jira API endpoints for demo purposes
 """
-from fastapi import FastAPI, HTTPException, Header
+from fastapi import FastAPI, HTTPException, Header, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Optional, List
+import hashlib
 import os
 
 app = FastAPI(title="Mock Jira API")
@@ -19,6 +20,23 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.middleware("http")
+async def etag_middleware(request: Request, call_next):
+    """Tag GET responses with an ETag and answer a matching If-None-Match with 304"""
+    response = await call_next(request)
+    if request.method != "GET" or response.status_code != 200:
+        return response
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+    if_none_match = request.headers.get("If-None-Match", "")
+    if etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers={"ETag": etag})
+    headers = {k: v for k, v in response.headers.items() if k.lower() != "content-length"}
+    headers["ETag"] = etag
+    return Response(content=body, status_code=200, headers=headers, media_type=response.media_type)
+
+
 # In-memory storage
 issues_db = {
     "PROJ-1": {
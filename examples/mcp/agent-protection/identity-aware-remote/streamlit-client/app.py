@@ -11,6 +11,8 @@ from typing import Optional, Dict, Any
 
 # Import authentication trace module for debugging
 from auth_trace import display_auth_trace, get_vault_info_direct, decode_jwt_payload
+# OpenTelemetry client spans for MCP calls
+from tracing import mcp_call_span, mark_error
 
 logger = logging.getLogger(__name__)
 
@@ -135,7 +137,20 @@ def get_keycloak_token(username: str, password: str) -> Optional[Dict]:
 
 
 def call_mcp_server(mcp_url: str, method: str, params: Dict, access_token: str) -> Dict:
-    """Call MCP server via JSON (changed from SSE to avoid timeout issues)"""
+    """Call MCP server via JSON (changed from SSE to avoid timeout issues)
+    
+    Runs in a client span whose trace context is propagated to the server (traceparent).
+    """
+    with mcp_call_span(mcp_url, method, params) as (span, trace_headers):
+        result = _post_mcp_request(mcp_url, method, params, access_token, trace_headers)
+        if isinstance(result.get("error"), dict):
+            mark_error(span, str(result["error"].get("message", "")))
+        return result
+
+
+def _post_mcp_request(mcp_url: str, method: str, params: Dict, access_token: str,
+                      trace_headers: Dict[str, str]) -> Dict:
+    """POST one JSON-RPC request to the MCP server's /sse endpoint"""
     try:
         with httpx.Client(timeout=15.0) as client:
             # Use regular POST request instead of SSE streaming
@@ -148,6 +163,7 @@ def call_mcp_server(mcp_url: str, method: str, params: Dict, access_token: str)
                     "params": params
                 },
                 headers={
+                    **trace_headers,
                     "Authorization": f"Bearer {access_token}",
                     "Content-Type": "application/json"
                 },
@@ -697,7 +713,15 @@ def main():
                                                 key=f"{mcp}_{tool_name}_{prop_name}_bool",
                                                 help=prop_desc
                                             )
-                                    
+                                        elif prop_type == 'array':
+                                            # Comma-separated input, sent as a list
+                                            value = st.text_input(
+                                                f"{prop_name}*" if prop_name in required else prop_name,
+                                                key=f"{mcp}_{tool_name}_{prop_name}_array",
+                                                help=f"{prop_desc} (comma-separated)"
+                                            )
+                                            form_inputs[prop_name] = [v.strip() for v in value.split(",") if v.strip()]
+
                                     # Before button click, save current expander state
                                     # Since we're inside the expander, it's currently open
                                     # So we should keep it open after button click
@@ -62,6 +62,7 @@ def get_vault_info_direct(jwt_token: str, mcp_name: Optional[str] = None) -> Dic
         "secret_error": None,
         "entity_name": None
     }
+    vault_token = None
     
     try:
         with httpx.Client(timeout=10.0) as client:
@@ -225,10 +226,29 @@ def get_vault_info_direct(jwt_token: str, mcp_name: Optional[str] = None) -> Dic
     except Exception as e:
         result["secret_error"] = f"Error accessing Vault: {str(e)}"
         logger.error(f"Error getting Vault info directly: {e}")
+    finally:
+        # The login above is only for this trace; don't leave its token (and leases) in Vault
+        if vault_token:
+            revoke_vault_token(vault_token)
     
     return result
 
 
+def revoke_vault_token(vault_token: str) -> None:
+    """Revoke a Vault token and its leases (best effort); batch tokens cannot be revoked and are skipped"""
+    if vault_token.startswith(("hvb.", "b.")):
+        return
+    try:
+        with httpx.Client(timeout=5.0) as client:
+            response = client.post(
+                f"{VAULT_ADDR}/v1/auth/token/revoke-self",
+                headers={"X-Vault-Token": vault_token}
+            )
+            response.raise_for_status()
+    except Exception as e:
+        logger.warning(f"Failed to revoke Vault token: {e}")
+
+
 def display_auth_trace(vault_info: Optional[Dict], mcp_info: Dict, username: str, jwt_token: str, completed_steps: list, current_step: int):
     """Display authentication flow trace using directly retrieved Vault information"""
     st.header("Authentication Flow Trace (Debug Info)")
@@ -0,0 +1,85 @@
+"""
+Tracing Module
+OpenTelemetry tracing for MCP calls: each call_mcp_server runs in a client span whose
+W3C trace context (traceparent) is sent to the MCP server, so the server's auth, Vault,
+downstream API and database spans join the same trace.
+
+Spans are exported over OTLP/HTTP when OTEL_EXPORTER_OTLP_ENDPOINT (or
+OTEL_EXPORTER_OTLP_TRACES_ENDPOINT) is set, otherwise written as JSON lines to TRACING_FILE;
+with neither, tracing is off. TRACING_EXPORTER forces "otlp", "file", "console" or "none".
+"""
+import os
+import sys
+import logging
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from opentelemetry import propagate, trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter, SpanExporter
+from opentelemetry.trace import SpanKind, Status, StatusCode
+
+logger = logging.getLogger(__name__)
+
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "")
+TRACING_FILE = os.getenv("TRACING_FILE", "")
+SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "streamlit-client")
+
+
+def _json_line(span) -> str:
+    return span.to_json(indent=None) + os.linesep
+
+
+# Same selection as mcp-servers/shared/tracing.py (this image is built without the shared modules)
+def create_exporter(exporter: str = TRACING_EXPORTER, file_path: str = TRACING_FILE) -> Optional[SpanExporter]:
+    """Span exporter for the configured backend; None when tracing is disabled
+
+    Without an explicit choice, OTLP is used when OTEL_EXPORTER_OTLP_(TRACES_)ENDPOINT is set,
+    then TRACING_FILE; otherwise spans are not exported. The console is only used on request.
+    """
+    if not exporter:
+        if os.getenv("OTEL_EXPORTER_OTLP_TRACES_ENDPOINT") or os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"):
+            exporter = "otlp"
+        elif file_path:
+            exporter = "file"
+    if exporter == "otlp":
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        except ImportError:
+            logger.warning("OTLP exporter requested but opentelemetry-exporter-otlp-proto-http is not installed")
+            return None
+        # Endpoint, headers and timeout come from the standard OTEL_EXPORTER_OTLP_* variables
+        return OTLPSpanExporter()
+    if exporter == "file" and file_path:
+        return ConsoleSpanExporter(out=open(file_path, "a", buffering=1), formatter=_json_line)
+    if exporter == "console":
+        return ConsoleSpanExporter(out=sys.stdout, formatter=_json_line)
+    return None
+
+
+# Streamlit re-runs app.py on every interaction, but this module is imported once per process
+_exporter = create_exporter()
+if _exporter is not None:
+    _provider = TracerProvider(resource=Resource.create({"service.name": SERVICE_NAME}))
+    _provider.add_span_processor(BatchSpanProcessor(_exporter))
+    trace.set_tracer_provider(_provider)
+
+tracer = trace.get_tracer("streamlit-client")
+
+
+@contextmanager
+def mcp_call_span(mcp_url: str, method: str, params: Dict):
+    """Client span for one MCP request; yields (span, headers carrying its trace context)"""
+    attributes = {"server.address": mcp_url, "rpc.method": method}
+    if method == "tools/call" and params.get("name"):
+        attributes["mcp.tool.name"] = params["name"]
+    with tracer.start_as_current_span(f"mcp {method}", kind=SpanKind.CLIENT, attributes=attributes) as span:
+        headers: Dict[str, str] = {}
+        propagate.inject(headers)
+        yield span, headers
+
+
+def mark_error(span: trace.Span, message: str) -> None:
+    """Flag a span as failed with a short description"""
+    span.set_status(Status(StatusCode.ERROR, message[:200]))